@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Food, FoodUnit, PantryItem, Meal, MealConsumption, Ingredient, Recipe
+from .models import Food, FoodUnit, PantryItem, Meal, MealConsumption, Ingredient, Recipe, DailyNutrientTotals
 # Register your models here.
 
 admin.site.register(Food)
@@ -9,4 +9,5 @@ admin.site.register(PantryItem)
 admin.site.register(Meal)
 admin.site.register(MealConsumption)
 admin.site.register(Ingredient)
-admin.site.register(Recipe)
\ No newline at end of file
+admin.site.register(Recipe)
+admin.site.register(DailyNutrientTotals)
\ No newline at end of file
@@ -0,0 +1,149 @@
+'''
+ Composite foods : a Food with Ingredient rows stores per-100g nutrients
+ computed from its ingredients. The Ingredient rows are the edges of a DAG
+ (food.is_ingredient_of : its edges upward, food.contained_in : the
+ composites using it).
+
+ refresh(food_ids)     foods whose nutrients changed -> recompute every
+                       composite that contains them, directly or not
+ recompute(food_ids)   these composites (ingredients added / changed) and
+                       everything that contains them
+
+ Both walk the edges upward one level per query, load every edge of the
+ affected composites and the packed per-100g vectors of every food they use
+ (two queries), then compute the composites in topological order (Kahn), each
+ level as one grouped numpy pass, and write them with one bulk_update.
+ Their "as prepared" units follow (or are created with) the total weight.
+ An edge that would close a cycle raises CompositeCycleError (check_edge()
+ before saving an Ingredient, recompute() on existing data).
+'''
+import numpy as np
+
+from . import nutrients
+from .models import Food, FoodUnit, Ingredient
+
+PREPARED_UNIT = 'as prepared'
+
+
+class CompositeCycleError(Exception):
+    ''' a food would (transitively) contain itself '''
+
+    def __init__(self, food_ids):
+        self.food_ids = sorted(food_ids)
+        super().__init__(f'ingredient cycle between foods {self.food_ids}')
+
+
+# --- Graph ---
+
+def containers(food_ids):
+    ''' every composite containing one of `food_ids`, directly or not '''
+    found, frontier = set(), set(food_ids)
+    while frontier:
+        parents = set(Ingredient.objects.filter(ingredient_id__in=frontier)
+                      .values_list('complex_food_id', flat=True))
+        frontier = parents - found
+        found |= parents
+    return found
+
+
+def check_edge(complex_food_id, ingredient_id):
+    ''' raise CompositeCycleError if complex_food may not use ingredient '''
+    if complex_food_id == ingredient_id or ingredient_id in containers([complex_food_id]):
+        raise CompositeCycleError({complex_food_id, ingredient_id})
+
+
+def _levels(composites, edges):
+    ''' composites grouped in topological levels : each needs only earlier levels '''
+    waiting = {food_id: set() for food_id in composites}
+    for complex_food_id, ingredient_id, _ in edges:
+        if ingredient_id in waiting:
+            waiting[complex_food_id].add(ingredient_id)
+    levels = []
+    while waiting:
+        ready = [food_id for food_id, needs in waiting.items() if not needs]
+        if not ready:
+            raise CompositeCycleError(waiting)
+        levels.append(ready)
+        for food_id in ready:
+            del waiting[food_id]
+        for needs in waiting.values():
+            needs.difference_update(ready)
+    return levels
+
+
+# --- Recompute ---
+
+def _round_integer_fields(values):
+    ''' per-100g vector -> field values, integer columns rounded '''
+    return {
+        field: round(value) if Food._meta.get_field(field).get_internal_type() == 'IntegerField'
+        else value
+        for field, value in zip(nutrients.NUTRIENT_FIELDS, values.tolist())
+    }
+
+
+def recompute(food_ids):
+    ''' recompute `food_ids` and every composite containing them; returns the updated ids '''
+    composites = set(food_ids) | containers(food_ids)
+    edges = [
+        (complex_food_id, ingredient_id, (amount or 0) * float(gram_weight or 0))
+        for complex_food_id, ingredient_id, amount, gram_weight in
+        Ingredient.objects.filter(complex_food_id__in=composites)
+        .values_list('complex_food_id', 'ingredient_id', 'amount', 'unit__gram_weight')
+    ]
+    composites = {complex_food_id for complex_food_id, _, _ in edges}
+    if not composites:
+        return []
+    levels = _levels(composites, edges)
+
+    ids, per_100g = (Food.objects.filter(pk__in={i for _, i, _ in edges} | composites)
+                     .nutrient_matrix())
+    row_of = {pk: i for i, pk in enumerate(ids.tolist())}
+
+    grams = {}
+    for level in levels:
+        members = set(level)
+        level_edges = [edge for edge in edges if edge[0] in members]
+        targets = np.array([row_of[c] for c, _, _ in level_edges])
+        weights = np.array([g for _, _, g in level_edges])
+        sources = per_100g[[row_of[i] for _, i, _ in level_edges]]
+        totals = np.zeros_like(per_100g)
+        np.add.at(totals, targets, sources * (weights / 100)[:, None])
+        mass = np.bincount(targets, weights=weights, minlength=len(per_100g))
+        rows = np.array([row_of[c] for c in level])
+        # normalized to 100g; a composite weighing nothing gets zeros
+        with np.errstate(invalid='ignore', divide='ignore'):
+            per_100g[rows] = np.where(mass[rows, None] > 0,
+                                      totals[rows] / mass[rows, None] * 100, 0)
+        grams.update(zip(level, mass[rows].tolist()))
+
+    foods = [Food(pk=c, **_round_integer_fields(per_100g[row_of[c]])) for c in composites]
+    for food in foods:
+        food.nutrient_vector = nutrients.pack(food)
+    Food.objects.bulk_update(foods, [*nutrients.NUTRIENT_FIELDS, 'nutrient_vector'])
+    _sync_prepared_units(grams)
+    return sorted(composites)
+
+
+def refresh(food_ids):
+    ''' nutrients of `food_ids` changed : recompute the composites using them '''
+    parents = set(Ingredient.objects.filter(ingredient_id__in=food_ids)
+                  .values_list('complex_food_id', flat=True))
+    return recompute(parents) if parents else []
+
+
+def _sync_prepared_units(grams):
+    ''' "as prepared" unit of each composite = its total ingredient weight '''
+    units = {unit.food_id: unit for unit in
+             FoodUnit.objects.filter(food_id__in=grams, name=PREPARED_UNIT, creator__isnull=True)}
+    changed, missing = [], []
+    for food_id, weight in grams.items():
+        weight = round(weight, 2)
+        unit = units.get(food_id)
+        if unit is None:
+            missing.append(FoodUnit(food_id=food_id, name=PREPARED_UNIT, gram_weight=weight))
+        elif float(unit.gram_weight) != weight:
+            unit.gram_weight = weight
+            changed.append(unit)
+    FoodUnit.objects.bulk_update(changed, ['gram_weight'])
+    FoodUnit.objects.bulk_create(missing)
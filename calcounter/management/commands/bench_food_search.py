@@ -0,0 +1,85 @@
+"""
+Django management command to benchmark calcounter.search against a synthetic
+USDA-sized catalog. Foods are inserted inside a transaction that is rolled
+back at the end, so the database is left untouched.
+
+    python manage.py bench_food_search --foods 500000 --queries 500
+"""
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from calcounter import search
+from calcounter.models import Food
+
+FOODS = ['Chicken', 'Beef', 'Pork', 'Turkey', 'Salmon', 'Tuna', 'Rice', 'Bread',
+         'Milk', 'Cheese', 'Egg', 'Potato', 'Apple', 'Banana', 'Oats', 'Yogurt',
+         'Beans', 'Lentils', 'Spinach', 'Broccoli', 'Pasta', 'Tofu', 'Almonds', 'Butter']
+PARTS = ['breast', 'thigh', 'ground', 'whole', 'fillet', 'white', 'brown', 'skim',
+         'cheddar', 'large', 'russet', 'rolled', 'greek', 'black', 'baby', 'raw']
+PREPS = ['raw', 'cooked', 'roasted', 'boiled', 'fried', 'canned', 'frozen', 'dried',
+         'grilled', 'baked', 'steamed', 'with salt', 'without skin', 'low fat']
+BRANDS = ['Acme', 'Harvest', 'Golden', 'Prairie', 'Northern', 'Sunrise', 'Valley']
+
+
+def synthetic_name(rng):
+    ''' "Chicken, breast, roasted" style USDA names, some branded '''
+    name = f"{rng.choice(FOODS)}, {rng.choice(PARTS)}, {rng.choice(PREPS)}"
+    if rng.random() < 0.6:
+        name = f"{rng.choice(BRANDS)} {name} {rng.randint(1, 9999)}"
+    return name
+
+
+def typed_query(rng):
+    ''' what a user has typed so far : 1-2 words, the last one partial '''
+    words = [rng.choice(FOODS).lower()]
+    if rng.random() < 0.5:
+        words.append(rng.choice(PARTS))
+    words[-1] = words[-1][:rng.randint(2, len(words[-1]))]
+    return ' '.join(words)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark food search latency (p50/p95) on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--foods', type=int, default=500_000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--budget-ms', type=float, default=20.0,
+                            help='fail if p95 exceeds this many milliseconds')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            start = time.perf_counter()
+            batch = []
+            for _ in range(options['foods']):
+                batch.append(Food(name=synthetic_name(rng), calories=100, protein=10))
+                if len(batch) == 5000:
+                    Food.objects.bulk_create(batch)
+                    batch.clear()
+            Food.objects.bulk_create(batch)
+            self.stdout.write(
+                f"Inserted {options['foods']} foods in {time.perf_counter() - start:.1f}s"
+            )
+
+            queries = [typed_query(rng) for _ in range(options['queries'])]
+            search.search_ids(queries[0])  # warm up
+            timings = []
+            for q in queries:
+                t0 = time.perf_counter()
+                search.search_ids(q, limit=20)
+                timings.append((time.perf_counter() - t0) * 1000)
+            transaction.set_rollback(True)
+
+        p50, p95 = np.percentile(timings, [50, 95])
+        self.stdout.write(
+            f"{len(timings)} queries : p50 {p50:.2f} ms, p95 {p95:.2f} ms, max {max(timings):.2f} ms"
+        )
+        if p95 > options['budget_ms']:
+            raise CommandError(f"p95 {p95:.2f} ms is over the {options['budget_ms']} ms budget")
+        self.stdout.write(self.style.SUCCESS('Within budget'))
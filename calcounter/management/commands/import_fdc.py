@@ -0,0 +1,282 @@
+"""
+Django management command to mirror USDA FoodData Central downloads locally.
+
+Accepts the official bulk downloads (https://fdc.nal.usda.gov/download-datasets):
+    - JSON : FoodData_Central_foundation_food_json_*.json, sr_legacy, branded
+    - CSV  : the unzipped CSV folder (food.csv, nutrient.csv, food_nutrient.csv,
+             food_portion.csv, branded_food.csv)
+
+Single foods can be fetched from the API instead (--fdc-id, repeatable) : the
+ids go through calcounter.usda.get_foods, cached and batched BATCH_SIZE per
+request.
+
+Files are streamed (never loaded whole) and every food goes through the same
+parse_usda_nutrients() used for API lookups, then lands in Food / FoodUnit
+with chunked bulk_create, flagged fdc_mirror : calcounter's ingredient search
+switches to the local mirror once any food is. Foods whose fdc_id already
+exists are skipped, but flagged (and given their data type) as well.
+"""
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from calcounter import nutrients, usda
+from calcounter.models import Food, FoodUnit
+from calcounter.search import food_index
+from calcounter.utils import (
+    NUTRIENT_MAP,
+    FDC_DATA_TYPES,
+    parse_usda_nutrients,
+    usda_food_fields,
+)
+
+CHUNK_SIZE = 1000
+READ_SIZE = 1 << 20
+
+
+# --- JSON : stream one food object at a time ---
+
+def iter_json_foods(path, read_size=READ_SIZE):
+    '''
+    yields each food dict of {"FoundationFoods": [ {...}, {...} ]} without
+    loading the file : raw_decode objects out of a sliding text buffer
+    '''
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as fh:
+        buf = ''
+        # skip to the opening '[' of the food list
+        while '[' not in buf:
+            chunk = fh.read(read_size)
+            if not chunk:
+                return
+            buf += chunk
+        buf = buf[buf.index('[') + 1:]
+        pos = 0
+        eof = False
+        while True:
+            # skip separators between objects
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = fh.read(read_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield obj
+            pos = end
+            if pos > read_size:  # drop consumed text
+                buf = buf[pos:]
+                pos = 0
+
+
+# --- CSV : join the normalized tables into API-shaped food dicts ---
+
+def _rows(folder, name):
+    path = folder / name
+    if not path.exists():
+        return
+    with open(path, newline='', encoding='utf-8') as fh:
+        yield from csv.DictReader(fh)
+
+
+def _float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def iter_csv_foods(folder, data_types=None):
+    '''
+    yields API-shaped food dicts from an FDC CSV download folder
+    food_nutrient.csv (the big one) is streamed into a float32 matrix holding
+    only the NUTRIENT_MAP columns, so memory is foods x ~20 floats
+    '''
+    folder = Path(folder)
+
+    # nutrient.csv : internal id -> (number, name, unit) for the nutrients we keep
+    wanted = set(NUTRIENT_MAP.values())
+    nutrient_info = {}
+    for row in _rows(folder, 'nutrient.csv'):
+        number = (row.get('nutrient_nbr') or '').split('.')[0]
+        if number in wanted:
+            nutrient_info[row['id']] = (number, row['name'], row['unit_name'])
+    numbers = sorted({number for number, _, _ in nutrient_info.values()})
+    column = {number: i for i, number in enumerate(numbers)}
+    meta = {number: (name, unit) for number, name, unit in nutrient_info.values()}
+
+    # food.csv : the foods to import
+    foods = []
+    for row in _rows(folder, 'food.csv'):
+        data_type = FDC_DATA_TYPES.get(row['data_type'])
+        if data_type is None or (data_types and data_type not in data_types):
+            continue
+        foods.append((row['fdc_id'], row['description'], data_type))
+    index = {fdc_id: i for i, (fdc_id, _, _) in enumerate(foods)}
+
+    branded = {}
+    for row in _rows(folder, 'branded_food.csv'):
+        if row['fdc_id'] in index:
+            branded[row['fdc_id']] = (
+                row.get('brand_name') or row.get('brand_owner') or '',
+                _float(row.get('serving_size')),
+            )
+
+    portions = {}
+    for row in _rows(folder, 'food_portion.csv'):
+        if row['fdc_id'] in index:
+            portions.setdefault(row['fdc_id'], []).append({
+                "gramWeight": _float(row.get('gram_weight')),
+                "amount": _float(row.get('amount'), 1),
+                "modifier": row.get('modifier') or row.get('portion_description') or '',
+            })
+
+    amounts = np.full((len(foods), len(numbers)), np.nan, dtype=np.float32)
+    for row in _rows(folder, 'food_nutrient.csv'):
+        info = nutrient_info.get(row['nutrient_id'])
+        i = index.get(row['fdc_id'])
+        if info is None or i is None:
+            continue
+        amounts[i, column[info[0]]] = _float(row['amount'])
+
+    for i, (fdc_id, description, data_type) in enumerate(foods):
+        brand, serving_size = branded.get(fdc_id, ('', 0))
+        present = ~np.isnan(amounts[i])
+        yield {
+            "fdcId": fdc_id,
+            "description": description,
+            "dataType": data_type,
+            "brandName": brand,
+            "servingSize": serving_size,
+            "foodPortions": portions.get(fdc_id, []),
+            "foodNutrients": [
+                {"nutrient": {"number": numbers[j],
+                              "name": meta[numbers[j]][0],
+                              "unitName": meta[numbers[j]][1]},
+                 "amount": float(amounts[i, j])}
+                for j in np.flatnonzero(present)
+            ],
+        }
+
+
+# --- Loading ---
+
+def food_rows(item):
+    ''' (unsaved Food, [(unit name, gram weight)]) for one API-shaped food dict '''
+    all_nutrients, servings = parse_usda_nutrients(item)
+    food = Food(
+        name=(item.get("description") or "")[:255],
+        fdc_id=str(item.get("fdcId")),
+        data_type=FDC_DATA_TYPES.get(item.get("dataType"), ""),
+        brand=(item.get("brandName") or item.get("brandOwner") or "")[:255],
+        fdc_mirror=True,
+        **usda_food_fields(all_nutrients)
+    )
+    food.nutrient_vector = nutrients.pack(food)    # bulk_create skips Food.save
+    units = [("grams", 1)]
+    for serving in servings:
+        name = serving["modifier"][:50]
+        if name not in dict(units):
+            units.append((name, round(serving["gram_weight"], 2)))
+    return food, units
+
+
+def load_foods(items, chunk_size=CHUNK_SIZE):
+    ''' bulk_create Food + FoodUnit rows for new fdc_ids; returns (created, skipped) '''
+    existing = set(Food.objects.filter(fdc_id__isnull=False).values_list('fdc_id', flat=True))
+    created = skipped = 0
+    chunk = []
+    present = {}    # data type -> fdc_ids already in Food (API picks, earlier runs)
+
+    def flush():
+        with transaction.atomic():
+            foods = Food.objects.bulk_create([food for food, _ in chunk])
+            FoodUnit.objects.bulk_create([
+                FoodUnit(food=food, name=name, gram_weight=grams, is_standard=True)
+                for food, (_, units) in zip(foods, chunk)
+                for name, grams in units
+            ])
+            for data_type, fdc_ids in present.items():
+                Food.objects.filter(fdc_id__in=fdc_ids, owner__isnull=True).update(
+                    fdc_mirror=True, data_type=data_type)
+        chunk.clear()
+        present.clear()
+
+    for item in items:
+        fdc_id = str(item.get("fdcId"))
+        if fdc_id in existing:
+            skipped += 1
+            present.setdefault(FDC_DATA_TYPES.get(item.get("dataType"), ""), []).append(fdc_id)
+        else:
+            existing.add(fdc_id)
+            chunk.append(food_rows(item))
+            created += 1
+        if len(chunk) + sum(map(len, present.values())) >= chunk_size:
+            flush()
+    if chunk or present:
+        flush()
+    if created:
+        food_index.invalidate()  # bulk_create skips post_save
+    return created, skipped
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load FoodData Central JSON/CSV downloads into local Food rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='FDC .json files and/or unzipped CSV folders')
+        parser.add_argument('--fdc-id', action='append', dest='fdc_ids', type=int,
+                            help='fetch this food from the USDA API (repeatable)')
+        parser.add_argument('--data-type', action='append', dest='data_types',
+                            choices=sorted(set(FDC_DATA_TYPES.values())),
+                            help='only import these data types (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        data_types = set(options['data_types'] or [])
+        if not options['paths'] and not options['fdc_ids']:
+            raise CommandError('give FDC download paths and/or --fdc-id')
+        if options['fdc_ids']:
+            self.import_ids(options['fdc_ids'], options['chunk_size'])
+        for raw in options['paths']:
+            path = Path(raw)
+            if path.is_dir():
+                items = iter_csv_foods(path, data_types)
+            elif path.suffix.lower() == '.json':
+                items = iter_json_foods(path)
+                if data_types:
+                    items = (i for i in items
+                             if FDC_DATA_TYPES.get(i.get('dataType')) in data_types)
+            else:
+                raise CommandError(f'{path} is neither a .json file nor a CSV folder')
+
+            created, skipped = load_foods(items, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{path.name}: imported {created} foods ({skipped} already present)'
+            ))
+
+    def import_ids(self, fdc_ids, chunk_size):
+        existing = set(Food.objects.filter(fdc_id__in=map(str, fdc_ids)).values_list('fdc_id', flat=True))
+        try:
+            found = usda.get_foods(i for i in fdc_ids if str(i) not in existing)
+        except usda.UsdaError as e:
+            raise CommandError(str(e))
+        created, skipped = load_foods((food for food in found.values() if food), chunk_size)
+        unknown = [fdc_id for fdc_id, food in found.items() if not food]
+        self.stdout.write(self.style.SUCCESS(
+            f'USDA API: imported {created} foods ({len(existing) + skipped} already present)'
+        ))
+        if unknown:
+            self.stdout.write(self.style.WARNING(f'unknown fdcIds: {", ".join(map(str, unknown))}'))
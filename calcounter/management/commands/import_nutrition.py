@@ -0,0 +1,36 @@
+"""
+Django management command to load a user's nutrition history from another
+tracker's CSV export (MyFitnessPal, Cronometer and similar column layouts).
+
+The file is streamed row by row and written in chunks with bulk_create;
+day totals are rebuilt once at the end (calcounter.nutrition_import).
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from calcounter.nutrition_import import CHUNK_SIZE, NutritionImportError, import_history
+
+
+class Command(BaseCommand):
+    help = "Import nutrition history from a tracker's CSV export into a user's days"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV export (first row : column names)')
+        parser.add_argument('--user', required=True, help='username to import for')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"no user {options['user']!r}")
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as fh:
+                stats = import_history(user, fh, options['chunk_size'])
+        except (OSError, NutritionImportError) as e:
+            raise CommandError(f"{options['path']}: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"imported {stats['rows']} entries into {stats['meals']} meals over "
+            f"{stats['days']} days ({stats['matched']} matched to foods, "
+            f"{stats['skipped']} rows skipped)"
+        ))
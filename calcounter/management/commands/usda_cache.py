@@ -0,0 +1,29 @@
+"""
+Django management command to inspect the USDA response cache (calcounter.usda):
+hit / miss counters, and optionally clear entries or reset the counters.
+"""
+from django.core.management.base import BaseCommand
+from calcounter import usda
+
+
+class Command(BaseCommand):
+    help = 'Show USDA API cache counters (--clear drops cached responses)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true',
+                            help='drop every cached USDA response (and the counters)')
+        parser.add_argument('--reset-stats', action='store_true',
+                            help='zero the counters, keep cached responses')
+
+    def handle(self, *args, **options):
+        counts = usda.stats()
+        for name in usda.COUNTERS:
+            self.stdout.write(f'{name:>9}: {counts[name]}')
+        self.stdout.write(f" hit rate: {counts['hit_rate']:.1%}")
+
+        if options['clear']:
+            usda.usda_cache().clear()
+            self.stdout.write(self.style.SUCCESS('Cleared the USDA cache'))
+        elif options['reset_stats']:
+            usda.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Reset USDA cache counters'))
@@ -0,0 +1,59 @@
+'''
+ Meal templates : a Meal with is_template=True, an owner and no day, holding
+ copies of the items of the meal it was saved from.
+
+ save(meal, user)   copy a logged meal into a new template
+ log(template, day) clone a template onto a day in one transaction :
+                      - one query reads the template's items together with
+                        their nutrient contributions
+                      - one bulk_create writes the copies (no per-item
+                        MealConsumption signals, so no per-item day re-sum)
+                      - the day's DailyNutrientTotals take the summed vector
+                        as a single delta, Day macros are synced once
+'''
+from django.db import transaction
+
+from core import fragments
+from core.signals import sync_day_macros
+from graphs import timeseries
+from . import nutrients
+from .models import DailyNutrientTotals, Meal, MealConsumption
+
+ITEM_FIELDS = ('food_id', 'amount', 'unit_id', 'description', *nutrients.NUTRIENT_FIELDS)
+
+
+def _copies(source, meal):
+    ''' (unsaved copies of source's items on meal, their summed nutrient vector) '''
+    rows, contributions = nutrients.consumption_matrix(source.items.order_by('pk'), *ITEM_FIELDS)
+    items = [MealConsumption(meal=meal, **dict(zip(ITEM_FIELDS, row))) for row in rows]
+    total = contributions.sum(axis=0) if len(contributions) else nutrients.zeros()
+    return items, total
+
+
+def for_user(user):
+    return Meal.objects.filter(owner=user, is_template=True).order_by('name', 'pk')
+
+
+def save(meal, user, name=None):
+    ''' a new template of `user` with copies of meal's items '''
+    with transaction.atomic():
+        template = Meal.objects.create(owner=user, is_template=True, name=name or meal.name)
+        items, _ = _copies(meal, template)
+        MealConsumption.objects.bulk_create(items)
+    fragments.bump(user.pk, 'meals')
+    return template
+
+
+def log(template, day):
+    ''' clone template onto day as a new meal; the day's totals move once '''
+    with transaction.atomic():
+        meal = Meal.objects.create(day=day, name=template.name)
+        items, total = _copies(template, meal)
+        MealConsumption.objects.bulk_create(items)
+        if items:
+            DailyNutrientTotals.objects.apply_delta(day.pk, total)
+            sync_day_macros(day.pk)
+    # calories/protein were written with .update() : no Day signal fired
+    timeseries.invalidate(day.user_id)
+    fragments.bump(day.user_id, 'meals')
+    return meal
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calcounter', '0001_initial'),
+        ('core', '0002_profile_calendar_view_alter_profile_timezone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyNutrientTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calories', models.FloatField(default=0)),
+                ('protein', models.FloatField(default=0)),
+                ('fat', models.FloatField(default=0)),
+                ('carb', models.FloatField(default=0)),
+                ('sugar', models.FloatField(default=0)),
+                ('fiber', models.FloatField(default=0)),
+                ('cholesterol', models.FloatField(default=0)),
+                ('calcium', models.FloatField(default=0)),
+                ('iron', models.FloatField(default=0)),
+                ('magnesium', models.FloatField(default=0)),
+                ('potassium', models.FloatField(default=0)),
+                ('sodium', models.FloatField(default=0)),
+                ('zinc', models.FloatField(default=0)),
+                ('vitamin_a', models.FloatField(default=0)),
+                ('vitamin_b6', models.FloatField(default=0)),
+                ('vitamin_b12', models.FloatField(default=0)),
+                ('vitamin_c', models.FloatField(default=0)),
+                ('vitamin_d', models.FloatField(default=0)),
+                ('vitamin_e', models.FloatField(default=0)),
+                ('day', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='nutrient_totals', to='core.day')),
+            ],
+        ),
+    ]
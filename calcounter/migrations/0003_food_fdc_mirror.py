@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calcounter', '0002_dailynutrienttotals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='brand',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='data_type',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='fdc_id',
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def install_index(apps, schema_editor):
+    from calcounter import search
+    search.install_index(schema_editor)
+
+
+def drop_index(apps, schema_editor):
+    from calcounter import search
+    search.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+    # FTS5 table + triggers on sqlite, tsvector / trigram GIN indexes on postgres
+
+    dependencies = [
+        ('calcounter', '0003_food_fdc_mirror'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_index, drop_index),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:14
+
+from django.db import migrations, models
+
+
+def pack_vectors(apps, schema_editor):
+    from calcounter import nutrients
+    Food = apps.get_model('calcounter', 'Food')
+    foods = list(Food.objects.only('pk', *nutrients.NUTRIENT_FIELDS))
+    for food in foods:
+        food.nutrient_vector = nutrients.pack(food)
+    Food.objects.bulk_update(foods, ['nutrient_vector'], batch_size=1000)
+
+
+def install_index(apps, schema_editor):
+    # sqlite rebuilds calcounter_food for the AlterFields, dropping the FTS triggers
+    from calcounter import search
+    search.install_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calcounter', '0004_food_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='nutrient_vector',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='carb',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='cholesterol',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='fat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='fiber',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='protein',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='sugar',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_vectors, migrations.RunPython.noop),
+        migrations.RunPython(install_index, migrations.RunPython.noop),
+    ]
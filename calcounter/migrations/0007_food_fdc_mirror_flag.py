@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+def install_index(apps, schema_editor):
+    # sqlite rebuilds calcounter_food for the AddField, dropping the FTS triggers
+    from calcounter import search
+    search.install_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+    # rows loaded before the flag existed are marked by re-running import_fdc :
+    # it flags the fdc_ids it finds already present
+
+    dependencies = [
+        ('calcounter', '0006_meal_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='fdc_mirror',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(install_index, migrations.RunPython.noop),
+    ]
@@ -4,10 +4,12 @@
  MealConsumption : relationship model [food, serving]
  Ingredient : relationship model for complex food [food, serving]
 '''
+import numpy as np
 from django.db import models
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Q, F
 from core.models import Day
+from . import nutrients
 
 FRUIT_CLASSES = [
     'apple',
@@ -121,12 +123,33 @@ PORK_CLASSES = [
     'hot dog',
 ]
 
-class FoodManager(models.Manager):
+class FoodQuerySet(models.QuerySet):
     def available_to_user(self, user):
         global_foods = models.Q(owner__isnull=True)
         user_foods = models.Q(owner=user)
         return self.filter(global_foods | user_foods)
 
+    def nutrient_matrix(self):
+        '''
+        (ids, per-100g matrix) of the foods in queryset order, decoded from the
+        packed nutrient_vector column instead of 19 fields per row. Rows never
+        packed (bulk_create skips Food.save) are read from the fields.
+        '''
+        rows = list(self.values_list('pk', 'nutrient_vector'))
+        ids = np.array([pk for pk, _ in rows], dtype=np.int64)
+        empty = bytes(nutrients.N_NUTRIENTS * nutrients.PACKED_DTYPE.itemsize)
+        matrix = nutrients.unpack(blob if blob is not None else empty for _, blob in rows)
+        missing = [i for i, (_, blob) in enumerate(rows) if blob is None]
+        if missing:
+            fields = {row[0]: row[1:] for row in Food.objects.filter(pk__in=ids[missing].tolist())
+                      .values_list('pk', *nutrients.NUTRIENT_FIELDS)}
+            matrix[missing] = nutrients.matrix_from(fields[pk] for pk in ids[missing].tolist())
+        return ids, matrix
+
+
+class FoodManager(models.Manager.from_queryset(FoodQuerySet)):
+    pass
+
 
 class Food(models.Model):
     '''
@@ -135,16 +158,21 @@ class Food(models.Model):
     2. Complex Food Item (Mashed Potato, Marinara Sauce)
     '''
     name = models.CharField(max_length=255, blank=True, null=True)
-    fdc_id = models.CharField(max_length=20, blank=True, null=True)
+    fdc_id = models.CharField(max_length=20, blank=True, null=True, db_index=True)
+    # FDC source ("Foundation", "SR Legacy", "Branded") : set by import_fdc only
+    data_type = models.CharField(max_length=20, blank=True, default="")
+    # loaded by manage.py import_fdc : ingredient search uses the local mirror once any is
+    fdc_mirror = models.BooleanField(default=False, db_index=True)
+    brand = models.CharField(max_length=255, blank=True, default="")
     # -- nutrients per 100g --
     # Macros
     calories = models.IntegerField(null=True)
-    protein = models.IntegerField(null=True)
-    fat = models.IntegerField(blank=True, null=True)
-    carb = models.IntegerField(blank=True, null=True)
-    sugar = models.IntegerField(blank=True, null=True)
-    fiber = models.IntegerField(blank=True, null=True)
-    cholesterol = models.IntegerField(blank=True, null=True)
+    protein = models.FloatField(null=True)
+    fat = models.FloatField(blank=True, null=True)
+    carb = models.FloatField(blank=True, null=True)
+    sugar = models.FloatField(blank=True, null=True)
+    fiber = models.FloatField(blank=True, null=True)
+    cholesterol = models.FloatField(blank=True, null=True)
     # Minerals
     calcium = models.FloatField(blank=True, null=True)
     iron = models.FloatField(blank=True, null=True)
@@ -159,6 +187,8 @@ class Food(models.Model):
     vitamin_c = models.FloatField(blank=True, null=True)
     vitamin_d = models.FloatField(blank=True, null=True)
     vitamin_e = models.FloatField(blank=True, null=True)
+    # the fields above packed by save() : Food.objects.nutrient_matrix()
+    nutrient_vector = models.BinaryField(null=True, editable=False)
     ingredients = models.ManyToManyField(
         'self',
         through='Ingredient',
@@ -181,6 +211,27 @@ class Food(models.Model):
     def __str__(self):
         return f"{self.name}: {self.calories}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        food = super().from_db(db, field_names, values)
+        # core.signals refreshes composites / day totals only when nutrients change
+        loaded = dict(zip(field_names, values)).get('nutrient_vector')
+        food._loaded_nutrient_vector = None if loaded is None else bytes(loaded)
+        return food
+
+    @property
+    def nutrients_changed(self):
+        ''' nutrients differ from the row as loaded (or last saved) '''
+        return bytes(nutrients.pack(self)) != getattr(self, '_loaded_nutrient_vector', None)
+
+    def save(self, *args, **kwargs):
+        self.nutrient_vector = nutrients.pack(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(nutrients.NUTRIENT_FIELDS):
+            kwargs['update_fields'] = {*update_fields, 'nutrient_vector'}
+        super().save(*args, **kwargs)
+        self._loaded_nutrient_vector = self.nutrient_vector
+
     def to_formatted_dict(self):
         """Returns the food item in the macros/minerals/vitamins structure."""
         # Define field mappings: { field_name: (Display Name, Unit) }
@@ -303,54 +354,13 @@ class Food(models.Model):
 
         return badges
 
+    def as_vector(self):
+        """Nutrients per 100g as a vector in NUTRIENT_FIELDS order."""
+        return nutrients.vector_from(self)
+
     def get_nutrition_consumed(self, serving_size):
         # Calculation: (Food's nutrient per 100g / 100) * serving_g
-        # 'or 0' guards against None fields (nullable in DB)
-        def scale(val): return ((val or 0) / 100) * serving_size
-        calories = scale(self.calories)
-        protein = scale(self.protein)
-        fat = scale(self.fat)
-        carb = scale(self.carb)
-        sugar = scale(self.sugar)
-        fiber = scale(self.fiber)
-        cholesterol = scale(self.cholesterol)
-        # Minerals
-        calcium = scale(self.calcium)
-        iron = scale(self.iron)
-        magnesium = scale(self.magnesium)
-        potassium = scale(self.potassium)
-        sodium = scale(self.sodium)
-        zinc = scale(self.zinc)
-        # Vitamins
-        vitamin_a = scale(self.vitamin_a)
-        vitamin_b6 = scale(self.vitamin_b6)
-        vitamin_b12 = scale(self.vitamin_b12)
-        vitamin_c = scale(self.vitamin_c)
-        vitamin_d = scale(self.vitamin_d)
-        vitamin_e = scale(self.vitamin_e)
-        return {
-            'calories': calories,
-            'protein': protein,
-            'fat': fat,
-            'carb': carb,
-            'sugar': sugar,
-            'fiber': fiber,
-            'cholesterol': cholesterol,
-            # Minerals
-            'calcium': calcium,
-            'iron': iron,
-            'magnesium': magnesium,
-            'potassium': potassium,
-            'sodium': sodium,
-            'zinc': zinc,
-            # Vitamins
-            'vitamin_a': vitamin_a,
-            'vitamin_b6': vitamin_b6,
-            'vitamin_b12': vitamin_b12,
-            'vitamin_c': vitamin_c,
-            'vitamin_d': vitamin_d,
-            'vitamin_e': vitamin_e,
-        }
+        return nutrients.to_dict(nutrients.scale(self.as_vector(), serving_size))
 
 
 class FoodUnitManager(models.Manager):
@@ -394,6 +404,18 @@ class FoodUnit(models.Model):
     def __str__(self):
         return f"{self.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        unit = super().from_db(db, field_names, values)
+        # core.signals rebuilds day totals only when the weight changes
+        unit._loaded_gram_weight = dict(zip(field_names, values)).get('gram_weight')
+        return unit
+
+    @property
+    def gram_weight_changed(self):
+        loaded = getattr(self, '_loaded_gram_weight', None)
+        return loaded is None or float(loaded) != float(self.gram_weight)
+
 
 class Ingredient(models.Model):
     ''' Complex Food
@@ -429,6 +451,9 @@ class Meal(models.Model):
                             related_name="meals", null=True)
     name = models.CharField(max_length=255, blank=True, null=True)
     is_template = models.BooleanField(default=False)
+    # templates have no day : calcounter.meal_templates
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                              null=True, blank=True, related_name='meal_templates')
     foods_consumed = models.ManyToManyField(
         Food,
         through='MealConsumption',
@@ -436,61 +461,13 @@ class Meal(models.Model):
     )
 
     def __str__(self):
+        if self.is_template:
+            return f"Meal template: {self.name or 'Unnamed'} of {self.owner}"
         return f"Meal: {self.name or 'Unnamed'} on {self.day}"
 
     def get_nutrients_consumed(self):
-        total_nutrients = {
-            'calories': 0,
-            'protein': 0,
-            'fat': 0,
-            'carb': 0,
-            'sugar': 0,
-            'fiber': 0,
-            'cholesterol': 0,
-            # Minerals
-            'calcium': 0,
-            'iron': 0,
-            'magnesium': 0,
-            'potassium': 0,
-            'sodium': 0,
-            'zinc': 0,
-            # Vitamins
-            'vitamin_a': 0,
-            'vitamin_b6': 0,
-            'vitamin_b12': 0,
-            'vitamin_c': 0,
-            'vitamin_d': 0,
-            'vitamin_e': 0,
-        }
-        for item in self.items.prefetch_related('food', 'unit').all():
-            if item.food:
-                serving_size = item.amount * float(item.unit.gram_weight)
-                nutrients = item.food.get_nutrition_consumed(serving_size)
-                for key, value in nutrients.items():
-                    total_nutrients[key] += value or 0
-            else:  # Manual Input
-                total_nutrients['calories'] += item.calories or 0
-                total_nutrients['protein'] += item.protein or 0
-                total_nutrients['fat'] += item.fat or 0
-                total_nutrients['carb'] += item.carb or 0
-                total_nutrients['sugar'] += item.sugar or 0
-                total_nutrients['fiber'] += item.fiber or 0
-                total_nutrients['cholesterol'] += item.cholesterol or 0
-                # Minerals
-                total_nutrients['calcium'] += item.calcium or 0
-                total_nutrients['iron'] += item.iron or 0
-                total_nutrients['magnesium'] += item.magnesium or 0
-                total_nutrients['potassium'] += item.potassium or 0
-                total_nutrients['sodium'] += item.sodium or 0
-                total_nutrients['zinc'] += item.zinc or 0
-                # Vitamins
-                total_nutrients['vitamin_a'] += item.vitamin_a or 0
-                total_nutrients['vitamin_b6'] += item.vitamin_b6 or 0
-                total_nutrients['vitamin_b12'] += item.vitamin_b12 or 0
-                total_nutrients['vitamin_c'] += item.vitamin_c or 0
-                total_nutrients['vitamin_d'] += item.vitamin_d or 0
-                total_nutrients['vitamin_e'] += item.vitamin_e or 0
-        return total_nutrients
+        # one query: every item's food row and unit, scaled as a matrix
+        return nutrients.to_dict(nutrients.consumption_totals(self.items.all()))
 
 
 class MealConsumption(models.Model):
@@ -535,55 +512,104 @@ class MealConsumption(models.Model):
         else:
             ret = f"Manual Input in {self.meal.name}"
         return ret
+
+    @property
+    def serving_grams(self):
+        # serving_g = amount (in units) * gram_weight (grams per unit)
+        return self.amount * float(self.unit.gram_weight)
+
+    def as_vector(self):
+        """Nutrients this item contributes to its meal."""
+        if self.food_id is None:  # Manual Input
+            return nutrients.vector_from(self)
+        return nutrients.scale(self.food.as_vector(), self.serving_grams)
+
     def get_nutrition_consumed(self):
         # Calculation: (Food's nutrient per 100g / 100) * serving_g
-        # serving_g = amount (in units) * gram_weight (grams per unit)
-        serving_size = self.amount * float(self.unit.gram_weight)
-        def scale(val): return ((val or 0) / 100) * serving_size
-        calories = scale(self.food.calories)
-        protein = scale(self.food.protein)
-        fat = scale(self.food.fat)
-        carb = scale(self.food.carb)
-        sugar = scale(self.food.sugar)
-        fiber = scale(self.food.fiber)
-        cholesterol = scale(self.food.cholesterol)
-        # Minerals
-        calcium = scale(self.food.calcium)
-        iron = scale(self.food.iron)
-        magnesium = scale(self.food.magnesium)
-        potassium = scale(self.food.potassium)
-        sodium = scale(self.food.sodium)
-        zinc = scale(self.food.zinc)
-        # Vitamins
-        vitamin_a = scale(self.food.vitamin_a)
-        vitamin_b6 = scale(self.food.vitamin_b6)
-        vitamin_b12 = scale(self.food.vitamin_b12)
-        vitamin_c = scale(self.food.vitamin_c)
-        vitamin_d = scale(self.food.vitamin_d)
-        vitamin_e = scale(self.food.vitamin_e)
-        return {
-            'calories': calories,
-            'protein': protein,
-            'fat': fat,
-            'carb': carb,
-            'sugar': sugar,
-            'fiber': fiber,
-            'cholesterol': cholesterol,
-            # Minerals
-            'calcium': calcium,
-            'iron': iron,
-            'magnesium': magnesium,
-            'potassium': potassium,
-            'sodium': sodium,
-            'zinc': zinc,
-            # Vitamins
-            'vitamin_a': vitamin_a,
-            'vitamin_b6': vitamin_b6,
-            'vitamin_b12': vitamin_b12,
-            'vitamin_c': vitamin_c,
-            'vitamin_d': vitamin_d,
-            'vitamin_e': vitamin_e,
+        return nutrients.to_dict(self.as_vector())
+
+
+class DailyNutrientTotalsManager(models.Manager):
+    def rebuild(self, day_id):
+        """Re-sum every MealConsumption of the day into its totals row."""
+        vec = nutrients.consumption_totals(
+            MealConsumption.objects.filter(meal__day_id=day_id)
+        )
+        totals, _ = self.update_or_create(
+            day_id=day_id, defaults=nutrients.to_dict(vec)
+        )
+        return totals
+
+    def rebuild_days(self, day_ids):
+        """
+        Re-sum many days with one grouped query and one bulk_create.
+        Returns {day_id: vector} for the days that still exist.
+        """
+        day_ids = list(Day.objects.filter(pk__in=list(day_ids)).values_list('pk', flat=True))
+        totals = nutrients.grouped_totals(
+            MealConsumption.objects.filter(meal__day_id__in=day_ids), 'meal__day_id'
+        )
+        vectors = {day_id: totals.get(day_id, nutrients.zeros()) for day_id in day_ids}
+        self.filter(day_id__in=day_ids).delete()
+        self.bulk_create([
+            self.model(day_id=day_id, **nutrients.to_dict(vec)) for day_id, vec in vectors.items()
+        ])
+        return vectors
+
+    def apply_delta(self, day_id, delta):
+        """
+        Add a nutrient vector to the day's row in place (F() increments).
+        Days without a row yet are rebuilt from scratch instead
+        (unless the Day itself is gone).
+        """
+        changes = {
+            field: F(field) + value
+            for field, value in nutrients.to_dict(delta).items() if value
         }
+        if not changes:
+            return
+        if not self.filter(day_id=day_id).update(**changes) and Day.objects.filter(pk=day_id).exists():
+            self.rebuild(day_id)
+
+
+class DailyNutrientTotals(models.Model):
+    '''
+    Materialized sum of every nutrient consumed on a Day.
+    Maintained by the MealConsumption signals (core.signals) with deltas,
+    so breakdowns and completion percentages are a single-row read.
+    '''
+    day = models.OneToOneField(Day, on_delete=models.CASCADE,
+                               related_name="nutrient_totals")
+    # Macros
+    calories = models.FloatField(default=0)
+    protein = models.FloatField(default=0)
+    fat = models.FloatField(default=0)
+    carb = models.FloatField(default=0)
+    sugar = models.FloatField(default=0)
+    fiber = models.FloatField(default=0)
+    cholesterol = models.FloatField(default=0)
+    # Minerals
+    calcium = models.FloatField(default=0)
+    iron = models.FloatField(default=0)
+    magnesium = models.FloatField(default=0)
+    potassium = models.FloatField(default=0)
+    sodium = models.FloatField(default=0)
+    zinc = models.FloatField(default=0)
+    # Vitamins
+    vitamin_a = models.FloatField(default=0)
+    vitamin_b6 = models.FloatField(default=0)
+    vitamin_b12 = models.FloatField(default=0)
+    vitamin_c = models.FloatField(default=0)
+    vitamin_d = models.FloatField(default=0)
+    vitamin_e = models.FloatField(default=0)
+
+    objects = DailyNutrientTotalsManager()
+
+    def __str__(self):
+        return f"Totals for {self.day}"
+
+    def as_vector(self):
+        return nutrients.vector_from(self)
 
 
 PANTRY_STATUS = [
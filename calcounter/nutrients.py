@@ -0,0 +1,168 @@
+'''
+ Nutrient vectors : every food, consumption and day total is a row of the
+ same fixed-order schema, so nutrition math is numpy instead of 19-key dicts.
+
+ vector  : np.ndarray shape (N_NUTRIENTS,)        -> one food / item / total
+ matrix  : np.ndarray shape (n, N_NUTRIENTS)      -> many foods / items
+ grams   : np.ndarray shape (n,)                  -> serving size of each row
+ totals  : grams @ per_100g_matrix / 100 (+ manual entries)
+packed  : bytes, N_NUTRIENTS little-endian float32 (Food.nutrient_vector),
+          NaN where the field is empty
+'''
+import numpy as np
+from core.models import RDA_LOOKUP
+
+# (model field, USDA nutrient number, group, RDA_LOOKUP key)
+NUTRIENT_SCHEMA = (
+    # Macros
+    ('calories',    '208', 'macro',   None),
+    ('protein',     '203', 'macro',   None),
+    ('fat',         '204', 'macro',   None),
+    ('carb',        '205', 'macro',   None),
+    ('sugar',       '269', 'macro',   None),
+    ('fiber',       '291', 'macro',   None),
+    ('cholesterol', '601', 'macro',   None),
+    # Minerals
+    ('calcium',     '301', 'mineral', ('Minerals', 'calcium')),
+    ('iron',        '303', 'mineral', ('Minerals', 'iron')),
+    ('magnesium',   '304', 'mineral', ('Minerals', 'magnesium')),
+    ('potassium',   '306', 'mineral', ('Minerals', 'potassium')),
+    ('sodium',      '307', 'mineral', ('Minerals', 'sodium')),
+    ('zinc',        '309', 'mineral', ('Minerals', 'zinc')),
+    # Vitamins
+    ('vitamin_a',   '320', 'vitamin', ('Vitamins', 'A')),
+    ('vitamin_b6',  '415', 'vitamin', ('Vitamins', 'B6')),
+    ('vitamin_b12', '418', 'vitamin', ('Vitamins', 'B12')),
+    ('vitamin_c',   '401', 'vitamin', ('Vitamins', 'C')),
+    ('vitamin_d',   '328', 'vitamin', ('Vitamins', 'D')),
+    ('vitamin_e',   '323', 'vitamin', ('Vitamins', 'E')),
+)
+
+NUTRIENT_FIELDS = tuple(field for field, _, _, _ in NUTRIENT_SCHEMA)
+NUTRIENT_INDEX = {field: i for i, field in enumerate(NUTRIENT_FIELDS)}
+N_NUTRIENTS = len(NUTRIENT_FIELDS)
+PACKED_DTYPE = np.dtype('<f4')
+
+# USDA nutrient number -> model field (and back)
+USDA_FIELDS = {number: field for field, number, _, _ in NUTRIENT_SCHEMA}
+FIELD_USDA = {field: number for field, number, _, _ in NUTRIENT_SCHEMA}
+
+
+def group_fields(group):
+    ''' model fields belonging to 'macro', 'mineral' or 'vitamin' (schema order) '''
+    return [field for field, _, g, _ in NUTRIENT_SCHEMA if g == group]
+
+
+def group_numbers(group):
+    ''' USDA numbers belonging to 'macro', 'mineral' or 'vitamin' (schema order) '''
+    return [number for _, number, g, _ in NUTRIENT_SCHEMA if g == group]
+
+
+# --- Building vectors ---
+
+def zeros():
+    return np.zeros(N_NUTRIENTS)
+
+
+def vector_from(obj):
+    ''' vector of an object with one attribute per nutrient field (None -> 0) '''
+    vec = np.array([getattr(obj, field) for field in NUTRIENT_FIELDS], dtype=float)
+    return np.nan_to_num(vec, copy=False)
+
+
+def matrix_from(rows):
+    ''' matrix from value rows in schema order, e.g. values_list(*NUTRIENT_FIELDS) '''
+    rows = list(rows)
+    if not rows:
+        return np.zeros((0, N_NUTRIENTS))
+    return np.nan_to_num(np.array(rows, dtype=float), copy=False)
+
+
+def pack(obj):
+    ''' Food.nutrient_vector bytes of an object with one attribute per nutrient field '''
+    values = [getattr(obj, field) for field in NUTRIENT_FIELDS]
+    return np.array(values, dtype=float).astype(PACKED_DTYPE).tobytes()
+
+
+def unpack(blobs):
+    ''' matrix from packed vectors (one per row), empty fields -> 0 '''
+    blobs = [bytes(blob) for blob in blobs]
+    if not blobs:
+        return np.zeros((0, N_NUTRIENTS))
+    packed = np.frombuffer(b''.join(blobs), dtype=PACKED_DTYPE).reshape(-1, N_NUTRIENTS)
+    return np.nan_to_num(packed.astype(float), copy=False)
+
+
+def to_dict(vec):
+    ''' { field: float } view of a vector, the shape the templates/views use '''
+    return dict(zip(NUTRIENT_FIELDS, vec.tolist()))
+
+
+def scale(per_100g, grams):
+    '''
+    (nutrient per 100g / 100) * serving_g
+    vector * scalar -> vector ; matrix with grams vector -> summed vector
+    '''
+    if np.ndim(per_100g) == 2:
+        return np.asarray(grams, dtype=float) @ per_100g / 100
+    return per_100g * (float(grams) / 100)
+
+
+# --- MealConsumption batches ---
+
+FOOD_COLUMNS = tuple(f'food__{field}' for field in NUTRIENT_FIELDS)
+_HEAD = ('food_id', 'amount', 'unit__gram_weight')
+
+
+def consumption_matrix(queryset, *keys):
+    '''
+    One query over a MealConsumption queryset -> (key rows, contribution matrix)
+    Food rows contribute food_per_100g * amount * gram_weight / 100,
+    manual rows (no food) contribute their own stored nutrient columns.
+    `keys` are extra values_list lookups returned alongside (e.g. 'meal_id').
+    '''
+    rows = list(queryset.values_list(*keys, *_HEAD, *FOOD_COLUMNS, *NUTRIENT_FIELDS))
+    n_keys = len(keys)
+    key_rows = [row[:n_keys] for row in rows]
+    if not rows:
+        return key_rows, np.zeros((0, N_NUTRIENTS))
+    data = np.array([row[n_keys:] for row in rows], dtype=float)
+    has_food = ~np.isnan(data[:, 0])
+    grams = np.nan_to_num(data[:, 1] * data[:, 2])
+    per_100g = np.nan_to_num(data[:, 3:3 + N_NUTRIENTS])
+    manual = np.nan_to_num(data[:, 3 + N_NUTRIENTS:])
+    contributions = np.where(
+        has_food[:, None], per_100g * (grams / 100)[:, None], manual
+    )
+    return key_rows, contributions
+
+
+def consumption_totals(queryset):
+    ''' summed nutrient vector of every MealConsumption in the queryset '''
+    _, contributions = consumption_matrix(queryset)
+    return contributions.sum(axis=0) if len(contributions) else zeros()
+
+
+def grouped_totals(queryset, key):
+    ''' { key value: summed vector } e.g. key='meal_id' or 'meal__day__date' '''
+    key_rows, contributions = consumption_matrix(queryset, key)
+    if not key_rows:
+        return {}
+    labels, inverse = np.unique(
+        np.array([k for (k,) in key_rows], dtype=object), return_inverse=True
+    )
+    totals = np.zeros((len(labels), N_NUTRIENTS))
+    np.add.at(totals, inverse, contributions)
+    return {label: totals[i] for i, label in enumerate(labels)}
+
+
+# --- Goals ---
+
+def rda_vector(goal_type):
+    ''' RDA per nutrient for a goal type ('Adult Male', ...); 0 where no RDA '''
+    vec = zeros()
+    for i, (_, _, _, rda_key) in enumerate(NUTRIENT_SCHEMA):
+        if rda_key is not None:
+            group, name = rda_key
+            vec[i] = RDA_LOOKUP[group][name][goal_type]
+    return vec
@@ -0,0 +1,262 @@
+'''
+ Nutrition history import from other trackers' CSV exports
+ (manage.py import_nutrition, or the upload form of calcounter:import_history).
+
+ Columns are recognised by name and unit, so MyFitnessPal's
+ "Date, Meal, Calories, Fat (g), ..., Protein (g)" and Cronometer's
+ "Day, Group, Food Name, Amount, Energy (kcal), ..., Zinc (mg)" both load;
+ a nutrient whose unit differs from ours (MyFitnessPal's vitamins in % DV,
+ Cronometer's vitamin D in IU) is left out rather than guessed.
+
+ The file is read one row at a time and written per chunk of CHUNK_SIZE
+ rows, inside one transaction each:
+   - the chunk's days come from one core.utils.DayRange over its dates only
+   - its new (date, meal) pairs are one Meal bulk_create
+   - food names are resolved against the user's Foods (one query per chunk
+     for names not seen yet) : a match with a gram amount ("150 g") links the
+     Food and its grams unit, anything else is kept as a manual entry with
+     the exported nutrients
+   - every row is one MealConsumption in a single bulk_create
+ bulk_create fires no signals : DailyNutrientTotals, the Day macros, the
+ streak and the cached graphs are rebuilt once, for the touched days only.
+ Memory is bounded by the chunk plus one id per day / meal / food name seen.
+'''
+import csv
+import re
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils.dateparse import parse_date
+
+from core import fragments, streaks
+from core.models import Day
+from core.utils import DayRange
+from graphs import timeseries
+from . import nutrients
+from .models import DailyNutrientTotals, Food, FoodUnit, Meal, MealConsumption
+
+CHUNK_SIZE = 1000
+
+# exported column name (lowercase, unit stripped) -> our field
+COLUMNS = {
+    'date': 'date', 'day': 'date',
+    'meal': 'meal', 'group': 'meal',
+    'food name': 'food', 'food': 'food', 'name': 'food',
+    'amount': 'amount',
+    'calories': 'calories', 'energy': 'calories',
+    'protein': 'protein',
+    'fat': 'fat', 'total fat': 'fat',
+    'carbohydrates': 'carb', 'carbs': 'carb', 'net carbs': None,
+    'sugar': 'sugar', 'sugars': 'sugar',
+    'fiber': 'fiber',
+    'cholesterol': 'cholesterol',
+    'calcium': 'calcium', 'iron': 'iron', 'magnesium': 'magnesium',
+    'potassium': 'potassium', 'sodium': 'sodium', 'zinc': 'zinc',
+    'vitamin a': 'vitamin_a', 'b6 (pyridoxine)': 'vitamin_b6', 'vitamin b6': 'vitamin_b6',
+    'b12 (cobalamin)': 'vitamin_b12', 'vitamin b12': 'vitamin_b12',
+    'vitamin c': 'vitamin_c', 'vitamin d': 'vitamin_d', 'vitamin e': 'vitamin_e',
+}
+
+# units of our nutrient fields; '' : a bare "Calories" column
+UNITS = {
+    'calories': {'kcal', ''},
+    'protein': {'g'}, 'fat': {'g'}, 'carb': {'g'}, 'sugar': {'g'}, 'fiber': {'g'},
+    'cholesterol': {'mg'},
+    'calcium': {'mg'}, 'iron': {'mg'}, 'magnesium': {'mg'},
+    'potassium': {'mg'}, 'sodium': {'mg'}, 'zinc': {'mg'},
+    'vitamin_a': {'µg', 'mcg', 'ug'}, 'vitamin_b6': {'mg'}, 'vitamin_b12': {'µg', 'mcg', 'ug'},
+    'vitamin_c': {'mg'}, 'vitamin_d': {'µg', 'mcg', 'ug'}, 'vitamin_e': {'mg'},
+}
+
+HEADER_RE = re.compile(r'^(?P<name>.*?)\s*(?:\((?P<unit>[^()]*)\))?$')
+GRAMS_RE = re.compile(r'^\s*(?P<grams>\d+(?:\.\d*)?)\s*(?:g|gram|grams)\s*$', re.IGNORECASE)
+INTEGER_FIELDS = {f.name for f in MealConsumption._meta.concrete_fields
+                  if f.get_internal_type() == 'IntegerField'}
+
+
+class NutritionImportError(ValueError):
+    ''' the file can't be read as a nutrition export '''
+
+
+# --- Parsing ---
+
+def header_columns(header):
+    ''' {field: column index} of a header row; nutrients only with our units '''
+    columns = {}
+    for i, title in enumerate(header):
+        match = HEADER_RE.match(title.strip().lstrip('\ufeff'))
+        name, unit = match['name'].lower(), (match['unit'] or '').strip().lower()
+        field = COLUMNS.get(name)
+        if field is None or field in columns:
+            continue
+        if field in UNITS and unit not in UNITS[field]:
+            continue
+        columns[field] = i
+    if 'date' not in columns:
+        raise NutritionImportError('no Date / Day column')
+    if not columns.keys() & set(nutrients.NUTRIENT_FIELDS) and 'food' not in columns:
+        raise NutritionImportError('no nutrient or food name columns')
+    return columns
+
+
+def _date(value):
+    value = value.strip()
+    try:
+        return parse_date(value) or datetime.strptime(value, '%m/%d/%Y').date()
+    except ValueError:
+        return None
+
+
+def _number(value):
+    try:
+        return float(value.replace(',', ''))
+    except (AttributeError, ValueError):
+        return None
+
+
+def iter_entries(lines):
+    '''
+    yields one dict per CSV row : date, meal, food, grams and the nutrient
+    fields present; rows without a valid date yield None
+    '''
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        raise NutritionImportError('empty file')
+    columns = header_columns(header)
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        cell = lambda field: row[columns[field]] if field in columns and columns[field] < len(row) else ''
+        day = _date(cell('date'))
+        if day is None:
+            yield None
+            continue
+        grams = GRAMS_RE.match(cell('amount'))
+        entry = {
+            'date': day,
+            'meal': cell('meal').strip()[:255] or 'Imported',
+            'food': cell('food').strip()[:255],
+            'grams': float(grams['grams']) if grams else None,
+        }
+        for field in nutrients.NUTRIENT_FIELDS:
+            if field in columns:
+                entry[field] = _number(cell(field))
+        yield entry
+
+
+# --- Loading ---
+
+class _Importer:
+    ''' ids of the days / meals / foods seen so far, and what was written '''
+
+    def __init__(self, user):
+        self.user = user
+        self.days = {}          # date -> day id
+        self.meals = {}         # (date, meal name) -> meal id
+        self.foods = {}         # lowercase name -> (food id, grams unit id) or None
+        self.touched = set()    # day ids given new items
+        self.stats = {'rows': 0, 'skipped': 0, 'matched': 0, 'meals': 0}
+
+    def _resolve_days(self, dates):
+        missing = sorted(set(dates) - self.days.keys())
+        if missing:
+            found = DayRange.of_dates(self.user, missing)
+            self.days.update((day, found[day].pk) for day in missing)
+
+    def _resolve_meals(self, keys):
+        missing = list(dict.fromkeys(key for key in keys if key not in self.meals))
+        if missing:
+            meals = Meal.objects.bulk_create([
+                Meal(day_id=self.days[day], name=name) for day, name in missing
+            ])
+            self.meals.update(zip(missing, (meal.pk for meal in meals)))
+            self.stats['meals'] += len(meals)
+
+    def _resolve_foods(self, names):
+        missing = {name.lower() for name in names if name} - self.foods.keys()
+        if not missing:
+            return
+        found = dict(Food.objects.available_to_user(self.user)
+                     .annotate(lname=Lower('name')).filter(lname__in=missing)
+                     .order_by('-pk').values_list('lname', 'pk'))   # the oldest food wins
+        grams = dict(FoodUnit.objects.filter(food_id__in=found.values(), gram_weight=1,
+                                             creator__isnull=True)
+                     .values_list('food_id', 'pk'))
+        for name in missing:
+            food_id = found.get(name)
+            self.foods[name] = (food_id, grams[food_id]) if food_id in grams else None
+
+    def _item(self, entry):
+        meal_id = self.meals[(entry['date'], entry['meal'])]
+        match = self.foods.get(entry['food'].lower())
+        if match and entry['grams']:
+            self.stats['matched'] += 1
+            food_id, unit_id = match
+            return MealConsumption(meal_id=meal_id, food_id=food_id,
+                                   unit_id=unit_id, amount=entry['grams'])
+        values = {
+            field: round(value) if field in INTEGER_FIELDS else value
+            for field, value in entry.items()
+            if field in nutrients.NUTRIENT_INDEX and value is not None
+        }
+        if not values:
+            return None     # an unknown food without nutrients
+        return MealConsumption(meal_id=meal_id, description=entry['food'] or entry['meal'],
+                               **values)
+
+    def load_chunk(self, entries):
+        with transaction.atomic():
+            self._resolve_days(entry['date'] for entry in entries)
+            self._resolve_meals((entry['date'], entry['meal']) for entry in entries)
+            self._resolve_foods(entry['food'] for entry in entries)
+            items = [item for item in map(self._item, entries) if item is not None]
+            MealConsumption.objects.bulk_create(items)
+        self.touched.update(self.days[entry['date']] for entry in entries)
+        self.stats['rows'] += len(items)
+        self.stats['skipped'] += len(entries) - len(items)
+
+    def finish(self, chunk_size):
+        ''' the derived rows the MealConsumption signals would have kept up '''
+        touched = sorted(self.touched)
+        for i in range(0, len(touched), chunk_size):
+            day_ids = touched[i:i + chunk_size]
+            with transaction.atomic():
+                totals = DailyNutrientTotals.objects.rebuild_days(day_ids)
+                days = list(Day.objects.filter(pk__in=day_ids))
+                for day in days:
+                    consumed = nutrients.to_dict(totals[day.pk])
+                    day.calories_consumed = round(consumed['calories'])
+                    day.protein_consumed = round(consumed['protein'])
+                    day.entered_meal = True
+                Day.objects.bulk_update(
+                    days, ['calories_consumed', 'protein_consumed', 'entered_meal']
+                )
+        if touched:
+            streaks.rebuild(self.user.pk)
+            timeseries.invalidate(self.user.pk)
+            fragments.bump(self.user.pk, 'meals')
+        self.stats['days'] = len(touched)
+        return self.stats
+
+
+def import_history(user, lines, chunk_size=CHUNK_SIZE):
+    '''
+    load a CSV export (any iterable of text lines : an open file, a decoded
+    upload) into user's days; returns counts of rows, skipped rows, matched
+    foods, meals and days
+    '''
+    importer = _Importer(user)
+    chunk = []
+    for entry in iter_entries(lines):
+        if entry is None:
+            importer.stats['skipped'] += 1
+            continue
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            importer.load_chunk(chunk)
+            chunk = []
+    if chunk:
+        importer.load_chunk(chunk)
+    return importer.finish(chunk_size)
@@ -0,0 +1,232 @@
+'''
+ Food name search : a real index instead of name__icontains scans.
+
+ sqlite     : contentless FTS5 table calcounter_food_fts kept in step by
+              triggers, prefix queries ("chick"* "brea"*)
+ postgresql : GIN index on to_tsvector('simple', name) for prefix tsqueries,
+              lower(name) pattern index for starts-with, pg_trgm GIN index
+              for a typo-tolerant fallback
+ other      : name__icontains
+
+ Ranking, best first:
+   1. the user's own foods (merged in from a small owner-indexed query)
+   2. name starts with the first query word : USDA names lead with the
+      food ("Chicken, breast, raw"), so "chicken breast" beats "Soup, chicken"
+   3. shorter names (fewer extra words -> closer match)
+
+ sqlite stores rank in the FTS rowid : (length(name) << 32) + food id, so
+ "ORDER BY rowid LIMIT n" streams matches already ranked and stops after n
+ instead of scoring every row a broad prefix like "ch" hits.
+'''
+import re
+from collections import namedtuple
+from django.db import connection
+
+from core import typeahead
+from .models import Food
+
+FTS_TABLE = 'calcounter_food_fts'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+ID_MASK = 0xFFFFFFFF
+_KEY = "(length(coalesce({row}.name, '')) << 32) + {row}.id"
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"name, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON calcounter_food BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES ({_KEY.format(row='new')}, new.name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON calcounter_food BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) "
+    f"VALUES ('delete', {_KEY.format(row='old')}, old.name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name ON calcounter_food BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) "
+    f"VALUES ('delete', {_KEY.format(row='old')}, old.name); "
+    f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES ({_KEY.format(row='new')}, new.name); END",
+    # (re)index existing rows
+    f"DELETE FROM {FTS_TABLE}",
+    f"INSERT INTO {FTS_TABLE}(rowid, name) "
+    f"SELECT {_KEY.format(row='calcounter_food')}, name FROM calcounter_food",
+]
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS calcounter_food_name_tsv ON calcounter_food "
+    "USING GIN (to_tsvector('simple', coalesce(name, '')))",
+    "CREATE INDEX IF NOT EXISTS calcounter_food_name_trgm ON calcounter_food "
+    "USING GIN (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS calcounter_food_name_prefix ON calcounter_food "
+    "(lower(name) text_pattern_ops)",
+]
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS calcounter_food_name_prefix",
+    "DROP INDEX IF EXISTS calcounter_food_name_tsv",
+    "DROP INDEX IF EXISTS calcounter_food_name_trgm",
+]
+
+
+# --- Index management (used by migrations) ---
+
+def install_index(schema_editor):
+    ''' create (or re-create after a table rebuild) the search index; idempotent '''
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+# --- Querying ---
+
+def tokenize(query):
+    return [t.lower() for t in TOKEN_RE.findall(query or '')]
+
+
+def _filters(data_types, alias='f'):
+    ''' WHERE clauses for the global catalog : active, unowned, data type '''
+    clauses = [f"{alias}.is_active", f"{alias}.owner_id IS NULL"]
+    params = []
+    if data_types:
+        clauses.append(f"{alias}.data_type IN ({', '.join(['%s'] * len(data_types))})")
+        params.extend(data_types)
+    return ' AND '.join(clauses), params
+
+
+def _sqlite_ids(tokens, data_types, limit):
+    where, params = _filters(data_types)
+    sql = (
+        f"SELECT f.id FROM {FTS_TABLE} "
+        f"JOIN calcounter_food f ON f.id = ({FTS_TABLE}.rowid & {ID_MASK}) "
+        f"WHERE {FTS_TABLE} MATCH %s AND {where} "
+        f"ORDER BY {FTS_TABLE}.rowid LIMIT %s"
+    )
+    rest = ' '.join(f'"{t}"*' for t in tokens[1:])
+    starts_with = f'^"{tokens[0]}"* {rest}'.strip()
+    anywhere = ' '.join(f'"{t}"*' for t in tokens)
+    ids = []
+    with connection.cursor() as cursor:
+        for match in (starts_with, anywhere):
+            cursor.execute(sql, [match, *params, limit + len(ids)])
+            ids += [i for (i,) in cursor.fetchall() if i not in ids]
+            if len(ids) >= limit:
+                break
+    return ids[:limit]
+
+
+def _postgres_ids(tokens, data_types, limit):
+    where, params = _filters(data_types)
+    tsquery = ' & '.join(f"{t}:*" for t in tokens)
+    vector = "to_tsvector('simple', coalesce(f.name, ''))"
+    starts_with = (
+        f"SELECT f.id FROM calcounter_food f "
+        f"WHERE lower(f.name) LIKE %s AND {vector} @@ to_tsquery('simple', %s) AND {where} "
+        f"ORDER BY length(f.name) LIMIT %s"
+    )
+    anywhere = (
+        f"SELECT f.id FROM calcounter_food f "
+        f"WHERE {vector} @@ to_tsquery('simple', %s) AND {where} "
+        f"ORDER BY length(f.name) LIMIT %s"
+    )
+    fuzzy = (
+        f"SELECT f.id FROM calcounter_food f "
+        f"WHERE f.name %% %s AND {where} "  # pg_trgm similarity operator
+        f"ORDER BY similarity(f.name, %s) DESC LIMIT %s"
+    )
+    ids = []
+    with connection.cursor() as cursor:
+        cursor.execute(starts_with, [f'{tokens[0]}%', tsquery, *params, limit])
+        ids += [i for (i,) in cursor.fetchall()]
+        if len(ids) < limit:
+            cursor.execute(anywhere, [tsquery, *params, limit + len(ids)])
+            ids += [i for (i,) in cursor.fetchall() if i not in ids]
+        if not ids:  # typo : fall back to trigram similarity
+            raw = ' '.join(tokens)
+            cursor.execute(fuzzy, [raw, *params, raw, limit])
+            ids = [i for (i,) in cursor.fetchall()]
+    return ids[:limit]
+
+
+def _fallback_ids(tokens, data_types, limit):
+    foods = Food.objects.filter(is_active=True, owner__isnull=True)
+    if data_types:
+        foods = foods.filter(data_type__in=data_types)
+    for token in tokens:
+        foods = foods.filter(name__icontains=token)
+    return list(foods.order_by('name').values_list('id', flat=True)[:limit])
+
+
+def _owned_ids(tokens, user, limit):
+    ''' the user's own foods : few rows, found through the owner index '''
+    foods = Food.objects.filter(owner=user, is_active=True)
+    for token in tokens:
+        foods = foods.filter(name__icontains=token)
+    rows = foods.values_list('id', 'name')[:200]
+    ranked = sorted(rows, key=lambda r: (not (r[1] or '').lower().startswith(tokens[0]),
+                                         len(r[1] or '')))
+    return [i for i, _ in ranked[:limit]]
+
+
+BACKENDS = {
+    'sqlite': _sqlite_ids,
+    'postgresql': _postgres_ids,
+}
+
+
+def search_ids(query, user=None, data_types=None, limit=20):
+    ''' ranked Food ids matching every word of `query` as a prefix '''
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    ids = _owned_ids(tokens, user, limit) if user is not None else []
+    if len(ids) < limit:
+        backend = BACKENDS.get(connection.vendor, _fallback_ids)
+        ids += backend(tokens, list(data_types or []), limit - len(ids))
+    return ids
+
+
+def search_foods(query, user=None, data_types=None, limit=20):
+    ''' ranked Food objects (global catalog + the user's own foods) '''
+    ids = search_ids(query, user, data_types, limit)
+    foods = Food.objects.in_bulk(ids)
+    return [foods[i] for i in ids if i in foods]
+
+
+# --- In-process typeahead (core.typeahead) ---
+
+FoodEntry = namedtuple('FoodEntry', ['id', 'name'])
+
+
+def _global_food_rows():
+    rows = (Food.objects.filter(owner__isnull=True, is_active=True)
+            .values_list('id', 'name').iterator(chunk_size=5000))
+    return [(FoodEntry(pk, name), name) for pk, name in rows]
+
+
+# one entry updated by core.signals per global Food save/delete, invalidated after import_fdc
+food_index = typeahead.LazyIndex('food', _global_food_rows)
+
+
+def typeahead_foods(query, user, limit=20):
+    ''' catalog prefix matches from memory with the user's own foods overlaid first '''
+    if not tokenize(query):
+        return []
+    owned = typeahead.PrefixIndex(
+        (FoodEntry(pk, name), name) for pk, name in
+        Food.objects.filter(owner=user, is_active=True).values_list('id', 'name')
+    )
+    results = owned.search(query, limit=limit)
+    if len(results) < limit:
+        results += food_index.search(query, limit=limit - len(results))
+    return results
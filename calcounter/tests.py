@@ -1,8 +1,25 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
-from calcounter.models import Food, FoodUnit, Ingredient, Meal, MealConsumption
+from calcounter.models import Food, FoodUnit, Ingredient, Meal, MealConsumption, DailyNutrientTotals
+from calcounter import composites, meal_templates, nutrients, search, usda
+from calcounter.usda_stub import UsdaStub
+from calcounter.management.commands.import_fdc import iter_json_foods
+from core import fragments
 from core.models import Day
+from graphs import timeseries
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from unittest import mock
 from datetime import date
+from io import StringIO
+from pathlib import Path
+import numpy as np
+import json
+import tempfile
 
 
 # ==============================================================================
@@ -264,6 +281,91 @@ class ComplexFoodConsumptionTest(TestCase):
         self.assertAlmostEqual(result['calories'], mashed_cals + apple_cals, places=0)
 
 
+# ==============================================================================
+# Composite foods — ingredient DAG recomputed in topological order
+# ==============================================================================
+
+class CompositeFoodTest(TestCase):
+    """Editing an ingredient refreshes every composite above it; cycles are rejected."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('dana', password='testpass')
+        self.butter = Food.objects.create(name="Butter", calories=700, protein=1, fat=80, carb=0,
+                                          calcium=24.0)
+        self.potato = Food.objects.create(name="Potato", calories=80, protein=2, fat=0, carb=18,
+                                          calcium=12.0)
+        self.beef = Food.objects.create(name="Beef", calories=250, protein=26, fat=15, carb=0)
+        self.tbsp = FoodUnit.objects.create(food=self.butter, name="tbsp", gram_weight=10.0)
+        self.grams = {food.pk: FoodUnit.objects.create(food=food, name="grams", gram_weight=1.0)
+                      for food in (self.potato, self.beef)}
+        self.mashed = Food.objects.create(name="Mashed Potato", owner=self.user)
+        self.pie = Food.objects.create(name="Shepherd's Pie", owner=self.user)
+        self._use(self.mashed, self.butter, 2, self.tbsp)         # 20g
+        self._use(self.mashed, self.potato, 180, self.grams[self.potato.pk])
+        self.mashed_grams = FoodUnit.objects.create(food=self.mashed, name="grams", gram_weight=1.0)
+        self._use(self.pie, self.mashed, 200, self.mashed_grams)
+        self._use(self.pie, self.beef, 200, self.grams[self.beef.pk])
+        composites.recompute([self.mashed.pk, self.pie.pk])
+
+    def _use(self, composite, food, amount, unit):
+        return Ingredient.objects.create(complex_food=composite, ingredient=food,
+                                         amount=amount, unit=unit)
+
+    def _food(self, food):
+        return Food.objects.get(pk=food.pk)
+
+    def test_composites_are_normalized_to_100g(self):
+        mashed = self._food(self.mashed)
+        self.assertEqual(mashed.calories, round((700 * 20 + 80 * 180) / 200))   # 142
+        self.assertAlmostEqual(mashed.calcium, (24 * 20 + 12 * 180) / 200)
+        pie = self._food(self.pie)
+        self.assertEqual(pie.calories, round((142 * 200 + 250 * 200) / 400))
+        prepared = FoodUnit.objects.get(food=self.pie, name=composites.PREPARED_UNIT)
+        self.assertEqual(float(prepared.gram_weight), 400.0)
+
+    def test_ingredient_edit_refreshes_every_level(self):
+        self.butter.calories = 900
+        with CaptureQueriesContext(connection) as queries:
+            self.butter.save()
+        self.assertLess(len(queries), 20)
+        mashed = self._food(self.mashed)
+        self.assertEqual(mashed.calories, round((900 * 20 + 80 * 180) / 200))  # 162
+        # the pie used the fresh mashed potato row, not the stale one
+        self.assertEqual(self._food(self.pie).calories, round((162 * 200 + 250 * 200) / 400))
+
+    def test_non_nutrient_save_skips_refresh(self):
+        with mock.patch.object(composites, 'refresh') as refresh:
+            self.butter.is_active = False
+            self.butter.save(update_fields=['is_active'])
+        refresh.assert_not_called()
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaises(composites.CompositeCycleError):
+            self._use(self.mashed, self.pie, 100, None)
+        with self.assertRaises(composites.CompositeCycleError):
+            self._use(self.pie, self.pie, 100, None)
+        # a cycle already in the data (written around the check) is reported too
+        Ingredient.objects.bulk_create([Ingredient(complex_food=self.mashed, ingredient=self.pie, amount=1)])
+        with self.assertRaises(composites.CompositeCycleError) as error:
+            composites.recompute([self.mashed.pk])
+        self.assertEqual(error.exception.food_ids, sorted([self.mashed.pk, self.pie.pk]))
+
+    def test_new_complex_food_view(self):
+        self.client.login(username='dana', password='testpass')
+        response = self.client.post(reverse('calcounter:complex_food'), {
+            'name': 'Buttered Potato',
+            'ingredient_set-TOTAL_FORMS': 2, 'ingredient_set-INITIAL_FORMS': 0,
+            'ingredient_set-0-ingredient': self.butter.pk, 'ingredient_set-0-amount': 1,
+            'ingredient_set-0-unit': self.tbsp.pk,
+            'ingredient_set-1-ingredient': self.potato.pk, 'ingredient_set-1-amount': 90,
+            'ingredient_set-1-unit': self.grams[self.potato.pk].pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        food = Food.objects.get(name='Buttered Potato', owner=self.user)
+        self.assertEqual(food.calories, round((700 * 10 + 80 * 90) / 100))
+        self.assertEqual(float(food.units.get(name=composites.PREPARED_UNIT).gram_weight), 100.0)
+
+
 # ==============================================================================
 # Food.to_formatted_dict() — USDA-style nutrient structure parsing
 # ==============================================================================
@@ -319,3 +421,751 @@ class FoodFormattedDictTest(TestCase):
         formatted = self.food.to_formatted_dict()
         self.assertAlmostEqual(nutrition['calories'], formatted['macros']['Energy']['value'])
         self.assertAlmostEqual(nutrition['calcium'], formatted['minerals']['Calcium, Ca']['value'])
+
+
+# ==============================================================================
+# Nutrient vectors — batched matrix scaling shared by foods, items and meals
+# ==============================================================================
+
+class NutrientVectorTest(TestCase):
+    """calcounter.nutrients batches scaling into one matrix pass per queryset."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('dave', password='testpass')
+        self.day = Day.objects.create(user=self.user, date=date(2025, 3, 1))
+        self.breakfast = Meal.objects.create(day=self.day, name="Breakfast")
+        self.lunch = Meal.objects.create(day=self.day, name="Lunch")
+        self.oats = Food.objects.create(
+            name="Oats", calories=389, protein=17, fat=7, carb=66, iron=4.7
+        )
+        self.cup = FoodUnit.objects.create(food=self.oats, name="cup", gram_weight=80.0)
+        MealConsumption.objects.create(
+            meal=self.breakfast, food=self.oats, amount=1.0, unit=self.cup
+        )
+        # Manual entry: stored values are used as-is
+        MealConsumption.objects.create(
+            meal=self.lunch, description="Sandwich", calories=450, protein=20, iron=2.0
+        )
+
+    def test_schema_order_matches_usda_groups(self):
+        from calcounter.utils import MACRO, MINERAL, VITAMIN
+        self.assertEqual(nutrients.N_NUTRIENTS, 19)
+        self.assertEqual(
+            [nutrients.FIELD_USDA[f] for f in nutrients.NUTRIENT_FIELDS],
+            MACRO + MINERAL + VITAMIN,
+        )
+
+    def test_food_vector_matches_fields(self):
+        vec = self.oats.as_vector()
+        self.assertEqual(vec[nutrients.NUTRIENT_INDEX['calories']], 389)
+        self.assertEqual(vec[nutrients.NUTRIENT_INDEX['vitamin_c']], 0)
+
+    def test_manual_item_vector_uses_stored_values(self):
+        item = self.lunch.items.get()
+        result = item.get_nutrition_consumed()
+        self.assertEqual(result['calories'], 450)
+        self.assertEqual(result['iron'], 2.0)
+
+    def test_grouped_totals_per_meal(self):
+        totals = nutrients.grouped_totals(
+            MealConsumption.objects.filter(meal__day=self.day), 'meal_id'
+        )
+        cal = nutrients.NUTRIENT_INDEX['calories']
+        self.assertAlmostEqual(totals[self.breakfast.id][cal], 389 * 0.8)
+        self.assertAlmostEqual(totals[self.lunch.id][cal], 450)
+
+    def test_day_totals_sum_food_and_manual_items(self):
+        totals = nutrients.to_dict(nutrients.consumption_totals(
+            MealConsumption.objects.filter(meal__day=self.day)
+        ))
+        self.assertAlmostEqual(totals['protein'], 17 * 0.8 + 20)
+        self.assertAlmostEqual(totals['iron'], 4.7 * 0.8 + 2.0)
+
+    def test_meal_totals_match_item_views(self):
+        expected = self.breakfast.items.get().get_nutrition_consumed()
+        result = self.breakfast.get_nutrients_consumed()
+        for key, value in expected.items():
+            self.assertAlmostEqual(result[key], value)
+
+    def test_packed_vector_follows_saves(self):
+        ids, matrix = Food.objects.filter(pk=self.oats.pk).nutrient_matrix()
+        self.assertEqual(ids.tolist(), [self.oats.pk])
+        np.testing.assert_allclose(matrix[0], self.oats.as_vector(), rtol=1e-6)
+        self.oats.protein = 16.9
+        self.oats.save(update_fields=['protein'])
+        _, matrix = Food.objects.filter(pk=self.oats.pk).nutrient_matrix()
+        self.assertAlmostEqual(matrix[0, nutrients.NUTRIENT_INDEX['protein']], 16.9, places=5)
+
+    def test_nutrient_matrix_reads_unpacked_rows_from_fields(self):
+        bulk, = Food.objects.bulk_create([Food(name="Bulk", calories=50, fat=1.5)])
+        ids, matrix = Food.objects.filter(pk__in=[self.oats.pk, bulk.pk]).order_by('-pk').nutrient_matrix()
+        self.assertEqual(ids.tolist(), [bulk.pk, self.oats.pk])
+        self.assertEqual(matrix[0, nutrients.NUTRIENT_INDEX['fat']], 1.5)
+        self.assertEqual(matrix[1, nutrients.NUTRIENT_INDEX['calories']], 389)
+        self.assertEqual(Food.objects.none().nutrient_matrix()[1].shape, (0, nutrients.N_NUTRIENTS))
+
+    def test_rda_vector_only_fills_minerals_and_vitamins(self):
+        rda = nutrients.rda_vector('Adult Male')
+        self.assertEqual(rda[nutrients.NUTRIENT_INDEX['calories']], 0)
+        self.assertEqual(rda[nutrients.NUTRIENT_INDEX['sodium']], 1500)
+        self.assertEqual(rda[nutrients.NUTRIENT_INDEX['vitamin_c']], 90)
+
+
+# ==============================================================================
+# DailyNutrientTotals — per-day row maintained with deltas by signals
+# ==============================================================================
+
+class DailyNutrientTotalsTest(TestCase):
+    """MealConsumption save/delete applies deltas to the day's materialized totals."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('erin', password='testpass')
+        self.day = Day.objects.create(user=self.user, date=date(2025, 4, 1))
+        self.meal = Meal.objects.create(day=self.day, name="Dinner")
+        self.salmon = Food.objects.create(
+            name="Salmon", calories=208, protein=20, fat=13, potassium=363.0, vitamin_d=11.0
+        )
+        self.grams = FoodUnit.objects.create(food=self.salmon, name="grams", gram_weight=1.0)
+
+    def _totals(self):
+        return DailyNutrientTotals.objects.get(day=self.day)
+
+    def test_new_item_adds_to_totals_and_day(self):
+        MealConsumption.objects.create(meal=self.meal, food=self.salmon, amount=200, unit=self.grams)
+        self.assertAlmostEqual(self._totals().potassium, 726.0)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.calories_consumed, 416)
+        self.assertEqual(self.day.protein_consumed, 40)
+
+    def test_edit_item_applies_difference(self):
+        item = MealConsumption.objects.create(
+            meal=self.meal, food=self.salmon, amount=200, unit=self.grams
+        )
+        item.amount = 50
+        item.save()
+        self.assertAlmostEqual(self._totals().calories, 104.0)
+        self.assertAlmostEqual(self._totals().vitamin_d, 5.5)
+
+    def test_delete_item_subtracts(self):
+        MealConsumption.objects.create(meal=self.meal, food=self.salmon, amount=100, unit=self.grams)
+        item = MealConsumption.objects.create(
+            meal=self.meal, description="Rice", calories=200, protein=4
+        )
+        item.delete()
+        self.assertAlmostEqual(self._totals().calories, 208.0)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.calories_consumed, 208)
+
+    def test_deleting_meal_zeroes_day(self):
+        MealConsumption.objects.create(meal=self.meal, food=self.salmon, amount=100, unit=self.grams)
+        self.meal.delete()
+        self.assertAlmostEqual(self._totals().calories, 0.0)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.calories_consumed, 0)
+
+    def test_deleting_day_or_user_with_meals(self):
+        MealConsumption.objects.create(meal=self.meal, food=self.salmon, amount=100, unit=self.grams)
+        self.day.delete()
+        self.assertFalse(DailyNutrientTotals.objects.exists())
+
+        day = Day.objects.create(user=self.user, date=date(2025, 4, 2))
+        meal = Meal.objects.create(day=day, name="Lunch")
+        MealConsumption.objects.create(meal=meal, food=self.salmon, amount=100, unit=self.grams)
+        self.user.delete()
+        self.assertFalse(Day.objects.exists())
+        self.assertFalse(DailyNutrientTotals.objects.exists())
+        connection.check_constraints()
+
+    def test_food_and_unit_edits_rebuild_consuming_days(self):
+        MealConsumption.objects.create(meal=self.meal, food=self.salmon, amount=200, unit=self.grams)
+        other = Day.objects.create(user=self.user, date=date(2025, 4, 2))
+        MealConsumption.objects.create(meal=Meal.objects.create(day=other, name="Lunch"),
+                                       food=self.salmon, amount=100, unit=self.grams)
+        salmon = Food.objects.get(pk=self.salmon.pk)
+        salmon.calories = 100
+        with self.captureOnCommitCallbacks(execute=True):     # one flush for both days
+            salmon.save()
+        self.assertAlmostEqual(self._totals().calories, 200.0)
+        self.assertEqual(Day.objects.get(pk=other.pk).calories_consumed, 100)
+
+        grams = FoodUnit.objects.get(pk=self.grams.pk)
+        grams.gram_weight = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            grams.save()
+        self.assertAlmostEqual(self._totals().calories, 400.0)
+        self.assertEqual(Day.objects.get(pk=self.day.pk).calories_consumed, 400)
+
+        with mock.patch.object(DailyNutrientTotals.objects, 'rebuild_days') as rebuild, \
+             self.captureOnCommitCallbacks(execute=True):
+            salmon.name = "Wild Salmon"
+            salmon.save()
+            grams.save()
+        rebuild.assert_not_called()
+
+    def test_breakdowns_read_materialized_row(self):
+        MealConsumption.objects.create(meal=self.meal, food=self.salmon, amount=100, unit=self.grams)
+        day = Day.objects.get(pk=self.day.pk)
+        with self.assertNumQueries(1):
+            self.assertAlmostEqual(day.mineral_breakdown['potassium'], 363.0)
+            self.assertAlmostEqual(day.vitamin_breakdown['D'], 11.0)
+
+    def test_missing_row_is_rebuilt_from_meals(self):
+        MealConsumption.objects.create(meal=self.meal, food=self.salmon, amount=100, unit=self.grams)
+        DailyNutrientTotals.objects.filter(day=self.day).delete()
+        day = Day.objects.get(pk=self.day.pk)
+        self.assertAlmostEqual(day.vitamin_breakdown['D'], 11.0)
+        self.assertTrue(DailyNutrientTotals.objects.filter(day=self.day).exists())
+
+
+# ==============================================================================
+# Meal templates — cloned with bulk_create and one DailyNutrientTotals delta
+# ==============================================================================
+
+class MealTemplateTest(TestCase):
+    """A saved meal is logged onto any day with a fixed number of queries."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('erin', password='testpass')
+        self.monday = Day.objects.create(user=self.user, date=date(2025, 3, 3))
+        self.tuesday = Day.objects.create(user=self.user, date=date(2025, 3, 4))
+        self.breakfast = Meal.objects.create(day=self.monday, name="Breakfast")
+        self.foods = []
+        for i in range(10):
+            food = Food.objects.create(name=f"Food {i}", calories=100 + i, protein=5, iron=0.5)
+            unit = FoodUnit.objects.create(food=food, name="grams", gram_weight=1.0)
+            MealConsumption.objects.create(meal=self.breakfast, food=food, amount=50, unit=unit)
+            self.foods.append(food)
+        MealConsumption.objects.create(meal=self.breakfast, description="Coffee", calories=5)
+
+    def test_save_copies_items_without_touching_days(self):
+        before = DailyNutrientTotals.objects.get(day=self.monday).calories
+        template = meal_templates.save(self.breakfast, self.user)
+        self.assertTrue(template.is_template)
+        self.assertIsNone(template.day)
+        self.assertEqual(str(template), f"Meal template: {self.breakfast.name} of {self.user.username}")
+        self.assertEqual(template.items.count(), 11)
+        self.assertEqual(template.items.get(food__isnull=True).calories, 5)
+        self.assertEqual(DailyNutrientTotals.objects.get(day=self.monday).calories, before)
+        self.assertEqual(list(meal_templates.for_user(self.user)), [template])
+
+    def test_log_applies_one_delta(self):
+        template = meal_templates.save(self.breakfast, self.user)
+        meal_templates.log(template, self.tuesday)     # first meal of the day : totals row built
+        # savepoint, meal, day owner, template items, one item bulk_create, totals delta + read,
+        # day read + macros update, release : 11 items, independent of their number
+        with self.assertNumQueries(10):
+            meal = meal_templates.log(template, self.tuesday)
+        self.assertEqual(meal.items.count(), 11)
+
+        expected = 2 * (sum((100 + i) * 0.5 for i in range(10)) + 5)
+        totals = DailyNutrientTotals.objects.get(day=self.tuesday)
+        self.assertAlmostEqual(totals.calories, expected)
+        self.assertAlmostEqual(totals.iron, 2 * 10 * 0.25)
+        self.assertEqual(Day.objects.get(pk=self.tuesday.pk).calories_consumed, round(expected))
+        # the delta matches a full re-sum of the day
+        rebuilt = DailyNutrientTotals.objects.rebuild(self.tuesday.pk)
+        self.assertAlmostEqual(rebuilt.calories, expected)
+
+    def test_log_and_delete_views(self):
+        template = meal_templates.save(self.breakfast, self.user)
+        self.client.login(username='erin', password='testpass')
+        response = self.client.get(reverse('calcounter:list_templates'))
+        self.assertContains(response, "BREAKFAST")
+        self.assertContains(response, "11 items")
+
+        response = self.client.post(reverse('calcounter:log_template', args=[template.id]),
+                                    {'selected_date': '2025-03-04'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.tuesday.meals.get().name, "Breakfast")
+
+        other = User.objects.create_user('mallory', password='testpass')
+        self.client.force_login(other)
+        response = self.client.post(reverse('calcounter:log_template', args=[template.id]),
+                                    {'selected_date': '2025-03-04'})
+        self.assertEqual(response.status_code, 404)
+
+        self.client.force_login(self.user)
+        self.client.delete(reverse('calcounter:delete_meal', args=[template.id]))
+        self.assertFalse(Meal.objects.filter(pk=template.pk).exists())
+
+
+# ==============================================================================
+# import_fdc — streaming FDC JSON / CSV downloads into the local mirror
+# ==============================================================================
+
+FDC_JSON_FOODS = [
+    {
+        "fdcId": 171077, "description": "Chicken, broiler, breast, raw", "dataType": "SR Legacy",
+        "foodNutrients": [
+            {"nutrient": {"number": "208", "name": "Energy", "unitName": "kcal"}, "amount": 120.0},
+            {"nutrient": {"number": "203", "name": "Protein", "unitName": "g"}, "amount": 22.5},
+            {"nutrient": {"number": "307", "name": "Sodium, Na", "unitName": "mg"}, "amount": 45.0},
+        ],
+        "foodPortions": [{"gramWeight": 118.0, "amount": 1, "modifier": "breast"}],
+    },
+    {
+        "fdcId": 2000001, "description": "Protein Bar", "dataType": "Branded", "brandOwner": "Acme",
+        "servingSize": 60,
+        "foodNutrients": [
+            {"nutrient": {"number": "203", "name": "Protein", "unitName": "g"}, "amount": 33.0},
+            {"nutrient": {"number": "204", "name": "Fat", "unitName": "g"}, "amount": 10.0},
+            {"nutrient": {"number": "205", "name": "Carbs", "unitName": "g"}, "amount": 40.0},
+            {"nutrient": {"number": "324", "name": "Vitamin D (IU)", "unitName": "IU"}, "amount": 400.0},
+        ],
+    },
+]
+
+
+class ImportFdcTest(TestCase):
+    """import_fdc streams downloads through parse_usda_nutrients into Food/FoodUnit."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.json_path = self.dir / 'foods.json'
+        self.json_path.write_text(json.dumps({"SRLegacyFoods": FDC_JSON_FOODS}, indent=2))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_json_stream_refills_buffer(self):
+        foods = list(iter_json_foods(self.json_path, read_size=64))
+        self.assertEqual([f["fdcId"] for f in foods], [171077, 2000001])
+
+    def test_json_import_creates_foods_and_units(self):
+        call_command('import_fdc', str(self.json_path), stdout=StringIO())
+        chicken = Food.objects.get(fdc_id="171077")
+        self.assertEqual(chicken.data_type, "SR Legacy")
+        self.assertEqual((chicken.calories, chicken.protein, chicken.sodium), (120, 22.5, 45.0))
+        self.assertEqual(set(chicken.units.values_list('name', flat=True)), {"grams", "1 breast"})
+
+        bar = Food.objects.get(fdc_id="2000001")
+        self.assertEqual(bar.brand, "Acme")
+        self.assertEqual(bar.calories, 33 * 4 + 10 * 9 + 40 * 4)  # Atwater fallback
+        self.assertAlmostEqual(bar.vitamin_d, 10.0)               # IU -> µg fallback
+        self.assertTrue(bar.units.filter(name="serving", gram_weight=60).exists())
+
+    def test_reimport_skips_existing(self):
+        call_command('import_fdc', str(self.json_path), stdout=StringIO())
+        out = StringIO()
+        call_command('import_fdc', str(self.json_path), stdout=out)
+        self.assertIn("imported 0 foods (2 already present)", out.getvalue())
+        self.assertEqual(Food.objects.count(), 2)
+
+    def test_import_moves_the_shared_typeahead_version(self):
+        search.food_index.get()
+        version = cache.get(search.food_index.version_key)
+        call_command('import_fdc', str(self.json_path), stdout=StringIO())
+        self.assertNotEqual(cache.get(search.food_index.version_key), version)
+
+    def test_reimport_flags_foods_already_present(self):
+        Food.objects.create(name="Chicken (API pick)", fdc_id="171077", calories=120)
+        out = StringIO()
+        call_command('import_fdc', str(self.json_path), stdout=out)
+        self.assertIn("imported 1 foods (1 already present)", out.getvalue())
+        picked = Food.objects.get(fdc_id="171077")
+        self.assertEqual((picked.fdc_mirror, picked.data_type), (True, "SR Legacy"))
+        self.assertEqual(Food.objects.filter(fdc_mirror=True).count(), 2)
+
+    def test_data_type_filter(self):
+        call_command('import_fdc', str(self.json_path), '--data-type', 'Branded', stdout=StringIO())
+        self.assertEqual(list(Food.objects.values_list('fdc_id', flat=True)), ["2000001"])
+
+    def test_csv_folder_import(self):
+        files = {
+            'nutrient.csv': 'id,name,unit_name,nutrient_nbr,rank\n'
+                            '1008,Energy,KCAL,208,300\n1003,Protein,G,203,600\n'
+                            '1104,Vitamin A IU,IU,318,7500\n1089,"Iron, Fe",MG,303,5400\n',
+            'food.csv': 'fdc_id,data_type,description,food_category_id,publication_date\n'
+                        '500,sr_legacy_food,"Egg, whole, raw",1,2019-04-01\n'
+                        '501,survey_fndds_food,Ignored,1,2019-04-01\n',
+            'food_nutrient.csv': 'id,fdc_id,nutrient_id,amount\n'
+                                 '1,500,1008,143\n2,500,1003,12.6\n3,500,1104,540\n'
+                                 '4,501,1008,999\n5,500,1089,1.75\n',
+            'food_portion.csv': 'id,fdc_id,seq_num,amount,measure_unit_id,portion_description,modifier,gram_weight\n'
+                                '1,500,1,1,9999,,large,50\n',
+        }
+        folder = self.dir / 'csv'
+        folder.mkdir()
+        for name, text in files.items():
+            (folder / name).write_text(text)
+
+        call_command('import_fdc', str(folder), stdout=StringIO())
+        egg = Food.objects.get(fdc_id="500")
+        self.assertEqual((egg.name, egg.calories), ("Egg, whole, raw", 143))
+        self.assertAlmostEqual(egg.protein, 12.6, places=5)
+        self.assertAlmostEqual(egg.iron, 1.75)
+        self.assertAlmostEqual(egg.vitamin_a, 162.0)
+        self.assertTrue(egg.units.filter(name="1.0 large", gram_weight=50).exists())
+        self.assertFalse(Food.objects.filter(fdc_id="501").exists())
+
+    def test_search_runs_against_local_mirror(self):
+        call_command('import_fdc', str(self.json_path), stdout=StringIO())
+        User.objects.create_user('searcher', password='testpass')
+        self.client.login(username='searcher', password='testpass')
+        response = self.client.get(reverse('calcounter:search_ingred'), {'query': 'chicken'})
+        self.assertContains(response, "CHICKEN, BROILER, BREAST, RAW")
+        self.assertNotContains(response, "PROTEIN BAR")
+        response = self.client.get(reverse('calcounter:search_ingred'), {'query': 'bar', 'branded': 'on'})
+        self.assertContains(response, "Acme")
+
+
+# ==============================================================================
+# import_nutrition — streaming other trackers' CSV exports into days and meals
+# ==============================================================================
+
+CRONOMETER_CSV = (
+    'Day,Time,Group,Food Name,Amount,Energy (kcal),Protein (g),Fat (g),Carbs (g),'
+    'Iron (mg),Vitamin D (IU)\n'
+    '2024-01-01,08:00,Breakfast,Oats,80.00 g,311,13.6,5.6,52.8,3.8,0\n'
+    '2024-01-01,08:00,Breakfast,"Coffee, brewed",1.00 cup,2,0.3,0,0,0,0\n'
+    '2024-01-01,12:30,Lunch,Mystery Stew,1.00 bowl,450,30,20,35,2.5,400\n'
+    'not a date,,Lunch,Oats,80 g,311,13.6,5.6,52.8,3.8,0\n'
+    '2024-01-02,08:00,Breakfast,oats,40 g,155,6.8,2.8,26.4,1.9,0\n'
+)
+
+MFP_CSV = (
+    'Date,Meal,Calories,Fat (g),Cholesterol,Sodium (mg),Carbohydrates (g),Protein (g),Vitamin C,Note\n'
+    '2024-02-10,Breakfast,420,12,0,300,50,25,10,\n'
+    '2024-02-10,Dinner,800.5,30,0,900,80,45,25,\n'
+)
+
+
+class NutritionImportTest(TestCase):
+    """import_nutrition bulk-loads history, then rebuilds the day totals once."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('frank', password='testpass')
+        self.oats = Food.objects.create(name="Oats", calories=389, protein=17, fat=7, carb=66, iron=4.7)
+        FoodUnit.objects.create(food=self.oats, name="grams", gram_weight=1.0)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'servings.csv'
+        self.path.write_text(CRONOMETER_CSV)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_command_matches_foods_and_rebuilds_totals(self):
+        out = StringIO()
+        call_command('import_nutrition', str(self.path), '--user', 'frank',
+                     '--chunk-size', 2, stdout=out)
+        self.assertIn("imported 4 entries into 3 meals over 2 days (2 matched to foods, 1 rows skipped)",
+                      out.getvalue())
+
+        day = Day.objects.get(user=self.user, date=date(2024, 1, 1))
+        breakfast = day.meals.get(name="Breakfast")
+        oats = breakfast.items.get(food=self.oats)
+        self.assertEqual((oats.amount, oats.unit.gram_weight), (80, 1))
+        coffee = breakfast.items.get(food__isnull=True)
+        self.assertEqual((coffee.description, coffee.calories), ("Coffee, brewed", 2))
+        stew = day.meals.get(name="Lunch").items.get()
+        self.assertIsNone(stew.vitamin_d)                       # IU column left out
+        self.assertEqual(stew.iron, 2.5)
+
+        totals = DailyNutrientTotals.objects.get(day=day)
+        self.assertAlmostEqual(totals.calories, 389 * 0.8 + 2 + 450)
+        self.assertEqual(day.calories_consumed, round(389 * 0.8 + 2 + 450))
+        self.assertTrue(day.entered_meal)
+        self.assertEqual(self.user.streak.longest, 2)
+
+    def test_import_invalidates_through_the_shared_cache(self):
+        # what a web worker reads after a CLI import : versions and keys in the default cache
+        meals = fragments.versions(self.user.pk, ['meals'])
+        cache.set(timeseries.CACHE_KEY.format(self.user.pk), 'stale series')
+        call_command('import_nutrition', str(self.path), '--user', 'frank', stdout=StringIO())
+        self.assertNotEqual(fragments.versions(self.user.pk, ['meals']), meals)
+        self.assertIsNone(cache.get(timeseries.CACHE_KEY.format(self.user.pk)))
+
+    def test_scattered_dates_create_only_their_days(self):
+        self.path.write_text(
+            'Date,Meal,Calories,Protein (g)\n'
+            '2015-01-01,Breakfast,300,20\n'
+            '2024-01-01,Dinner,700,40\n'
+        )
+        call_command('import_nutrition', str(self.path), '--user', 'frank', stdout=StringIO())
+        self.assertEqual(list(Day.objects.filter(user=self.user).order_by('date').values_list('date', flat=True)),
+                         [date(2015, 1, 1), date(2024, 1, 1)])
+
+    def test_upload_endpoint(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        self.client.login(username='frank', password='testpass')
+        upload = SimpleUploadedFile('mfp.csv', ('\ufeff' + MFP_CSV).encode(), content_type='text/csv')
+        response = self.client.post(reverse('calcounter:import_history'), {'history': upload})
+        self.assertContains(response, "Imported 2 entries into 2 meals over 1 days")
+        day = Day.objects.get(user=self.user, date=date(2024, 2, 10))
+        dinner = day.meals.get(name="Dinner").items.get()
+        self.assertEqual((dinner.description, dinner.calories, dinner.sodium), ("Dinner", 800, 900.0))
+        self.assertIsNone(dinner.cholesterol)                   # no unit : % DV in MFP exports
+        self.assertEqual(day.calories_consumed, 420 + 800)
+
+        upload = SimpleUploadedFile('bad.csv', b'Food,Calories\nOats,100\n', content_type='text/csv')
+        response = self.client.post(reverse('calcounter:import_history'), {'history': upload})
+        self.assertContains(response, "no Date / Day column", status_code=400)
+
+
+# ==============================================================================
+# Food search — FTS index, prefix matching, USDA word-order ranking
+# ==============================================================================
+
+class FoodSearchTest(TestCase):
+    """search.search_foods() ranks prefix matches and merges in the user's own foods."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('typer', password='testpass')
+        self.other = User.objects.create_user('other', password='testpass')
+        for name in ["Soup, chicken noodle, canned", "Chicken, breast, raw",
+                     "Chicken, broilers or fryers, breast, meat only, cooked, roasted",
+                     "Beef, ground, raw"]:
+            Food.objects.create(name=name, calories=100)
+
+    def names(self, query, **kwargs):
+        return [f.name for f in search.search_foods(query, **kwargs)]
+
+    def test_prefix_of_every_word(self):
+        self.assertEqual(self.names("chick brea"), [
+            "Chicken, breast, raw",
+            "Chicken, broilers or fryers, breast, meat only, cooked, roasted",
+        ])
+
+    def test_leading_word_ranks_first(self):
+        names = self.names("chicken")
+        self.assertEqual(names[-1], "Soup, chicken noodle, canned")
+        self.assertEqual(names[0], "Chicken, breast, raw")
+
+    def test_own_foods_merged_first_and_private(self):
+        Food.objects.create(name="Chicken burrito bowl", owner=self.user, calories=600)
+        Food.objects.create(name="Chicken secret recipe", owner=self.other, calories=600)
+        names = self.names("chicken", user=self.user)
+        self.assertEqual(names[0], "Chicken burrito bowl")
+        self.assertNotIn("Chicken secret recipe", names)
+        self.assertNotIn("Chicken burrito bowl", self.names("chicken"))
+
+    def test_index_follows_renames_deletes_and_inactive(self):
+        beef = Food.objects.get(name="Beef, ground, raw")
+        beef.name = "Bison, ground, raw"
+        beef.save()
+        self.assertEqual(self.names("beef"), [])
+        self.assertEqual(self.names("bis"), ["Bison, ground, raw"])
+        beef.is_active = False
+        beef.save()
+        self.assertEqual(self.names("bis"), [])
+        beef.delete()
+        self.assertEqual(self.names("bis"), [])
+
+    def test_punctuation_and_empty_queries(self):
+        self.assertEqual(self.names('"chicken, raw'), ["Chicken, breast, raw"])
+        self.assertEqual(self.names("  "), [])
+
+    def test_typeahead_uses_index(self):
+        self.client.login(username='typer', password='testpass')
+        response = self.client.get(reverse('calcounter:typeahead_foods'), {'q': 'soup chi'})
+        self.assertContains(response, "Soup, chicken noodle, canned")
+        self.assertNotContains(response, "Chicken, breast, raw")
+
+
+# ==============================================================================
+# Typeahead — in-process prefix index over the global catalog
+# ==============================================================================
+
+class FoodTypeaheadIndexTest(TestCase):
+    """search.typeahead_foods() answers from memory and follows Food saves."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('typer', password='testpass')
+        for name in ["Soup, chicken noodle, canned", "Chicken, breast, raw", "Beef, ground, raw"]:
+            Food.objects.create(name=name, calories=100)
+        search.food_index.invalidate()
+
+    def names(self, query):
+        return [f.name for f in search.typeahead_foods(query, self.user)]
+
+    def test_ranked_like_the_database_search(self):
+        self.assertEqual(self.names("chick"), [f.name for f in search.search_foods("chick")])
+        self.assertEqual(self.names("chick brea"), ["Chicken, breast, raw"])
+        self.assertEqual(self.names(" "), [])
+
+    def test_global_lookup_is_served_from_memory(self):
+        self.names("beef")  # build
+        with self.assertNumQueries(1):  # the user's own foods only
+            self.assertEqual(self.names("beef"), ["Beef, ground, raw"])
+
+    def test_save_and_delete_invalidate(self):
+        self.names("beef")
+        beef = Food.objects.get(name="Beef, ground, raw")
+        beef.name = "Bison, ground, raw"
+        beef.save()
+        self.assertEqual(self.names("bis"), ["Bison, ground, raw"])
+        beef.delete()
+        self.assertEqual(self.names("bis"), [])
+
+    def test_save_updates_one_entry_without_a_rebuild(self):
+        self.names("beef")
+        with mock.patch.object(search.food_index, 'loader') as loader, self.assertNumQueries(2):
+            Food.objects.create(name="Beef jerky", calories=400)
+            self.assertEqual(self.names("beef"), ["Beef jerky", "Beef, ground, raw"])
+        loader.assert_not_called()
+
+    def test_other_workers_rebuild_in_the_background(self):
+        self.names("beef")
+        rebuilds = []
+        with mock.patch('core.typeahead._in_background', rebuilds.append):
+            Food.objects.filter(name="Beef, ground, raw").update(name="Bison, ground, raw")
+            search.food_index._bump()    # another worker's write
+            self.assertEqual(self.names("bis"), [])     # served stale meanwhile
+            self.assertEqual(self.names("bis"), [])
+            self.assertEqual(len(rebuilds), 1)
+            rebuilds[0]()
+        self.assertEqual(self.names("bis"), ["Bison, ground, raw"])
+
+    def test_own_foods_overlaid_first(self):
+        self.names("chicken")
+        Food.objects.create(name="Chicken burrito bowl", owner=self.user, calories=600)
+        self.assertEqual(self.names("chicken")[0], "Chicken burrito bowl")
+        other = User.objects.create_user('other', password='testpass')
+        self.assertNotIn("Chicken burrito bowl",
+                         [f.name for f in search.typeahead_foods("chicken", other)])
+
+
+# ==============================================================================
+# USDA API cache — normalized keys, negative caching, stale-while-revalidate
+# ==============================================================================
+
+def usda_food(fdc_id, description, data_type="SR Legacy"):
+    return {"fdcId": fdc_id, "description": description, "dataType": data_type,
+            "foodNutrients": [{"nutrient": {"number": "208", "name": "Energy", "unitName": "kcal"},
+                               "amount": 100.0}]}
+
+
+class UsdaStubTestCase(TestCase):
+    """Runs calcounter.usda against a local calcounter.usda_stub server."""
+
+    def setUp(self):
+        usda.usda_cache().clear()
+        self.stub = self.enterContext(UsdaStub(foods={
+            1: usda_food(1, "Chicken, breast, raw"),
+            5: usda_food(5, "Oats"),
+            7: usda_food(7, "Rice"),
+        }))
+        self.enterContext(override_settings(USDA_API={'ROOT': self.stub.url, 'BACKOFF': 0}))
+
+
+class UsdaCacheTest(UsdaStubTestCase):
+    """calcounter.usda serves repeated lookups from the `usda` cache."""
+
+    def test_normalized_query_is_fetched_once(self):
+        first = usda.search_foods("Chicken  Breast", ["SR Legacy", "Foundation"])
+        second = usda.search_foods(" chicken breast", ["Foundation", "SR Legacy"])
+        self.assertEqual([f["fdcId"] for f in first], [1])
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.stub.requests), 1)
+        usda.search_foods("chicken breast", ["Branded"])
+        self.assertEqual(len(self.stub.requests), 2)
+        counts = usda.stats()
+        self.assertEqual((counts['hit'], counts['miss']), (1, 2))
+
+    def test_empty_results_and_unknown_ids_are_cached(self):
+        self.assertEqual(usda.search_foods("zzqx", ["Branded"]), [])
+        self.assertEqual(usda.search_foods("zzqx", ["Branded"]), [])
+        self.assertEqual(usda.get_food(999), {})
+        self.assertEqual(usda.get_food(999), {})
+        self.assertEqual(len(self.stub.requests), 3)  # search + full/abridged pair
+        self.assertEqual(usda.stats()['negative'], 2)
+
+    def test_errors_are_not_cached(self):
+        self.stub.fail = [400]
+        with self.assertRaises(usda.UsdaError):
+            usda.search_foods("oats", ["SR Legacy"])
+        self.assertEqual(usda.search_foods("oats", ["SR Legacy"])[0]["description"], "Oats")
+        self.assertEqual(usda.stats()['error'], 1)
+
+    @override_settings(USDA_CACHE={'TTL': 0})
+    @mock.patch('calcounter.usda._in_background', lambda fn: fn())
+    def test_stale_entry_served_while_refreshing(self):
+        usda.get_food(7)
+        self.stub.foods[7] = usda_food(7, "Rice, white")
+        self.assertEqual(usda.get_food(7)["description"], "Rice")  # stale copy, refreshed
+        self.assertEqual(usda.get_food(7)["description"], "Rice, white")
+        # a failed refresh keeps the stale copy
+        self.stub.fail = [400, 400]
+        self.assertEqual(usda.get_food(7)["description"], "Rice, white")
+        self.assertEqual(usda.stats()['stale'], 3)
+
+    def test_api_picks_do_not_switch_search_to_the_mirror(self):
+        User.objects.create_user('picker', password='testpass')
+        self.client.login(username='picker', password='testpass')
+        search_url = reverse('calcounter:search_ingred')
+        self.client.get(reverse('calcounter:get_ingred', args=[5]))
+        self.assertEqual(Food.objects.get(fdc_id="5").data_type, "")
+        self.assertContains(self.client.get(search_url, {'query': 'chicken'}), "CHICKEN, BREAST, RAW")
+
+        Food.objects.create(name="Chicken thigh", fdc_id="9", data_type="SR Legacy",
+                            fdc_mirror=True, calories=180)
+        sent = len(self.stub.requests)
+        response = self.client.get(search_url, {'query': 'chicken'})
+        self.assertContains(response, "CHICKEN THIGH")
+        self.assertEqual(len(self.stub.requests), sent)                 # the mirror answered
+        self.assertContains(self.client.get(search_url, {'query': 'rice'}), "RICE")
+        self.assertEqual(len(self.stub.requests), sent + 1)             # not in it : the API
+
+    def test_food_view_uses_cache(self):
+        User.objects.create_user('cook', password='testpass')
+        self.client.login(username='cook', password='testpass')
+        url = reverse('calcounter:get_ingred', args=[123])
+        self.assertContains(self.client.get(url), "No food found")
+        self.assertContains(self.client.get(url), "No food found")
+        self.assertEqual(len(self.stub.requests), 2)  # full + abridged, once
+
+
+# ==============================================================================
+# USDA client — retries, abridged fallback, batched fdcIds
+# ==============================================================================
+
+class UsdaClientTest(UsdaStubTestCase):
+    """usda_client retries transient failures and batches fdcId lookups."""
+
+    def test_retries_transient_errors_only(self):
+        self.stub.fail = [503, 429]
+        self.assertEqual(usda.get_food(5)["description"], "Oats")
+        self.stub.fail = [503, 503, 503, 503, 503, 503]
+        usda.usda_cache().clear()
+        with self.assertRaises(usda.UsdaError):
+            usda.get_food(5)
+
+    def test_abridged_record_used_when_full_is_missing(self):
+        self.stub.abridged[42] = usda_food(42, "Granola bar", "Branded")
+        self.assertEqual(usda.get_food(42)["description"], "Granola bar")
+        self.stub.abridged[1] = usda_food(1, "Chicken (abridged)")
+        self.assertEqual(usda.get_food(1)["description"], "Chicken, breast, raw")
+
+    def test_batch_asks_abridged_only_for_missing_ids(self):
+        usda.get_food(1)  # cached already
+        foods = usda.get_foods([1, 5, 7, 999, 5])
+        self.assertEqual(list(foods), [1, 5, 7, 999])
+        self.assertEqual(foods[999], {})
+        self.assertEqual(foods[7]["description"], "Rice")
+        batch = [(body['format'], body['fdcIds']) for method, _, body in self.stub.requests[1:]]
+        self.assertEqual(batch, [('full', [5, 7, 999]), ('abridged', [999])])
+        self.assertEqual(usda.get_foods([5, 7, 999]), {5: foods[5], 7: foods[7], 999: {}})
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_full_records_need_one_request(self):
+        self.assertEqual(usda.get_food(5)["description"], "Oats")
+        self.assertEqual([body['format'] for _, _, body in self.stub.requests], ['full'])
+
+    def test_import_fdc_fetches_ids_in_one_batch(self):
+        Food.objects.create(name="Oats", fdc_id="5", calories=100)
+        out = StringIO()
+        call_command('import_fdc', '--fdc-id', '5', '--fdc-id', '7', '--fdc-id', '1',
+                     '--fdc-id', '999', stdout=out)
+        self.assertIn('imported 2 foods (1 already present)', out.getvalue())
+        self.assertIn('unknown fdcIds: 999', out.getvalue())
+        self.assertEqual([(body['format'], body['fdcIds']) for _, _, body in self.stub.requests],
+                         [('full', [7, 1, 999]), ('abridged', [999])])
+        rice = Food.objects.get(fdc_id="7")
+        self.assertEqual((rice.name, rice.calories), ("Rice", 100))
+        self.assertTrue(rice.units.filter(name="grams", gram_weight=1).exists())
+
+    def test_client_reuses_one_session(self):
+        from calcounter.usda_client import get_client
+        self.assertIs(get_client(), get_client())
+        self.assertEqual(get_client().root, self.stub.url)
@@ -7,6 +7,7 @@ urlpatterns = [
     path("list/meal/", views.list_meals, name="list_m"),
     path("list/food/<str:action>/", views.list_foods, name="list_f"),
     path("list/recipes/", views.list_recipes, name="list_recipes"),
+    path("list/meal/templates/", views.list_meal_templates, name="list_templates"),
     path("list/recipe/", views.get_recipe_area, name="recipe_area"),
 
     path("food/button/", views.get_food_input, name="food_input"),
@@ -16,11 +17,14 @@ urlpatterns = [
     path("add/meal/", views.add_meal, name="add"),
     path("add/meal/row/", views.add_meal_row, name="add_meal_row"),
     path("add/meal/manualrow/", views.add_manual_meal_row, name="add_manual_meal_row"),
+    path("add/meal/template/<int:template_id>/", views.log_meal_template, name="log_template"),
+    path("add/template/<int:meal_id>/", views.save_meal_template, name="save_template"),
     path("add/meal/buttons/", views.get_type_of_input, name="add_buttons"),
     path("add/meal/ingred/search/", views.get_search_area, name="ingred_search"),
     path("add/food/search/", views.new_search_food, name="search_food"),
     path("add/food/complex/", views.new_complex_food, name="complex_food"),
     path("add/<int:food_id>/", views.add_pantry_food, name="add_p"),
+    path("import/", views.import_nutrition_history, name="import_history"),
 
     path("search/ingred/", views.query_ingredient, name="search_ingred"),
     path("search/ingred/<int:fdcId>/",
@@ -0,0 +1,184 @@
+'''
+ USDA FoodData Central API access, cached (HTTP goes through usda_client).
+
+ Every lookup goes through cached(), which keeps responses in the `usda`
+ cache (settings.CACHES : any Django backend, e.g. locmem, file-based or a
+ database table, so no Redis is needed) under a normalized key:
+
+   usda:search:<digest of query + data types + page size>
+   usda:food:<fdcId>       (full record, or the abridged one when that's all USDA has)
+
+ Entries are {'value', 'empty', 'fresh_until'} envelopes stored for STALE_TTL:
+   fresh   -> served from cache
+   stale   -> served from cache while one background thread refetches it
+   missing -> fetched inline
+ Empty searches and unknown fdcIds (404) are cached for NEGATIVE_TTL so the
+ same miss is not sent again on every keystroke. Errors are never cached.
+
+ Hit / stale / negative / miss / error counters live in the same cache and
+ are shown by `manage.py usda_cache`.
+'''
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .usda_client import UsdaError, get_client
+
+DEFAULTS = {
+    'TTL': 60 * 60 * 24,                # fresh for a day
+    'STALE_TTL': 60 * 60 * 24 * 30,     # served stale (and refreshed) for a month
+    'NEGATIVE_TTL': 60 * 60,            # empty results / 404s
+    'REFRESH_LOCK': 60,                 # seconds one worker owns a refresh
+}
+COUNTERS = ('hit', 'stale', 'negative', 'miss', 'error')
+
+
+def setting(name):
+    return getattr(settings, 'USDA_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def usda_cache():
+    return caches['usda']
+
+
+# --- Counters ---
+
+def _count(name, n=1):
+    key = f'usda:stats:{name}'
+    cache = usda_cache()
+    try:
+        cache.incr(key, n)
+    except ValueError:
+        cache.set(key, n, None)
+
+
+def stats():
+    ''' {counter: n} plus hit_rate (fresh + stale + negative over all lookups) '''
+    cache = usda_cache()
+    values = cache.get_many([f'usda:stats:{name}' for name in COUNTERS])
+    counts = {name: values.get(f'usda:stats:{name}', 0) for name in COUNTERS}
+    served = counts['hit'] + counts['stale'] + counts['negative']
+    lookups = served + counts['miss']
+    counts['hit_rate'] = served / lookups if lookups else 0.0
+    return counts
+
+
+def reset_stats():
+    usda_cache().delete_many([f'usda:stats:{name}' for name in COUNTERS])
+
+
+# --- Cache ---
+
+def _store(key, value):
+    empty = not value
+    fresh = setting('NEGATIVE_TTL') if empty else setting('TTL')
+    timeout = setting('NEGATIVE_TTL') if empty else setting('STALE_TTL')
+    usda_cache().set(key, {
+        'value': value,
+        'empty': empty,
+        'fresh_until': time.time() + fresh,
+    }, timeout)
+
+
+def _in_background(fn):
+    threading.Thread(target=fn, daemon=True).start()
+
+
+def _revalidate(key, fetch):
+    ''' refetch a stale entry once (across workers); keep the stale copy on error '''
+    lock = f'{key}:refresh'
+    cache = usda_cache()
+    if not cache.add(lock, 1, setting('REFRESH_LOCK')):
+        return  # someone is already refreshing it
+
+    def refresh():
+        try:
+            _store(key, fetch())
+        except UsdaError:
+            _count('error')
+        finally:
+            cache.delete(lock)
+
+    _in_background(refresh)
+
+
+def _serve(key, entry, fetch):
+    if time.time() < entry['fresh_until']:
+        _count('negative' if entry['empty'] else 'hit')
+    else:
+        _count('stale')
+        _revalidate(key, fetch)
+    return entry['value']
+
+
+def cached(key, fetch):
+    ''' fetch() through the usda cache; fetch returns the value or raises UsdaError '''
+    key = f'usda:{key}'
+    entry = usda_cache().get(key)
+    if entry is not None:
+        return _serve(key, entry, fetch)
+
+    _count('miss')
+    try:
+        value = fetch()
+    except UsdaError:
+        _count('error')
+        raise
+    _store(key, value)
+    return value
+
+
+# --- API ---
+
+def normalize_query(query):
+    ''' "  Chicken  BREAST" and "chicken breast" share a cache entry '''
+    return ' '.join((query or '').replace('"', ' ').replace("'", ' ').lower().split())
+
+
+def _digest(*parts):
+    return hashlib.sha1('\x1f'.join(map(str, parts)).encode()).hexdigest()
+
+
+def search_foods(query, data_types, page_size=50):
+    ''' abridged USDA search results : a list of food dicts ([] for no match) '''
+    query = normalize_query(query)
+    data_types = sorted(set(data_types))
+    return cached(
+        f'search:{_digest(query, *data_types, page_size)}',
+        lambda: get_client().search(query, data_types, page_size),
+    )
+
+
+def get_food(fdc_id):
+    ''' one USDA food dict, {} when the fdcId is unknown '''
+    fdc_id = int(fdc_id)
+    return cached(f'food:{fdc_id}', lambda: get_client().food(fdc_id))
+
+
+def get_foods(fdc_ids):
+    ''' {fdcId: food dict} : cached foods plus one batched request for the rest '''
+    ids = list(dict.fromkeys(int(i) for i in fdc_ids))
+    keys = {fdc_id: f'usda:food:{fdc_id}' for fdc_id in ids}
+    entries = usda_cache().get_many(list(keys.values()))
+
+    foods, missing = {}, []
+    for fdc_id, key in keys.items():
+        if key in entries:
+            foods[fdc_id] = _serve(key, entries[key], lambda i=fdc_id: get_client().food(i))
+        else:
+            missing.append(fdc_id)
+
+    if missing:
+        _count('miss', len(missing))
+        try:
+            fetched = get_client().foods(missing)
+        except UsdaError:
+            _count('error')
+            raise
+        for fdc_id in missing:
+            foods[fdc_id] = fetched.get(fdc_id, {})
+            _store(keys[fdc_id], foods[fdc_id])
+    return {fdc_id: foods[fdc_id] for fdc_id in ids}
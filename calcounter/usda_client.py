@@ -0,0 +1,133 @@
+'''
+ Pooled HTTP client for the USDA FoodData Central API (used by calcounter.usda).
+
+ - one requests.Session per process : keep-alive connections, pool of POOL_SIZE
+ - (connect, read) timeouts on every request
+ - bounded retries with full jitter on connection errors, 429 and 5xx
+ - foods(ids) : POST /foods takes up to BATCH_SIZE fdcIds per call (the
+   batches run concurrently); the abridged format is asked for afterwards,
+   only for the ids USDA had no full record of
+
+ Settings (settings.USDA_API, all optional) : ROOT, KEY, TIMEOUT, RETRIES,
+ BACKOFF, POOL_SIZE, BATCH_SIZE. Point ROOT at calcounter.usda_stub in tests.
+'''
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .utils import NUTRIENT_MAP
+
+DEFAULTS = {
+    'ROOT': 'https://api.nal.usda.gov/fdc/v1',
+    'KEY': os.getenv('USDA_API_KEY'),
+    'TIMEOUT': (3.05, 10),   # (connect, read) seconds
+    'RETRIES': 2,
+    'BACKOFF': 0.5,          # seconds; attempt n sleeps uniform(0, BACKOFF * 2**n)
+    'POOL_SIZE': 10,
+    'BATCH_SIZE': 20,        # fdcIds per /foods request
+}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class UsdaError(Exception):
+    ''' the USDA API could not be reached or answered with an error '''
+
+
+class UsdaClient:
+    def __init__(self, **options):
+        config = {**DEFAULTS, **getattr(settings, 'USDA_API', {}), **options}
+        self.root = config['ROOT'].rstrip('/')
+        self.key = config['KEY']
+        self.timeout = config['TIMEOUT']
+        self.retries = config['RETRIES']
+        self.backoff = config['BACKOFF']
+        self.batch_size = config['BATCH_SIZE']
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config['POOL_SIZE'])
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(config['POOL_SIZE'], thread_name_prefix='usda')
+
+    def request(self, method, path, params=None, json=None):
+        ''' decoded JSON body, or None for a 404; raises UsdaError '''
+        url = f'{self.root}/{path}'
+        params = {'api_key': self.key, **(params or {})}
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, url, params=params, json=json,
+                                                timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = UsdaError(f'USDA API unreachable: {e}')
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code == 404:
+                    return None
+                error = UsdaError(f'USDA API returned {response.status_code}')
+                if response.status_code not in RETRY_STATUS:
+                    raise error
+            if attempt < self.retries:
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        raise error
+
+    # --- Endpoints ---
+
+    def search(self, query, data_types, page_size=50):
+        ''' abridged search results : a list of food dicts '''
+        body = self.request('GET', 'foods/search', params={
+            'query': f"'{query}'",
+            'dataType': ','.join(data_types),
+            'pageSize': page_size,
+            'format': 'abridged',
+        })
+        return (body or {}).get('foods', [])
+
+    def _batch(self, fdc_ids, format):
+        body = self.request('POST', 'foods', json={
+            'fdcIds': fdc_ids,
+            'format': format,
+            'nutrients': [int(n) for n in NUTRIENT_MAP.values()],
+        })
+        return {int(food['fdcId']): food for food in body or [] if food}
+
+    def _batches(self, fdc_ids, format):
+        chunks = [fdc_ids[i:i + self.batch_size] for i in range(0, len(fdc_ids), self.batch_size)]
+        jobs = [self.executor.submit(self._batch, chunk, format) for chunk in chunks]
+        foods = {}
+        for job in jobs:
+            foods.update(job.result())
+        return foods
+
+    def foods(self, fdc_ids):
+        ''' {fdcId: food dict} for every id USDA knows : full records, abridged where there is none '''
+        fdc_ids = list(dict.fromkeys(int(i) for i in fdc_ids))
+        foods = self._batches(fdc_ids, 'full')
+        missing = [i for i in fdc_ids if i not in foods]
+        if missing:
+            foods.update(self._batches(missing, 'abridged'))
+        return foods
+
+    def food(self, fdc_id):
+        ''' one food dict, {} when the fdcId is unknown '''
+        return self.foods([fdc_id]).get(int(fdc_id), {})
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    ''' the process-wide client (and its connection pool) '''
+    return UsdaClient()
+
+
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    if setting == 'USDA_API':
+        get_client.cache_clear()
@@ -0,0 +1,99 @@
+'''
+ Local stand-in for the USDA FoodData Central API, for tests and offline work.
+
+     with UsdaStub(foods={1750: {...}}) as stub, \
+             override_settings(USDA_API={'ROOT': stub.url, 'BACKOFF': 0}):
+         usda.get_food(1750)
+
+ Serves, from memory:
+   GET  /foods/search   description contains every query word, dataType filter
+   GET  /foods, POST /foods    batch fdcIds lookup (full or abridged format)
+   GET  /food/<fdcId>
+ `foods` / `abridged` hold the full and abridged records by fdcId. Each request
+ is appended to `requests` as (method, path, params or body); status codes
+ pushed onto `fail` are returned, one per request, before normal answers.
+'''
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class UsdaStub:
+    def __init__(self, foods=None, abridged=None):
+        self.foods = {int(k): v for k, v in (foods or {}).items()}
+        self.abridged = {int(k): v for k, v in (abridged or {}).items()}
+        self.requests = []
+        self.fail = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # --- Answers ---
+
+    def _lookup(self, fdc_ids, format):
+        table = self.abridged if format == 'abridged' else self.foods
+        return [table[i] for i in map(int, fdc_ids) if i in table]
+
+    def _search(self, query, data_types):
+        words = query.replace("'", ' ').replace('"', ' ').lower().split()
+        types = {t for t in data_types.split(',') if t}
+        foods = [
+            food for food in {**self.foods, **self.abridged}.values()
+            if all(w in food.get('description', '').lower() for w in words)
+            and (not types or food.get('dataType') in types)
+        ]
+        return {'totalHits': len(foods), 'foods': foods}
+
+    def answer(self, method, path, params, body):
+        ''' (status, JSON body) for one request '''
+        with self._lock:
+            self.requests.append((method, path, body if method == 'POST' else params))
+            if self.fail:
+                return self.fail.pop(0), {'error': 'stub failure'}
+        if path == '/foods/search':
+            return 200, self._search(params.get('query', [''])[0],
+                                     params.get('dataType', [''])[0])
+        if path == '/foods':
+            if method == 'POST':
+                return 200, self._lookup(body.get('fdcIds', []), body.get('format', 'full'))
+            return 200, self._lookup(params.get('fdcIds', []), params.get('format', ['full'])[0])
+        if path.startswith('/food/'):
+            found = self._lookup([path.rsplit('/', 1)[1]], params.get('format', ['full'])[0])
+            return (200, found[0]) if found else (404, {'error': 'not found'})
+        return 404, {'error': 'unknown endpoint'}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                status, payload = stub.answer(method, url.path, parse_qs(url.query), body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._reply('GET')
+
+            def do_POST(self):
+                self._reply('POST')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -1,4 +1,5 @@
 from core.models import RDA_LOOKUP
+from .nutrients import group_numbers, USDA_FIELDS
 
 NUTRIENT_MAP = {
     # Macros
@@ -29,9 +30,10 @@ NUTRIENT_MAP = {
     # Alcohol: 221
     # Caffiene: 262
 }
-MACRO = ["208", "203", "204", "205", "269", "291", "601"]
-MINERAL = ["301", "303", "304", "306", "307", "309"]
-VITAMIN = ["320", "415", "418", "401", "328", "323"]
+# USDA numbers per group, in the shared nutrient schema order
+MACRO = group_numbers('macro')
+MINERAL = group_numbers('mineral')
+VITAMIN = group_numbers('vitamin')
 
 # Branded foods report some vitamins in IU with different nutrient IDs.
 # Map branded IDs to their standard IDs and provide conversion to µg.
@@ -40,6 +42,89 @@ BRANDED_VITAMIN_FALLBACKS = {
     "324": {"standard_id": "328", "convert": lambda iu: iu * 0.025},  # Vitamin D: IU -> µg
 }
 
+def parse_usda_nutrients(item):
+    all_nutrients = {}
+    nutrients = item.get("foodNutrients", [])
+    for n in nutrients:
+        # n = {amounts, nutrient{number, name, unitName}}
+        # n_info = nutrient{number, name, unitName}
+        n_info = n.get("nutrient", n)
+        nutrient_id = n_info.get("number", "")
+        if nutrient_id in NUTRIENT_MAP.values():
+            # Branded vitamin fallback: convert IU -> µg and store under standard ID
+            if nutrient_id in BRANDED_VITAMIN_FALLBACKS:
+                fallback = BRANDED_VITAMIN_FALLBACKS[nutrient_id]
+                std_id = fallback["standard_id"]
+                # Only use fallback if we don't already have the standard value
+                if std_id not in all_nutrients:
+                    converted = fallback["convert"](n.get("amount", 0.0))
+                    all_nutrients[std_id] = {
+                        "name":  n_info.get("name"),
+                        "value": round(converted, 2),
+                        "unit":  "µg"
+                    }
+            else:
+                all_nutrients[nutrient_id] = {
+                    "name":  n_info.get("name"),
+                    "value": n.get("amount", 0.00),
+                    "unit":  n_info.get("unitName", "N/A")
+                }
+    # --- Some foods don't have energy values, calculate instead ---
+    cals = all_nutrients.get("208", {}).get("value", 0.0)
+    if (cals == {} or cals == 0.0):
+        # Atwater Factors calorie calculation 4-9-4
+        protein = all_nutrients.get("203", {}).get('value', 0)
+        fat = all_nutrients.get("204", {}).get('value', 0)
+        carbs = all_nutrients.get("205", {}).get('value', 0)
+        all_nutrients["208"] = {
+            "name": "Energy",
+            "value": (protein * 4) + (fat * 9) + (carbs * 4),
+            "unit": "kcal"
+        }
+
+    servings = []
+    # attempt to retrieve serving size
+    serving_sizes = item.get("foodPortions", [])
+    if serving_sizes:
+        for serving_size in serving_sizes:
+            gram_weight = serving_size.get("gramWeight", 0)
+            amount = serving_size.get("amount", 1)
+            modifier = serving_size.get("modifier", "")
+            if gram_weight > 0 and amount > 0 and modifier:
+                servings.append({
+                    "gram_weight": gram_weight,
+                    "modifier": str(amount) + " " + modifier
+                })
+    else:
+        # branded food
+        servingSize = item.get("servingSize", 0)
+        if servingSize > 0:
+            servings.append({
+                "gram_weight": servingSize,
+                "modifier": "serving"
+            })
+
+    return all_nutrients, servings
+
+def usda_food_fields(all_nutrients):
+    ''' Food field kwargs from parse_usda_nutrients() output (calories rounded to kcal) '''
+    fields = {}
+    for number, field in USDA_FIELDS.items():
+        value = all_nutrients.get(number, {}).get('value', 0)
+        fields[field] = round(value) if field == 'calories' else value
+    return fields
+
+
+# FDC download data_type (CSV) / dataType (JSON) -> Food.data_type
+FDC_DATA_TYPES = {
+    "foundation_food": "Foundation",
+    "sr_legacy_food":  "SR Legacy",
+    "branded_food":    "Branded",
+    "Foundation":      "Foundation",
+    "SR Legacy":       "SR Legacy",
+    "Branded":         "Branded",
+}
+
 def food_fingerprint(user, pantry_item):
     gender = user.profile.gender  # 'M' or 'F'
     age = user.profile.age  # integer
@@ -3,7 +3,7 @@
 """
 from django.shortcuts import get_object_or_404, render, HttpResponse
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Prefetch
+from django.db.models import Sum, Prefetch, Q
 from django.forms.models import inlineformset_factory
 from .models import Food, Meal, Ingredient, MealConsumption, PantryItem, FoodUnit, Recipe
 from .forms import FoodForm, FoodUnitForm, MealForm, IngredientForm, MealConsumptionForm, RecipeForm
@@ -13,16 +13,19 @@ from .utils import (
     MINERAL,
     VITAMIN,
     BRANDED_VITAMIN_FALLBACKS,
+    parse_usda_nutrients,
+    usda_food_fields,
     food_fingerprint,
     meal_fingerprint
 )
+from . import composites, meal_templates, nutrients, search, usda
+from .nutrition_import import NutritionImportError, import_history
 from core.utils import get_or_create_day
+from core.middleware import query_budget
+from core.fragments import fragment_cache
 from copy import copy
+import io
 from datetime import datetime, date
-import requests
-import os
-
-USDA_KEY = os.getenv('USDA_API_KEY')
 
 IngredientFormSet = inlineformset_factory(
     parent_model=Food,
@@ -45,14 +48,20 @@ MealConsumptionFormSet = inlineformset_factory(
 
 # --- Listing foods ---
 @login_required
+@query_budget(15)
+@fragment_cache('meals')
 def list_meals(request, just_added=False):
     ''' Returns `meal_list.html` with the `selected_date` '''
     datestr = request.GET.get('selected_date') if not just_added else request.POST.get('selected_date')
     day = request.user.days.get(date=datestr)
     meals = day.meals.prefetch_related('items__food', 'items__unit').all()
     print(f"{meals=}")
+    # one matrix x serving-grams pass for every meal of the day
+    totals = nutrients.grouped_totals(
+        MealConsumption.objects.filter(meal__day=day), 'meal_id'
+    )
     for meal in meals:
-        meal.nutrients = meal.get_nutrients_consumed()
+        meal.nutrients = nutrients.to_dict(totals.get(meal.id, nutrients.zeros()))
         macros, minerals, vitamins = meal_fingerprint(request.user, meal.nutrients)
         meal.macros = macros
         meal.minerals = minerals
@@ -68,28 +77,25 @@ def list_meals(request, just_added=False):
     return render(request, "calcounter/meal_list.html", ctx)
 
 @login_required
+@query_budget(8)
+@fragment_cache('pantry')
 def list_foods(request, action, just_added=False):
     accessible_units = FoodUnit.objects.accessible_to(request.user)
-    queryset = PantryItem.objects.filter(user=request.user).select_related('food', 'unit')
+    # every card reads food.ingredient_set (recipe breakdown) : prefetch it whatever the filter
+    queryset = PantryItem.objects.filter(user=request.user).select_related('food', 'unit').prefetch_related(
+        Prefetch('food__units', queryset=accessible_units),
+        Prefetch('food__ingredient_set__unit', queryset=accessible_units),
+        'food__ingredient_set__ingredient',
+    )
 
     if action == 'all':
-        foods = queryset.prefetch_related(
-            Prefetch('food__units', queryset=accessible_units),
-            Prefetch('food__ingredient_set__unit', queryset=accessible_units),
-            'food__ingredient_set__ingredient',
-        )
+        foods = queryset
     elif action == 'in_stock':
-        foods = queryset.exclude(status='o').prefetch_related(
-            Prefetch('food__units', queryset=accessible_units)
-        )
+        foods = queryset.exclude(status='o')
     elif action == 'complex':
-        foods = queryset.filter(food__ingredient__isnull=False).distinct().prefetch_related(
-            Prefetch('food__units', queryset=accessible_units)
-        )
+        foods = queryset.filter(food__ingredient__isnull=False).distinct()
     elif action == 'simple':
-        foods = queryset.filter(food__ingredient__isnull=True).prefetch_related(
-            Prefetch('food__units', queryset=accessible_units)
-        )
+        foods = queryset.filter(food__ingredient__isnull=True)
     else:
         foods = queryset.none()
     print(f"Fetched {foods.count()} items for action: {action}")
@@ -169,6 +175,61 @@ def add_meal(request):
     formset = MealConsumptionFormSet()
     return render(request, 'calcounter/meal_entry.html', {'form': form, 'formset': formset})
 
+# --- Meal templates ---
+
+@login_required
+@fragment_cache('meals')
+def list_meal_templates(request):
+    ''' the user's saved meals, each logged onto the selected date in one click '''
+    templates = list(meal_templates.for_user(request.user).prefetch_related('items'))
+    totals = nutrients.grouped_totals(
+        MealConsumption.objects.filter(meal__in=templates), 'meal_id'
+    )
+    for template in templates:
+        template.nutrients = nutrients.to_dict(totals.get(template.id, nutrients.zeros()))
+    return render(request, "calcounter/meal_template_list.html", {"templates": templates})
+
+@login_required
+def save_meal_template(request, meal_id):
+    meal = get_object_or_404(Meal, id=meal_id, day__user=request.user)
+    meal_templates.save(meal, request.user)
+    resp = HttpResponse(200)
+    resp['HX-Trigger'] = 'mealTemplateSaved'
+    return resp
+
+@login_required
+def log_meal_template(request, template_id):
+    ''' POST : clone the template onto the selected date, refresh meal list '''
+    template = get_object_or_404(Meal, id=template_id, owner=request.user, is_template=True)
+    day = get_or_create_day(request.user, request.POST.get('selected_date'))
+    meal_templates.log(template, day)
+    response = list_meals(request, True)
+    response['HX-Trigger'] = 'mealCreated'
+    return response
+
+# --- Importing history ---
+
+@login_required
+def import_nutrition_history(request):
+    '''
+        GET  : upload form for another tracker's CSV export
+        POST : stream the file into the user's days, show what was imported
+    '''
+    if request.method != 'POST':
+        return render(request, 'calcounter/history_import.html')
+    upload = request.FILES.get('history')
+    if upload is None:
+        return render(request, 'calcounter/history_import.html',
+                      {'error': 'Choose a CSV file'}, status=400)
+    lines = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+    try:
+        stats = import_history(request.user, lines)
+    except (NutritionImportError, UnicodeDecodeError) as e:
+        return render(request, 'calcounter/history_import.html', {'error': e}, status=400)
+    response = render(request, 'calcounter/history_import.html', {'stats': stats})
+    response['HX-Trigger'] = 'mealCreated'
+    return response
+
 @login_required
 def add_meal_row(request):
     ''' append a food to the current meal '''
@@ -213,34 +274,13 @@ def new_complex_food(request):
                 unit=gram,
                 amount=0
             )
-            # Link children to parent and save
-            total_grams = 0  # for 'As Prepared' foodunit
-            nutrition = {}
+            # Link children to parent, then compute the per-100g nutrients
+            # and the 'as prepared' unit from all of them at once
             instances = formset.save(commit=False)
             for instance in instances:
                 instance.complex_food = complex_food
-                serving_size = instance.amount * float(instance.unit.gram_weight)
-                total_grams += serving_size
-                nutrition_instance = instance.ingredient.get_nutrition_consumed(serving_size)
-                for key, value in nutrition_instance.items():
-                    nutrition[key] = nutrition.get(key, 0) + value
-                instance.save()
-            if total_grams > 0:
-                normalization_factor = 100 / total_grams
-            else:
-                normalization_factor = 0
-            # 2. Update complex food nutrition normalized to 100g
-            for key, value in nutrition.items():
-                # Normalize the value to the 'per 100g' standard
-                normalized_value = value * normalization_factor
-                setattr(complex_food, key, normalized_value)
-            complex_food.save()
-            # create 'as prepared' unit
-            FoodUnit.objects.get_or_create(
-                food=complex_food,
-                name="as prepared",
-                defaults={'gram_weight': total_grams, 'is_standard': False}
-            )
+            Ingredient.objects.bulk_create(instances)
+            composites.recompute([complex_food.id])
             formset.save_m2m() # Required if there are ManyToMany relationships
             response = list_foods(request, 'complex', True)
             response['HX-Trigger'] = 'pantryItemAdded'
@@ -278,11 +318,7 @@ def typeahead_foods(request):
 
     foods = []
     if q:
-        foods = (
-            Food.objects.available_to_user(request.user)
-            .filter(is_active=True, name__icontains=q)
-            .order_by('name')[:20]
-        )
+        foods = search.typeahead_foods(q, request.user, limit=20)
 
     ctx = {
         "foods": foods,
@@ -353,25 +389,30 @@ def query_ingredient(request):
         return HttpResponse('')
     include_branded = request.GET.get('branded') == 'on'
     include_foundational = request.GET.get('foundational') == 'on'
+    # Search the local FDC mirror (manage.py import_fdc) when it is loaded;
+    # the USDA API still answers what it doesn't have
+    if Food.objects.filter(fdc_mirror=True).exists():
+        local_types = []
+        if include_branded:
+            local_types.append("Branded")
+        if include_foundational or not local_types:
+            local_types += ["Foundation", "SR Legacy"]
+        results = search_local_fdc(query, local_types)
+        if results:
+            return render(request, 'calcounter/ingred_search.html', {"foods": results})
     # Map these to USDA data types
     data_types = []
     if include_branded:
         data_types.append("Branded")
     if include_foundational:
-        data_types.append("Foundation,SR%20Legacy")
+        data_types += ["Foundation", "SR Legacy"]
     if data_types == []:
-        data_types = ["Foundation,SR%20Legacy"]
-    url = (
-        f"https://api.nal.usda.gov/fdc/v1/foods/search?"
-        f"api_key={USDA_KEY}&"
-        f"query='{query}'&"
-        f"dataType={','.join(data_types)}&"
-        f"pageSize=50&"
-        f"format=abridged"
-    )
-    print(f"{url=}")
-    r = requests.get(url)
-    foods = r.json().get("foods", [])
+        data_types = ["Foundation", "SR Legacy"]
+    try:
+        foods = usda.search_foods(query, data_types)
+    except usda.UsdaError as e:
+        print(f"Error fetching USDA data: {e}")
+        return HttpResponse("Error fetching USDA data")
     results = []
     nutrient_keys = {"208": "calories", "203": "protein", "204": "fat", "205": "carbs"}
     for food in foods:
@@ -392,130 +433,50 @@ def query_ingredient(request):
     return render(request, 'calcounter/ingred_search.html', {"foods": results})
 
 
-def parse_usda_nutrients(item):
-    all_nutrients = {}
-    nutrients = item.get("foodNutrients", [])
-    for n in nutrients:
-        # n = {amounts, nutrient{number, name, unitName}}
-        # n_info = nutrient{number, name, unitName}
-        n_info = n.get("nutrient", n)
-        nutrient_id = n_info.get("number", "")
-        if nutrient_id in NUTRIENT_MAP.values():
-            # Branded vitamin fallback: convert IU -> µg and store under standard ID
-            if nutrient_id in BRANDED_VITAMIN_FALLBACKS:
-                fallback = BRANDED_VITAMIN_FALLBACKS[nutrient_id]
-                std_id = fallback["standard_id"]
-                # Only use fallback if we don't already have the standard value
-                if std_id not in all_nutrients:
-                    converted = fallback["convert"](n.get("amount", 0.0))
-                    all_nutrients[std_id] = {
-                        "name":  n_info.get("name"),
-                        "value": round(converted, 2),
-                        "unit":  "µg"
-                    }
-                    print(f"Branded fallback: {nutrient_id} -> {std_id}, {all_nutrients[std_id]=}")
-            else:
-                all_nutrients[nutrient_id] = {
-                    "name":  n_info.get("name"),
-                    "value": n.get("amount", 0.00),
-                    "unit":  n_info.get("unitName", "N/A")
-                }
-                print(f"{all_nutrients[nutrient_id]=}")
-    # --- Some foods don't have energy values, calculate instead ---
-    cals = all_nutrients.get("208", {}).get("value", 0.0)
-    if (cals == {} or cals == 0.0):
-        # Atwater Factors calorie calculation 4-9-4
-        protein = all_nutrients.get("203", {}).get('value', 0)
-        fat = all_nutrients.get("204", {}).get('value', 0)
-        carbs = all_nutrients.get("205", {}).get('value', 0)
-        all_nutrients["208"] = {
-            "name": "Energy",
-            "value": (protein * 4) + (fat * 9) + (carbs * 4),
-            "unit": "kcal"
-        }
-
-    servings = []
-    # attempt to retrieve serving size
-    serving_sizes = item.get("foodPortions", [])
-    if serving_sizes:
-        for serving_size in serving_sizes:
-            gram_weight = serving_size.get("gramWeight", 0)
-            amount = serving_size.get("amount", 1)
-            modifier = serving_size.get("modifier", "")
-            if gram_weight > 0 and amount > 0 and modifier:
-                servings.append({
-                    "gram_weight": gram_weight,
-                    "modifier": str(amount) + " " + modifier
-                })
-    else:
-        # branded food
-        servingSize = item.get("servingSize", 0)
-        if servingSize > 0:
-            servings.append({
-                "gram_weight": servingSize,
-                "modifier": "serving"
-            })
-
-    return all_nutrients, servings
-
-def query_usda_food(fdcId: str, abridged: bool = False) -> requests.Response:
-    nutrient_ids = list(NUTRIENT_MAP.values())
-    params = {
-        'fdcIds': [fdcId],
-        'api_key': USDA_KEY,
-        'nutrients': nutrient_ids  
+def search_local_fdc(query, data_types, limit=50):
+    ''' imported FDC foods shaped like the USDA search results '''
+    ids = search.search_ids(query, data_types=data_types, limit=limit)
+    rows = {
+        food['id']: food for food in Food.objects.filter(id__in=ids)
+        .values('id', 'name', 'brand', 'fdc_id', 'calories', 'protein', 'fat', 'carb')
     }
-    if abridged:
-        params['format'] = 'abridged'
-    response = requests.get("https://api.nal.usda.gov/fdc/v1/foods", params=params)
-    return response
+    foods = [rows[i] for i in ids if i in rows]
+    results = []
+    for food in foods:
+        entry = {
+            "name": food["name"],
+            "brand": food["brand"],
+            "fdcId": food["fdc_id"],
+            "calories": int(food["calories"] or 0),
+            "protein": int(food["protein"] or 0),
+            "fat": int(food["fat"] or 0),
+            "carbs": int(food["carb"] or 0),
+        }
+        if entry["calories"] == 0:
+            entry["calories"] = entry["protein"] * 4 + entry["fat"] * 9 + entry["carbs"] * 4
+        results.append(entry)
+    return results
 
 @login_required
 def get_specific_usda_item(request, fdcId):
     foodItem = Food.objects.filter(fdc_id=fdcId).first()
     if not foodItem:
-        # Attempt to query full API first, then fallback to abridged
-
-        response = query_usda_food(fdcId)
-        if response.status_code != 200:
-            print(f"Error fetching USDA data: {response.status_code}")
+        # full record, or the abridged one when that's all USDA has
+        try:
+            food = usda.get_food(fdcId)
+        except usda.UsdaError as e:
+            print(f"Error fetching USDA data: {e}")
             return HttpResponse("Error fetching USDA data")
-        # returns in format : [ {food} ] : need error handling for empty list
-        foods = response.json()
-        if len(foods) == 0:
-            response = query_usda_food(fdcId, abridged=True)
-            if response.status_code != 200:
-                print(f"Error fetching USDA data: {response.status_code}")
-                return HttpResponse("Error fetching USDA data")
-            foods = response.json()
-            if len(foods) == 0:
-                print(f"No food found for fdcId: {fdcId}")
-                return HttpResponse("No food found for fdcId")
-        food = foods[0]
+        if not food:
+            print(f"No food found for fdcId: {fdcId}")
+            return HttpResponse("No food found for fdcId")
         all_nutrients, servings = parse_usda_nutrients(food)
         # --- Save the Food Item for future use
         foodItem = Food.objects.create(
             name=food.get("description"),
             fdc_id=fdcId,
-            calories=int(all_nutrients.get("208", {}).get('value', 0)),
-            protein=int(all_nutrients.get("203", {}).get('value', 0)),
-            fat=int(all_nutrients.get("204", {}).get('value', 0)),
-            carb=int(all_nutrients.get("205", {}).get('value', 0)),
-            sugar=int(all_nutrients.get("269", {}).get('value', 0)),
-            fiber=int(all_nutrients.get("291", {}).get('value', 0)),
-            cholesterol=int(all_nutrients.get("601", {}).get('value', 0)),
-            calcium=all_nutrients.get("301", {}).get('value', 0),
-            iron=all_nutrients.get("303", {}).get('value', 0),
-            magnesium=all_nutrients.get("304", {}).get('value', 0),
-            potassium=all_nutrients.get("306", {}).get('value', 0),
-            sodium=all_nutrients.get("307", {}).get('value', 0),
-            zinc=all_nutrients.get("309", {}).get('value', 0),
-            vitamin_a=all_nutrients.get("320", {}).get('value', 0),
-            vitamin_b6=all_nutrients.get("415", {}).get('value', 0),
-            vitamin_b12=all_nutrients.get("418", {}).get('value', 0),
-            vitamin_c=all_nutrients.get("401", {}).get('value', 0),
-            vitamin_d=all_nutrients.get("328", {}).get('value', 0),
-            vitamin_e=all_nutrients.get("323", {}).get('value', 0),
+            brand=food.get("brandName") or food.get("brandOwner") or "",
+            **usda_food_fields(all_nutrients)
         )
         # create standard grams unit for food
         FoodUnit.objects.get_or_create(
@@ -673,7 +634,7 @@ def clear(request):
 @login_required
 def delete_meal(request, meal_id):
     ''' delete meal '''
-    meal = get_object_or_404(Meal, id=meal_id, day__user=request.user)
+    meal = get_object_or_404(Meal, Q(day__user=request.user) | Q(owner=request.user), id=meal_id)
     meal.delete()
     return clear(request)
 
@@ -0,0 +1,114 @@
+'''
+ Per-user render cache for HTMX partials, keyed by data version.
+
+ Every user has a version counter per entity ('meals', 'pantry', 'workouts',
+ 'profile'), bumped by core.signals whenever a row behind it changes; edits
+ to the global food catalog bump the shared 'foods' counter. A view wrapped
+ in @fragment_cache('meals') gets an ETag from (view, path + query, user,
+ today, its entities' versions):
+   - If-None-Match matches    -> 304 Not Modified, the view never runs
+   - rendered under that ETag -> the cached HTML, no queries or templates
+   - otherwise                -> the view renders and its HTML is stored
+ "today" is the user's local date (Profile.timezone, like the day selection),
+ so partials relative to today re-render at the user's midnight.
+ Only GET / HEAD answers with status 200 are cached, so a partial returned by
+ a POST handler (list_meals after adding a meal) always renders.
+'''
+import hashlib
+import time
+from datetime import datetime
+from functools import wraps
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from core.models import Profile
+
+VERSION_KEY = 'fragments:version:{}:{}'
+HTML_KEY = 'fragments:html:{}'
+TIMEZONE_KEY = 'fragments:timezone:{}'
+CACHE_TIMEOUT = 60 * 60 * 24
+GLOBAL_ENTITIES = ('foods',)    # shared by every user, bumped with user_id=None
+USER_ENTITIES = ('profile',)    # part of every fragment of the user
+
+
+def _version_key(user_id, entity):
+    return VERSION_KEY.format('global' if user_id is None else user_id, entity)
+
+
+def bump(user_id, *entities):
+    ''' move the versions of `entities` for `user_id` (None : the global ones) '''
+    for entity in entities:
+        try:
+            cache.incr(_version_key(user_id, entity))
+        except ValueError:
+            pass  # never read (or evicted) : the next read starts a fresh counter
+
+
+def versions(user_id, entities):
+    ''' current version of each entity, global ones last '''
+    keys = ([_version_key(user_id, e) for e in (*USER_ENTITIES, *entities)]
+            + [_version_key(None, e) for e in GLOBAL_ENTITIES])
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # a fresh counter never repeats a value an older ETag was built from
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        found.update(cache.get_many(missing))
+    return [found.get(key) for key in keys]
+
+
+def local_today(user):
+    ''' the user's date in their profile timezone (cached, refreshed on Profile save) '''
+    key = TIMEZONE_KEY.format(user.pk)
+    name = cache.get(key)
+    if name is None:
+        name = (Profile.objects.filter(user=user).values_list('timezone', flat=True).first()
+                or settings.TIME_ZONE)
+        cache.set(key, name, CACHE_TIMEOUT)
+    return datetime.now(ZoneInfo(name)).date()
+
+
+def remember_timezone(user_id, name):
+    ''' called on every Profile save : the next ETag needs no profile query '''
+    cache.set(TIMEZONE_KEY.format(user_id), name, CACHE_TIMEOUT)
+
+
+def etag(request, view, entities):
+    user = request.user
+    parts = (
+        f'{view.__module__}.{view.__name__}', request.get_full_path(),
+        user.pk, user.date_joined.timestamp(),  # ids are reused once a user is deleted
+        local_today(user).isoformat(), request.META.get('CSRF_COOKIE', ''),
+        *versions(user.pk, entities),
+    )
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def fragment_cache(*entities):
+    ''' view decorator : cache the rendered partial until one of `entities` changes '''
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            tag = etag(request, view, entities)
+            response = get_conditional_response(request, etag=tag)
+            if response is None:
+                html = cache.get(HTML_KEY.format(tag))
+                if html is not None:
+                    response = HttpResponse(html)
+                else:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    cache.set(HTML_KEY.format(tag), response.content, CACHE_TIMEOUT)
+            response['ETag'] = tag
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
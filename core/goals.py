@@ -0,0 +1,161 @@
+'''
+ Calorie / protein goals (Harris-Benedict), resolved when their inputs change
+ instead of on every Day save.
+
+ A day's goals come from its effective bodyweight : its own weigh-in, else the
+ most recent one before it (days before the first weigh-in keep the field
+ defaults). Goals are written:
+   - when a day is created         goals_for() in pre_save, no extra UPDATE
+                                   (goals_for_dates() for core.utils.DayRange)
+   - when a bodyweight changes     one UPDATE over that day and the days up to
+                                   the next weigh-in
+   - when gender/height/age change one UPDATE over every day from the first
+                                   weigh-in (effective bodyweight as a subquery)
+ Water, sleep and note saves touch none of it.
+
+ The user's profile and latest weigh-in are cached under goals:<user id> for
+ CACHE_TTL and dropped on either change.
+'''
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Round
+from django.utils.dateparse import parse_date
+
+from .models import Day, Profile
+
+ACTIVITY = 1.725            # Harris-Benedict multiplier
+PROTEIN_PER_LB = 0.8
+LB_TO_KG = 0.45359237
+CACHE_TTL = 60 * 60
+
+
+# --- Formula ---
+
+def coefficients(gender, height, age):
+    ''' (a, b) with calories = a * bodyweight_lbs + b '''
+    if gender == 'F':
+        per_kg, base = 9.563, 655.1 + (1.850 * height) - (4.676 * age)
+    else:
+        per_kg, base = 13.75, 66.5 + (5.003 * height) - (6.75 * age)
+    return ACTIVITY * per_kg * LB_TO_KG, ACTIVITY * base
+
+
+def harris_benedict(bodyweight, profile):
+    ''' (calorie goal, protein goal) for a bodyweight in lbs and a (gender, height cm, age) profile '''
+    a, b = coefficients(*profile)
+    return round(a * bodyweight + b), round(bodyweight * PROTEIN_PER_LB)
+
+
+def default_goals():
+    return Day._meta.get_field('calorie_goal').default, Day._meta.get_field('protein_goal').default
+
+
+# --- Cached per-user inputs ---
+
+def _key(user_id):
+    return f'goals:{user_id}'
+
+
+def invalidate(user_id):
+    cache.delete(_key(user_id))
+
+
+def _inputs(user_id):
+    ''' {'profile': (gender, height, age), 'latest': (date, bodyweight) or None} '''
+    inputs = cache.get(_key(user_id))
+    if inputs is None:
+        inputs = {
+            'profile': (Profile.objects.filter(user_id=user_id)
+                        .values_list('gender', 'height', 'age').first()),
+            'latest': (Day.objects.filter(user_id=user_id, bodyweight__isnull=False)
+                       .order_by('-date').values_list('date', 'bodyweight').first()),
+        }
+        cache.set(_key(user_id), inputs, CACHE_TTL)
+    return inputs
+
+
+def effective_bodyweight(user_id, day):
+    ''' latest bodyweight logged on or before `day`, None before the first weigh-in '''
+    latest = _inputs(user_id)['latest']
+    if latest and latest[0] <= day:
+        return latest[1]
+    return (Day.objects.filter(user_id=user_id, date__lte=day, bodyweight__isnull=False)
+            .order_by('-date').values_list('bodyweight', flat=True).first())
+
+
+def goals_for_dates(user_id, dates):
+    '''
+    {date: (calorie goal, protein goal)} for many days at once : the weigh-in in
+    effect on the first date plus the weigh-ins inside the range (skipped when
+    the cached latest one is older), walked in date order
+    '''
+    dates = sorted(parse_date(d) if isinstance(d, str) else d for d in dates)
+    if not dates:
+        return {}
+    inputs = _inputs(user_id)
+    bodyweight = effective_bodyweight(user_id, dates[0])
+    changes = []
+    if inputs['latest'] and inputs['latest'][0] > dates[0]:
+        changes = list(Day.objects.filter(user_id=user_id, bodyweight__isnull=False,
+                                          date__gt=dates[0], date__lte=dates[-1])
+                       .order_by('date').values_list('date', 'bodyweight'))
+    resolved, i = {}, 0
+    for day in dates:
+        while i < len(changes) and changes[i][0] <= day:
+            bodyweight = changes[i][1]
+            i += 1
+        if bodyweight is None or inputs['profile'] is None:
+            resolved[day] = default_goals()
+        else:
+            resolved[day] = harris_benedict(bodyweight, inputs['profile'])
+    return resolved
+
+
+def goals_for(user_id, day):
+    ''' (calorie goal, protein goal) in effect on `day`, defaults before the first weigh-in '''
+    return next(iter(goals_for_dates(user_id, [day]).values()))
+
+
+# --- Change detection (snapshots taken in Day / Profile .from_db) ---
+
+def bodyweight_changed(day):
+    loaded = getattr(day, '_loaded_bodyweight', None)
+    current = None if day.bodyweight in (None, '') else float(day.bodyweight)
+    return current != loaded
+
+
+def profile_changed(profile):
+    return getattr(profile, '_loaded_goal_profile', None) != (profile.gender, profile.height, profile.age)
+
+
+# --- Propagation ---
+
+def propagate_bodyweight(user_id, day):
+    ''' rewrite goals of `day` and the days after it up to the next weigh-in (one UPDATE) '''
+    day = parse_date(day) if isinstance(day, str) else day
+    invalidate(user_id)
+    calories, protein = goals_for(user_id, day)
+    days = Day.objects.filter(user_id=user_id, date__gte=day)
+    next_weigh_in = (Day.objects.filter(user_id=user_id, date__gt=day, bodyweight__isnull=False)
+                     .order_by('date').values_list('date', flat=True).first())
+    if next_weigh_in is not None:
+        days = days.filter(date__lt=next_weigh_in)
+    return days.update(calorie_goal=calories, protein_goal=protein)
+
+
+def propagate_profile(user_id):
+    ''' rewrite goals of every day from the first weigh-in for a new profile (one UPDATE) '''
+    invalidate(user_id)
+    inputs = _inputs(user_id)
+    if inputs['latest'] is None or inputs['profile'] is None:
+        return 0
+    a, b = coefficients(*inputs['profile'])
+    weigh_ins = Day.objects.filter(user_id=user_id, bodyweight__isnull=False)
+    bodyweight = Subquery(
+        weigh_ins.filter(date__lte=OuterRef('date')).order_by('-date').values('bodyweight')[:1]
+    )
+    first = weigh_ins.order_by('date').values('date')[:1]
+    return Day.objects.filter(user_id=user_id, date__gte=Subquery(first)).update(
+        calorie_goal=Round(bodyweight * a + b),
+        protein_goal=Round(bodyweight * PROTEIN_PER_LB),
+    )
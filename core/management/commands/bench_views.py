@@ -0,0 +1,249 @@
+"""
+Django management command to benchmark every page/fragment URL against a
+synthetic heavy user (core.synthetic): 3+ years of days, 5 meals a day, a
+400-food pantry and 4 workouts a week of 25 sets.
+
+For each named URL in core, calcounter, workouts and graphs it records wall
+time (cold = empty cache, warm = median of --repeat), query count and peak
+Python memory, and can write the results as JSON / compare against a
+previous run:
+
+    python manage.py bench_views --output bench/$(git rev-parse --short HEAD).json
+    python manage.py bench_views --compare bench/abc1234.json --fail-on-regression
+
+Everything runs inside a transaction that is rolled back (each request in
+its own savepoint), so the database is left untouched.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from importlib import import_module
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core.middleware import QueryRecorder
+from core.synthetic import make_heavy_user
+
+URL_MODULES = ['core.urls', 'calcounter.urls', 'workouts.urls', 'graphs.urls']
+SKIP = {
+    'calcounter:search_ingred': 'calls the USDA API',
+    'calcounter:get_ingred': 'calls the USDA API',
+    'core:logout': 'ends the benchmark session',
+    # routes that write on a plain GET
+    'core:set_bw': 'writes the bodyweight',
+    'core:add_sleep': 'writes sleep',
+    'calcounter:add_p': 'adds a pantry item',
+    'calcounter:save_template': 'saves a meal template',
+    'workouts:addw': 'starts a workout',
+    'workouts:add_mv': 'adds a movement',
+    'workouts:add_lift': 'adds a lift',
+    'workouts:unarchive-mv': 'unarchives a movement',
+}
+# deletes and other mutations : measuring them says nothing about page speed
+# (and workouts:del_type raises ProtectedError on a type with workouts)
+MUTATING = ('del', 'clear', 'end_', 'update')
+
+
+def skip_reason(name):
+    if name in SKIP:
+        return SKIP[name]
+    if any(word in name.partition(':')[2] for word in MUTATING):
+        return 'mutates data'
+    return None
+
+
+def url_names():
+    ''' [(namespaced name, converter names)] for every named route in URL_MODULES '''
+    names = []
+    for module in URL_MODULES:
+        urls = import_module(module)
+        for pattern in urls.urlpatterns:
+            if pattern.name:
+                names.append((f'{urls.app_name}:{pattern.name}',
+                              tuple(pattern.pattern.converters)))
+    return list(dict.fromkeys(names))
+
+
+def url_arguments(user, day):
+    ''' value for every URL keyword, taken from the generated user's data '''
+    from calcounter.models import PantryItem, Meal, Recipe
+    from workouts.models import WorkoutType, Workout, Lift, Set, Movement
+
+    pantry = PantryItem.objects.filter(user=user).first()
+    workout = Workout.objects.filter(day__user=user).order_by('-day__date').first()
+    lift = Lift.objects.filter(workout=workout).first()
+    movement = lift.movement if lift else Movement.objects.filter(user=user).first()
+    wtype = WorkoutType.objects.filter(user=user).first()
+    recipe = Recipe.objects.filter(food__owner=user).first()
+    meal = Meal.objects.filter(day=day).first()
+    values = {
+        'date': day.date.isoformat(),
+        'action': 'all',
+        'food_id': pantry and pantry.food_id,
+        'pantry_id': pantry and pantry.id,
+        'item_id': pantry and pantry.id,
+        'unit_id': pantry and pantry.unit_id,
+        'meal_id': meal and meal.id,
+        'recipe_id': recipe and recipe.id,
+        'workout_id': workout and workout.id,
+        'lift_id': lift and lift.id,
+        'set_id': lift and Set.objects.filter(lift=lift).values_list('id', flat=True).first(),
+        'movement_id': movement and movement.id,
+        'mv_id': movement and movement.id,
+        'lift_name': movement and movement.name,
+        'wtype_id': wtype and wtype.id,
+        'w_type': wtype and wtype.id,
+        'type_id': wtype and wtype.id,
+    }
+    return {key: value for key, value in values.items() if value is not None}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Time every core/calcounter/workouts/graphs URL for a synthetic heavy user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=3 * 365 + 30)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='warm requests per URL (median is reported)')
+        parser.add_argument('--only', action='append', default=[],
+                            help='only URL names containing this text (repeatable)')
+        parser.add_argument('--output', help='write results to this JSON file')
+        parser.add_argument('--compare', help='previous JSON results to diff against')
+        parser.add_argument('--threshold', type=float, default=25.0,
+                            help='percent slower (warm) that counts as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(QUERY_BUDGET_STRICT=False):
+            start = time.perf_counter()
+            user = make_heavy_user('bench-heavy-user', days=options['days'], seed=options['seed'])
+            self.stdout.write(f'Generated {options["days"]} days of history '
+                              f'in {time.perf_counter() - start:.1f}s')
+            day = user.days.order_by('-date').first()
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            arguments = url_arguments(user, day)
+            params = {'selected_date': day.date.isoformat(), 'date': day.date.isoformat(),
+                      'q': 'chi', 'query': 'chicken'}
+
+            results, skipped = {}, {}
+            for name, keywords in url_names():
+                if options['only'] and not any(text in name for text in options['only']):
+                    continue
+                reason = skip_reason(name)
+                if reason:
+                    skipped[name] = reason
+                    continue
+                missing = [k for k in keywords if k not in arguments]
+                if missing:
+                    skipped[name] = f'no value for {", ".join(missing)}'
+                    continue
+                url = reverse(name, kwargs={k: arguments[k] for k in keywords})
+                results[name] = self.measure(client, url, params, options['repeat'])
+                self.stdout.write(self.format_row(name, results[name]))
+            transaction.set_rollback(True)
+        cache.clear()
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'days': options['days'],
+                'repeat': options['repeat'],
+            },
+            'results': results,
+            'skipped': skipped,
+        }
+        for name, reason in skipped.items():
+            self.stdout.write(f'{name:<40} skipped: {reason}')
+        if options['output']:
+            path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
+        if options['compare']:
+            self.compare(report, options)
+
+    def measure(self, client, url, params, repeat):
+        ''' a cold request, a memory-traced one and `repeat` warm ones, each rolled back '''
+        def run(trace=False):
+            recorder = QueryRecorder()
+            sid = transaction.savepoint()
+            if trace:
+                tracemalloc.start()
+            try:
+                with connection.execute_wrapper(recorder):
+                    t0 = time.perf_counter()
+                    response = client.get(url, params)
+                    elapsed = (time.perf_counter() - t0) * 1000
+                peak = tracemalloc.get_traced_memory()[1] if trace else None
+            finally:
+                if trace:
+                    tracemalloc.stop()
+                transaction.savepoint_rollback(sid)
+            return response.status_code, elapsed, recorder.count, peak
+
+        cache.clear()
+        status, cold_ms, queries, _ = run()
+        cache.clear()
+        peak = run(trace=True)[3]  # traced separately : tracemalloc slows the request
+        warm = [run()[1] for _ in range(repeat)]
+        return {
+            'url': url,
+            'status': status,
+            'cold_ms': round(cold_ms, 2),
+            'ms': round(statistics.median(warm), 2) if warm else round(cold_ms, 2),
+            'queries': queries,
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def format_row(self, name, result):
+        return (f"{name:<40} {result['status']:>3} {result['ms']:>9.2f} ms "
+                f"(cold {result['cold_ms']:>9.2f}) {result['queries']:>4} queries "
+                f"{result['peak_kb']:>9.1f} KiB")
+
+    def compare(self, report, options):
+        baseline = json.loads(Path(options['compare']).read_text())
+        regressions = []
+        self.stdout.write(f"\nvs {options['compare']} ({baseline['meta'].get('commit')}):")
+        for name, now in report['results'].items():
+            before = baseline['results'].get(name)
+            if before is None:
+                continue
+            slower = (now['ms'] - before['ms']) / before['ms'] * 100 if before['ms'] else 0
+            # ignore sub-millisecond noise
+            if (slower > options['threshold'] and now['ms'] - before['ms'] > 1) \
+                    or now['queries'] > before['queries']:
+                regressions.append(name)
+                self.stdout.write(self.style.WARNING(
+                    f"{name:<40} {before['ms']:.2f} -> {now['ms']:.2f} ms ({slower:+.0f}%), "
+                    f"{before['queries']} -> {now['queries']} queries"
+                ))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions'))
+        elif options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} URL(s) regressed: {", ".join(regressions)}')
@@ -0,0 +1,153 @@
+'''
+ Query instrumentation : counts every SQL query a request runs, its DB time
+ and repeated statements (N+1 fingerprints), per view.
+
+   @query_budget(8)          declare the most queries one call may run
+   def list_meals(request): ...
+
+ The budget is checked around the decorated function itself, so it holds
+ when a POST view renders list_meals() directly and on shared helpers
+ (graphs.timeseries.summary) as much as on the URL entry point.
+ Over budget -> logged on `selfstats.queries`, or QueryBudgetExceeded raised
+ when settings.QUERY_BUDGET_STRICT is on (CI), so a view that grows an N+1
+ fails the test that renders it. Repeated statements are logged under DEBUG
+ or strict mode only. query_reports() aggregates per view for this process
+ (unresolved URLs share one bucket); DEBUG responses carry a Server-Timing
+ header.
+'''
+import functools
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('selfstats.queries')
+
+# the same statement this many times in one request is reported as an N+1
+REPEAT_THRESHOLD = 3
+# report key of requests no URL pattern matched (404s, scanners) : one bucket, not one per path
+UNRESOLVED = '<unresolved>'
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST_RE = re.compile(r'\((?:\s*(?:%s|\?|N)\s*,)+\s*(?:%s|\?|N)\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    ''' a view ran more queries than its @query_budget allows '''
+
+
+def query_budget(max_queries):
+    ''' decorator : most queries one call of this view / helper may run '''
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = QueryRecorder()
+            with recording(recorder):
+                result = func(*args, **kwargs)
+            if recorder.count > max_queries:
+                message = f'{name} ran {recorder.count} queries (budget {max_queries})'
+                if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return result
+
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+def fingerprint(sql):
+    ''' SQL with literals, placeholders and IN lists collapsed : same shape -> same string '''
+    sql = _STRING_RE.sub('S', sql)
+    sql = _NUMBER_RE.sub('N', sql)
+    sql = _LIST_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    ''' connection.execute_wrapper hook recording one request's queries '''
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        ''' [(fingerprint, times)] run at least `threshold` times, most first '''
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n >= threshold]
+
+
+@contextmanager
+def recording(recorder):
+    ''' route every connection's queries through `recorder` '''
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+# --- Per-view reports (this process) ---
+
+_reports = {}
+
+
+def _record(view, recorder):
+    report = _reports.setdefault(view, {
+        'requests': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0, 'repeated': {},
+    })
+    report['requests'] += 1
+    report['queries'] += recorder.count
+    report['max_queries'] = max(report['max_queries'], recorder.count)
+    report['db_ms'] += recorder.seconds * 1000
+    for sql, n in recorder.repeated():
+        report['repeated'][sql] = max(report['repeated'].get(sql, 0), n)
+
+
+def query_reports():
+    ''' {view name: requests, queries, max_queries, db_ms, repeated}, heaviest first '''
+    return dict(sorted(_reports.items(), key=lambda item: -item[1]['max_queries']))
+
+
+def reset_query_reports():
+    _reports.clear()
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recording(recorder):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.view_name if match else UNRESOLVED
+        _record(view, recorder)
+        if settings.DEBUG:
+            response['Server-Timing'] = (
+                f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"'
+            )
+
+        strict = getattr(settings, 'QUERY_BUDGET_STRICT', False)
+        if settings.DEBUG or strict:
+            for sql, n in recorder.repeated():
+                logger.warning('%s ran the same query %d times: %s', view, n, sql[:300])
+        return response
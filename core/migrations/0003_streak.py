@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_streaks(apps, schema_editor):
+    from core.streaks import LOGGED, summarize
+    Day = apps.get_model('core', 'Day')
+    Streak = apps.get_model('core', 'Streak')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    dates = {}
+    rows = Day.objects.filter(LOGGED, user__isnull=False).order_by('user_id', 'date')
+    for user_id, day in rows.values_list('user_id', 'date'):
+        dates.setdefault(user_id, []).append(day)
+    Streak.objects.bulk_create([
+        Streak(user_id=user_id, **dict(zip(('start', 'end', 'longest'), summarize(dates.get(user_id, [])))))
+        for user_id in User.objects.values_list('pk', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0002_profile_calendar_view_alter_profile_timezone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Streak',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='streak', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('start', models.DateField(blank=True, null=True)),
+                ('end', models.DateField(blank=True, null=True)),
+                ('longest', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_streaks, migrations.RunPython.noop),
+    ]
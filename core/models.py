@@ -108,6 +108,14 @@ class Profile(models.Model):
         default='2w',
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        profile = super().from_db(db, field_names, values)
+        # core.goals recomputes goals only when these actually change
+        loaded = dict(zip(field_names, values))
+        profile._loaded_goal_profile = tuple(loaded.get(f) for f in ('gender', 'height', 'age'))
+        return profile
+
     def __str__(self):
         return f"{self.user.username} Profile"
 
@@ -156,6 +164,44 @@ class Day(models.Model):
         unique_together = ("user", "date")
         ordering = ['-date']
 
+    # kept up by core.goals : saving a loaded day writes them only if they were changed on it,
+    # so a stale instance never overwrites goals propagated since it was read
+    GOAL_FIELDS = ('calorie_goal', 'protein_goal')
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_goals', {})
+        unchanged = {f for f, value in loaded.items() if getattr(self, f) == value}
+        if not self._state.adding and self.pk and unchanged and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in unchanged
+            ]
+        super().save(*args, **kwargs)
+        self._loaded_goals = {f: getattr(self, f) for f in self.GOAL_FIELDS}
+
+    # any of these entered makes the day count toward the logging streak
+    LOGGED_FIELDS = ('bodyweight', 'water_consumed', 'sleep', 'calories_consumed')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        day = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        # core.goals propagates goals only when the bodyweight actually changes
+        day._loaded_bodyweight = loaded.get('bodyweight')
+        day._loaded_goals = {f: loaded[f] for f in cls.GOAL_FIELDS if f in loaded}
+        # core.streaks is told only when the day gains or loses data
+        if all(f in loaded for f in cls.LOGGED_FIELDS):
+            day._loaded_logged = cls.is_logged(*(loaded[f] for f in cls.LOGGED_FIELDS))
+        return day
+
+    @staticmethod
+    def is_logged(bodyweight, water, sleep, calories):
+        return bodyweight not in (None, '') or any(float(v or 0) for v in (water, sleep, calories))
+
+    @property
+    def logged(self):
+        return self.is_logged(*(getattr(self, f) for f in self.LOGGED_FIELDS))
+
     @property
     def macro_breakdown(self):
         '''
@@ -169,51 +215,47 @@ class Day(models.Model):
         carb_grams = carb_cals / 4
         return (round(carb_grams), round(protein_grams), round(fat_grams))
 
+    @property
+    def totals(self):
+        '''
+            materialized DailyNutrientTotals row (built on first access)
+        '''
+        from calcounter.models import DailyNutrientTotals
+        try:
+            return self.nutrient_totals
+        except DailyNutrientTotals.DoesNotExist:
+            self.nutrient_totals = DailyNutrientTotals.objects.rebuild(self.pk)
+            return self.nutrient_totals
+
     @property
     def mineral_breakdown(self):
         '''
             returns dict of mineral name to amount in mg
         '''
-        minerals = {
-            'zinc': 0,
-            'magnesium': 0,
-            'iron': 0,
-            'calcium': 0,
-            'potassium': 0,
-            'sodium': 0,
+        totals = self.totals
+        return {
+            'zinc': totals.zinc,
+            'magnesium': totals.magnesium,
+            'iron': totals.iron,
+            'calcium': totals.calcium,
+            'potassium': totals.potassium,
+            'sodium': totals.sodium,
         }
-        for meal in self.meals.prefetch_related('items__food').all():
-            nutrients = meal.get_nutrients_consumed()
-            minerals['sodium'] = minerals.get('sodium') + nutrients.get('sodium', 0)
-            minerals['potassium'] = minerals.get('potassium') + nutrients.get('potassium', 0)
-            minerals['calcium'] = minerals.get('calcium') + nutrients.get('calcium', 0)
-            minerals['iron'] = minerals.get('iron') + nutrients.get('iron', 0)
-            minerals['magnesium'] = minerals.get('magnesium') + nutrients.get('magnesium', 0)
-            minerals['zinc'] = minerals.get('zinc') + nutrients.get('zinc', 0)
-        return minerals
 
     @property
     def vitamin_breakdown(self):
         '''
             returns dict of vitamin name to amount in mg or mcg
         '''
-        vitamins = {
-            'A': 0,
-            'B6': 0,
-            'B12': 0,
-            'C': 0,
-            'D': 0,
-            'E': 0,
+        totals = self.totals
+        return {
+            'A': totals.vitamin_a,
+            'B6': totals.vitamin_b6,
+            'B12': totals.vitamin_b12,
+            'C': totals.vitamin_c,
+            'D': totals.vitamin_d,
+            'E': totals.vitamin_e,
         }
-        for meal in self.meals.prefetch_related('items__food').all():
-            nutrients = meal.get_nutrients_consumed()
-            vitamins['A'] = vitamins.get('A') + nutrients.get('vitamin_a', 0)
-            vitamins['B6'] = vitamins.get('B6') + nutrients.get('vitamin_b6', 0)
-            vitamins['B12'] = vitamins.get('B12') + nutrients.get('vitamin_b12', 0)
-            vitamins['C'] = vitamins.get('C') + nutrients.get('vitamin_c', 0)
-            vitamins['D'] = vitamins.get('D') + nutrients.get('vitamin_d', 0)
-            vitamins['E'] = vitamins.get('E') + nutrients.get('vitamin_e', 0)
-        return vitamins
 
     @property
     def calorie_ratio(self):
@@ -249,3 +291,32 @@ class Day(models.Model):
 
     def __str__(self):
         return f"{self.user.username} | {self.date}"
+
+
+class Streak(models.Model):
+    '''
+        a user's logging streak (days with bodyweight, water, sleep or
+        calories entered), kept by core.streaks
+        - start / end : the latest run of consecutive logged days
+        - longest : length of the longest run ever
+    '''
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name="streak")
+    start = models.DateField(null=True, blank=True)
+    end = models.DateField(null=True, blank=True)
+    longest = models.PositiveIntegerField(default=0)
+
+    @property
+    def length(self):
+        return (self.end - self.start).days + 1 if self.end else 0
+
+    def current(self, today):
+        ''' days in a row up to `today`, 0 until today is logged '''
+        if self.end is None or not self.start <= today <= self.end:
+            return 0
+        return (today - self.start).days + 1
+
+    def __str__(self):
+        return f"{self.user.username} streak | {self.start} - {self.end}"
@@ -0,0 +1,91 @@
+'''
+ Coalesced recomputation of the rows core.signals derives (day totals, lift
+ summaries, movement stats, weekly volume, Day.did_workout).
+
+ Receivers don't recompute : they mark a key dirty with mark(kind, key,
+ delta), and the handler registered for that kind recomputes it.
+   - outside a batch     the key is flushed at once : a lone save behaves
+                         as an eager receiver would
+   - inside a batch      marks pile up (deltas of the same key are summed)
+                         and every key is flushed once when the outermost
+                         batch exits
+
+     with recompute.batch():                 # bulk operations
+         for form in formset: form.save()    # 8 items, one day -> one flush
+
+ RecomputeMiddleware runs every POST / PUT / PATCH / DELETE request in a
+ batch. The flush is a transaction.on_commit callback : it runs once the
+ rows that dirtied the keys are committed (at once under autocommit, after
+ the outermost atomic block otherwise), never for a rolled-back transaction,
+ and it writes the derived rows in one transaction of its own. A batch opens
+ no transaction, so a request's slow I/O (the USDA lookup) holds no lock.
+ Kinds are flushed in registration order : a handler may read what an earlier
+ kind wrote. The pending keys live in a ContextVar, so concurrent requests on
+ threads or async tasks never share them.
+'''
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import transaction
+
+_handlers = {}      # kind -> flush({key: summed delta}), in registration order
+_pending = ContextVar('recompute_pending', default=None)
+
+
+def handler(kind):
+    ''' register the function that flushes `kind` : fn({key: delta}) '''
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def mark(kind, key, delta=0):
+    ''' `key` of `kind` needs recomputing; deltas of one key add up until the flush '''
+    pending = _pending.get()
+    if pending is None:
+        _handlers[kind]({key: delta})
+        return
+    keys = pending.setdefault(kind, {})
+    keys[key] = keys.get(key, 0) + delta
+
+
+def flush(pending):
+    with transaction.atomic():
+        for kind, fn in _handlers.items():
+            if pending.get(kind):
+                fn(pending[kind])
+
+
+@contextmanager
+def batch():
+    ''' coalesce every mark() until the outermost batch exits, then flush once per key on commit '''
+    if _pending.get() is not None:
+        yield       # nested : the outer batch flushes
+        return
+    pending = {}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        # handlers' own saves mark eagerly from here on
+        _pending.reset(token)
+        # also on error : rows written before it may be committed already, and
+        # a rolled-back transaction drops the callback
+        if pending:
+            transaction.on_commit(partial(flush, pending))
+
+
+class RecomputeMiddleware:
+    ''' one batch per state-changing request '''
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in self.SAFE_METHODS:
+            return self.get_response(request)
+        with batch():
+            return self.get_response(request)
@@ -1,85 +1,173 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Exists, OuterRef
 from django.conf import settings
+from . import fragments, goals, recompute, streaks
 from .models import Day, Profile
-from calcounter.models import MealConsumption
-from workouts.models import Workout, WorkoutType, Set, WeeklyVolume, Movement, MovementLibrary, Lift, BODYPARTS, WorkoutTypeBodypart
+from calcounter.models import Food, FoodUnit, Ingredient, Meal, MealConsumption, PantryItem, DailyNutrientTotals
+from calcounter import composites, nutrients
+from calcounter.search import FoodEntry, food_index
+from graphs import timeseries
+from workouts.search import library_entry, library_index
+from workouts.models import Workout, WorkoutType, Set, WeeklyVolume, Movement, MovementLibrary, MovementStats, Lift, BODYPARTS, WorkoutTypeBodypart, week_start
 from datetime import datetime, timedelta
 
 
-@receiver([post_save], sender=Day)
-def set_macro_goal(sender, instance, created, **kwargs):
-    # instance.date = YYYY-MM-DD
-    user = instance.user
-    today = instance.date
+@receiver(pre_save, sender=Day)
+def set_new_day_goals(sender, instance, **kwargs):
+    # a new day starts with the goals of the bodyweight in effect (cached inputs)
+    if instance._state.adding and instance.user_id:
+        instance.calorie_goal, instance.protein_goal = goals.goals_for(instance.user_id, instance.date)
 
-    # 1. Force conversion if 'today' is a string
-    if isinstance(today, str):
-        # Handles 'YYYY-MM-DD'
-        today = datetime.strptime(today, '%Y-%m-%d').date()
 
-    if user.days.filter(date=today, bodyweight__isnull=False).exists():
-        most_recent_day = user.days.get(date=today)
-    else:
-        most_recent_day = user.days.filter(bodyweight__isnull=False).order_by('-date').first()
-    if not most_recent_day:
-        print("No bodyweight found: set default goals")
+@receiver(post_save, sender=Day)
+def propagate_day_goals(sender, instance, **kwargs):
+    # only a bodyweight change moves goals : water / sleep / note saves don't
+    if instance.user_id and goals.bodyweight_changed(instance):
+        goals.propagate_bodyweight(instance.user_id, instance.date)
+        instance.calorie_goal, instance.protein_goal = (
+            Day.objects.filter(pk=instance.pk).values_list('calorie_goal', 'protein_goal').get()
+        )
+        instance._loaded_bodyweight = (
+            None if instance.bodyweight in (None, '') else float(instance.bodyweight)
+        )
+
+
+@receiver(post_delete, sender=Day)
+def release_deleted_weigh_in(sender, instance, origin=None, **kwargs):
+    # the days it covered fall back to the previous weigh-in
+    if instance.bodyweight is None or isinstance(origin, User):
         return
+    goals.propagate_bodyweight(instance.user_id, instance.date)
+
+
+@receiver(post_save, sender=Day)
+def update_logging_streak(sender, instance, **kwargs):
+    # only a day gaining or losing data moves the streak
+    logged = instance.logged
+    if instance.user_id and logged != getattr(instance, '_loaded_logged', False):
+        streaks.day_changed(instance.user_id, instance.date, logged)
+    instance._loaded_logged = logged
+
+
+@receiver(post_delete, sender=Day)
+def release_deleted_streak_day(sender, instance, origin=None, **kwargs):
+    if instance.logged and instance.user_id and not isinstance(origin, User):
+        streaks.rebuild(instance.user_id)
+
+
+@receiver(post_save, sender=Profile)
+def propagate_profile_goals(sender, instance, created, **kwargs):
+    if not created and goals.profile_changed(instance):
+        goals.propagate_profile(instance.user_id)
+        instance._loaded_goal_profile = (instance.gender, instance.height, instance.age)
+
+
+@receiver([post_save, post_delete], sender=Day)
+def invalidate_day_series(sender, instance, **kwargs):
+    # bodyweight / water / sleep / goals feed the graphs' cached columns
+    timeseries.invalidate(instance.user_id)
+
 
-    print(f"Setting macros for {instance.date} for user {user}:")
-    bw = most_recent_day.bodyweight
-    # Calories determined with Harris-Benedict
-    if user.profile.gender == "M":
-        bw_kg = bw * 0.45359237
-        BMR = 66.5 + (13.75 * bw_kg) + (5.003 *
-                                        user.profile.height) - (6.75 * user.profile.age)
-        cals = BMR * 1.725
-        pro = bw * 0.8
-    elif user.profile.gender == "F":
-        bw_kg = bw * 0.45359237
-        BMR = 655.1 + (9.563 * bw_kg) + (1.850 *
-                                         user.profile.height) - (4.676 * user.profile.age)
-        cals = BMR * 1.725
-        pro = bw * 0.8
-
-    print(f"{cals=}, {pro=}")
-    Day.objects.filter(pk=instance.pk).update(
-        calorie_goal=cals,
-        protein_goal=pro
+def consumption_snapshot(pk):
+    ''' (day_id, user_id, nutrient vector) a stored MealConsumption contributes '''
+    keys, contributions = nutrients.consumption_matrix(
+        MealConsumption.objects.filter(pk=pk), 'meal__day_id', 'meal__day__user_id'
     )
+    if not keys:
+        return None
+    day_id, user_id = keys[0]
+    return day_id, user_id, contributions[0]
+
+
+def sync_day_macros(day_id):
+    ''' copy calories/protein from the materialized totals onto Day '''
+    totals = (DailyNutrientTotals.objects
+              .filter(day_id=day_id)
+              .values_list('calories', 'protein')
+              .first())
+    total_c, total_p = totals or (0, 0)
+    print(f"New totals for day {day_id}: {total_c} cals, {total_p} pro")
+    before = (Day.objects.filter(pk=day_id)
+              .values_list('user_id', 'date', *Day.LOGGED_FIELDS).first())
+    Day.objects.filter(pk=day_id).update(
+        calories_consumed = round(total_c),
+        protein_consumed = round(total_p)
+    )
+    # .update() fires no Day signal : tell the streak if the day gained / lost data
+    if before is not None:
+        user_id, day, bodyweight, water, sleep, calories = before
+        logged = Day.is_logged(bodyweight, water, sleep, round(total_c))
+        if user_id and logged != Day.is_logged(bodyweight, water, sleep, calories):
+            streaks.day_changed(user_id, day, logged)
+
+
+def deleting_day(origin):
+    ''' the delete cascades from a Day or a User : its totals row goes with it '''
+    return getattr(origin, 'model', type(origin)) in (Day, User)
+
+
+@receiver([pre_save, pre_delete], sender=MealConsumption)
+def snapshot_meal_consumption(sender, instance, origin=None, **kwargs):
+    # remember what the row contributed before it changes / disappears
+    if not instance.pk or deleting_day(origin):
+        instance._nutrient_snapshot = None
+        return
+    instance._nutrient_snapshot = consumption_snapshot(instance.pk)
 
 
 @receiver([post_save, post_delete], sender=MealConsumption)
-def update_day_after_meal_change(sender, instance, **kwargs):
-    # instance is a MealConsumption object
-    meal = instance.meal
-    day = meal.day
-    print(f"Updating {day.date}")
-
-    total_c, total_p = 0, 0
-
-    for meal in day.meals.all():
-        totals = meal.get_nutrients_consumed()
-        total_c += totals['calories']
-        total_p += totals['protein']
-
-    print(f"New totals for {day.date}: {total_c} cals, {total_p} pro")
-    Day.objects.filter(pk=day.id).update(
-        calories_consumed = total_c,
-        protein_consumed = total_p
-    )
+def update_day_after_meal_change(sender, instance, signal, origin=None, **kwargs):
+    # instance is a MealConsumption object : (new - old) is owed to the day row
+    if deleting_day(origin):
+        return
+    old = getattr(instance, '_nutrient_snapshot', None)
+    if old is not None:
+        day_id, user_id, vec = old
+        recompute.mark('day_nutrients', (day_id, user_id), -vec)
+    if signal is post_save:
+        new = consumption_snapshot(instance.pk)
+        if new is not None:
+            day_id, user_id, vec = new
+            recompute.mark('day_nutrients', (day_id, user_id), vec)
+
+
+@recompute.handler('day_nutrients')
+def flush_day_nutrients(deltas):
+    # one delta per day, however many of its items changed
+    users = set()
+    for (day_id, user_id), delta in deltas.items():
+        users.add(user_id)
+        if day_id is None:
+            continue
+        print(f"Updating day {day_id}")
+        DailyNutrientTotals.objects.apply_delta(day_id, delta)
+        sync_day_macros(day_id)
+    # calories/protein were written with .update() : no Day signal fired
+    for user_id in users:
+        timeseries.invalidate(user_id)
+        fragments.bump(user_id, 'meals')
 
 
 @receiver([post_save, post_delete], sender=Workout)
 def update_day_after_workout_change(sender, instance, **kwargs):
-    day = instance.day
-    # did the user just delete or save
-    exists = Workout.objects.filter(day=day).exists()
-    print(f"found workout for day {day}: {exists}")
-    day.did_workout = exists
-    day.save()
+    recompute.mark('day_workout', instance.day_id)
+    previous = getattr(instance, '_previous_day_id', None)
+    if previous is not None:
+        recompute.mark('day_workout', previous)     # moved : the old day may have none left
+
+
+@recompute.handler('day_workout')
+def flush_day_workout(day_ids):
+    # one UPDATE instead of Day.save() : did_workout moves no goal or streak
+    day_ids = [day_id for day_id in day_ids if day_id is not None]
+    Day.objects.filter(pk__in=day_ids).update(
+        did_workout=Exists(Workout.objects.filter(day_id=OuterRef('pk')))
+    )
+    for user_id in set(Day.objects.filter(pk__in=day_ids).values_list('user_id', flat=True)):
+        timeseries.invalidate(user_id)
+        fragments.bump(user_id, 'workouts')
 
 
 DEFAULT_TYPES = [
@@ -168,32 +256,186 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 
-@receiver([post_save, post_delete], sender=Set)
-def update_weekly_volume(sender, instance, **kwargs):
-    # 1. Find the Sunday of the week this set belongs to
-    workout_date = instance.lift.workout.day.date
-    days_since_sunday = (workout_date.weekday() + 1) % 7
-    sunday = workout_date - timedelta(days=days_since_sunday)
-    
-    user = instance.lift.workout.day.user
-    bodypart = instance.lift.movement.bodypart
-
-    # 2. Recalculate total sets for this specific user/week/muscle
-    total_sets = Set.objects.filter(
-        lift__workout__day__user=user,
-        lift__workout__day__date__range=[sunday, sunday + timedelta(days=6)],
-        lift__movement__bodypart=bodypart
-    ).count()
-
-    # 3. Update or create the volume record
-    WeeklyVolume.objects.update_or_create(
-        user=user,
-        start_date=sunday,
-        muscle_group=bodypart,
-        defaults={'set_count': total_sets}
+def set_volume_key(lift_id):
+    ''' (user_id, sunday, muscles) a set on this lift counts toward '''
+    row = (Lift.objects
+           .filter(pk=lift_id)
+           .values_list('workout__day__user_id', 'workout__day__date',
+                        'movement__bodypart', 'movement__secondary_bodypart')
+           .first())
+    if row is None:
+        return None
+    user_id, workout_date, primary, secondary = row
+    return user_id, week_start(workout_date), (primary, secondary)
+
+
+@receiver(pre_save, sender=Set)
+def snapshot_set_lift(sender, instance, **kwargs):
+    # remember which lift an edited set used to belong to
+    instance._previous_lift_id = (
+        Set.objects.filter(pk=instance.pk).values_list('lift_id', flat=True).first()
+        if instance.pk else None
     )
 
 
+@receiver([post_save, post_delete], sender=Set)
+def update_lift_summary(sender, instance, **kwargs):
+    # best set / e1RM / volume / reps / set count are stored on the Lift row
+    lift_ids = {instance.lift_id, getattr(instance, '_previous_lift_id', None)} - {None}
+    for lift_id in lift_ids:
+        recompute.mark('lift_summary', lift_id)
+
+
+@recompute.handler('lift_summary')
+def flush_lift_summary(lift_ids):
+    # flushed before movement_stats, which reads the summary, and
+    # weekly_volume, which invalidates the graph columns
+    for lift_id in lift_ids:
+        Lift.objects.refresh_summary(lift_id)
+
+
+@receiver([post_save, post_delete], sender=Set)
+def update_movement_stats(sender, instance, signal, origin=None, **kwargs):
+    # records, rep maxes and PR counts per movement (reads the summary above);
+    # sets cascading from a deleted lift are handled once by replay_movement_stats
+    if signal is post_delete and getattr(origin, 'model', type(origin)) is not Set:
+        return
+    previous = getattr(instance, '_previous_lift_id', None)
+    if previous not in (None, instance.lift_id):
+        recompute.mark('movement_stats', previous)
+    recompute.mark('movement_stats', instance.lift_id)
+
+
+@recompute.handler('movement_stats')
+def flush_movement_stats(lift_ids):
+    for lift_id in lift_ids:
+        MovementStats.objects.refresh_for_lift(lift_id)
+
+
+@recompute.handler('movement_replay')
+def flush_movement_replay(movement_ids):
+    # a lift moved to another movement or date : replay both histories
+    for movement_id in movement_ids:
+        MovementStats.objects.rebuild(movement_id)
+
+
+@receiver(post_delete, sender=Lift)
+def replay_movement_stats(sender, instance, origin=None, **kwargs):
+    # nothing to replay when the movement or the whole account is going away
+    if getattr(origin, 'model', type(origin)) in (Movement, User):
+        return
+    MovementStats.objects.rebuild(instance.movement_id, workout_ids=[instance.workout_id])
+
+
+@receiver([post_save, post_delete], sender=Set)
+def update_weekly_volume(sender, instance, signal, created=False, **kwargs):
+    # +1 on a new set, -1 on delete, move the set if its lift changed
+    if signal is post_delete:
+        moves = [(instance.lift_id, -1)]
+    elif created:
+        moves = [(instance.lift_id, 1)]
+    else:
+        previous = getattr(instance, '_previous_lift_id', None)
+        if previous is None or previous == instance.lift_id:
+            moves = [(instance.lift_id, 0)]  # reps/weight edit : set count unchanged
+        else:
+            moves = [(previous, -1), (instance.lift_id, 1)]
+
+    for lift_id, delta in moves:
+        key = set_volume_key(lift_id)
+        if key is not None:
+            recompute.mark('weekly_volume', key, delta)
+
+
+@recompute.handler('weekly_volume')
+def flush_weekly_volume(deltas):
+    # one UPDATE per (user, week, muscles), with the sets added / removed summed
+    users = set()
+    for (user_id, sunday, muscles), delta in deltas.items():
+        WeeklyVolume.objects.apply_delta(user_id, sunday, muscles, delta)
+        users.add(user_id)
+    # reps * weight feeds the graphs' cached volume columns
+    for user_id in users:
+        timeseries.invalidate(user_id)
+        fragments.bump(user_id, 'workouts')
+
+
+# --- Moved lifts, workouts and re-targeted movements ---
+# their sets count toward other (user, week, muscles) keys, and their lifts
+# sit in another movement's history : snapshot the old keys before the save
+
+def volume_keys(sets):
+    ''' {(user_id, sunday, muscles): set count} of a Set queryset, one grouped query '''
+    rows = (sets.values_list('lift__workout__day__user_id', 'lift__workout__day__date',
+                             'lift__movement__bodypart', 'lift__movement__secondary_bodypart')
+            .annotate(n=Count('id')).order_by())
+    keys = {}
+    for user_id, day_date, primary, secondary, n in rows:
+        key = (user_id, week_start(day_date), (primary, secondary))
+        keys[key] = keys.get(key, 0) + n
+    return keys
+
+
+def move_volume(before, sets):
+    for key, n in before.items():
+        recompute.mark('weekly_volume', key, -n)
+    for key, n in volume_keys(sets).items():
+        recompute.mark('weekly_volume', key, n)
+
+
+@receiver(pre_save, sender=Lift)
+def snapshot_lift_movement(sender, instance, **kwargs):
+    previous = (Lift.objects.filter(pk=instance.pk).values_list('movement_id', flat=True).first()
+                if instance.pk else None)
+    moved = previous not in (None, instance.movement_id)
+    instance._previous_movement_id = previous if moved else None
+    instance._previous_volume = volume_keys(Set.objects.filter(lift_id=instance.pk)) if moved else {}
+
+
+@receiver(post_save, sender=Lift)
+def move_lift_records(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_movement_id', None)
+    if previous is None:
+        return
+    move_volume(instance._previous_volume, Set.objects.filter(lift_id=instance.pk))
+    recompute.mark('movement_replay', previous)
+    recompute.mark('movement_replay', instance.movement_id)
+
+
+@receiver(pre_save, sender=Workout)
+def snapshot_workout_day(sender, instance, **kwargs):
+    previous = (Workout.objects.filter(pk=instance.pk).values_list('day_id', flat=True).first()
+                if instance.pk else None)
+    moved = previous not in (None, instance.day_id)
+    instance._previous_day_id = previous if moved else None
+    instance._previous_volume = (volume_keys(Set.objects.filter(lift__workout_id=instance.pk))
+                                 if moved else {})
+
+
+@receiver(post_save, sender=Workout)
+def move_workout_records(sender, instance, **kwargs):
+    if getattr(instance, '_previous_day_id', None) is None:
+        return
+    move_volume(instance._previous_volume, Set.objects.filter(lift__workout_id=instance.pk))
+    for movement_id in set(instance.lifts.values_list('movement_id', flat=True)):
+        recompute.mark('movement_replay', movement_id)
+
+
+@receiver(pre_save, sender=Movement)
+def snapshot_movement_bodyparts(sender, instance, **kwargs):
+    previous = (Movement.objects.filter(pk=instance.pk)
+                .values_list('bodypart', 'secondary_bodypart').first() if instance.pk else None)
+    moved = previous not in (None, (instance.bodypart, instance.secondary_bodypart))
+    instance._previous_volume = (volume_keys(Set.objects.filter(lift__movement_id=instance.pk))
+                                 if moved else None)
+
+
+@receiver(post_save, sender=Movement)
+def move_movement_volume(sender, instance, **kwargs):
+    if getattr(instance, '_previous_volume', None) is not None:
+        move_volume(instance._previous_volume, Set.objects.filter(lift__movement_id=instance.pk))
+
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def provision_starter_movements(sender, instance, created, **kwargs):
     if created:
@@ -227,3 +469,149 @@ def level_down_movements(sender, instance, **kwargs):
     instance.movement.level -= 0.5
     instance.movement.save()
     print(f"Leveled down {instance.movement.name} to {instance.movement.level}")
+
+
+# === Typeahead indexes ===
+
+@receiver(post_save, sender=Food)
+def update_food_index(sender, instance, **kwargs):
+    # only the global catalog is held in memory; user foods are read per request
+    if instance.owner_id is not None:
+        return
+    if instance.is_active:
+        food_index.update(FoodEntry(instance.pk, instance.name), instance.name)
+    else:
+        food_index.remove(instance.pk)
+
+@receiver(post_delete, sender=Food)
+def remove_from_food_index(sender, instance, **kwargs):
+    if instance.owner_id is None:
+        food_index.remove(instance.pk)
+
+@receiver(post_save, sender=MovementLibrary)
+def update_library_index(sender, instance, **kwargs):
+    library_index.update(library_entry(instance), instance.name)
+
+@receiver(post_delete, sender=MovementLibrary)
+def remove_from_library_index(sender, instance, **kwargs):
+    library_index.remove(instance.pk)
+
+
+# === Fragment versions (core.fragments) ===
+
+def food_owner(food_id):
+    return Food.objects.filter(pk=food_id).values_list('owner_id', flat=True).first()
+
+
+def bump_food_fragments(owner_id):
+    # a catalog food can sit in anyone's pantry / meals
+    if owner_id is None:
+        fragments.bump(None, 'foods')
+    else:
+        fragments.bump(owner_id, 'pantry', 'meals')
+
+
+@receiver([post_save, post_delete], sender=Food)
+def bump_food_versions(sender, instance, **kwargs):
+    bump_food_fragments(instance.owner_id)
+
+
+@receiver([post_save, post_delete], sender=FoodUnit)
+def bump_food_unit_versions(sender, instance, **kwargs):
+    bump_food_fragments(food_owner(instance.food_id))
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_ingredient_versions(sender, instance, **kwargs):
+    bump_food_fragments(food_owner(instance.complex_food_id))
+
+
+@receiver([post_save, post_delete], sender=PantryItem)
+def bump_pantry_versions(sender, instance, **kwargs):
+    fragments.bump(instance.user_id, 'pantry')
+
+
+@receiver([post_save, post_delete], sender=Meal)
+def bump_meal_versions(sender, instance, **kwargs):
+    # item changes are bumped by update_day_after_meal_change
+    user_id = Day.objects.filter(pk=instance.day_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        fragments.bump(user_id, 'meals')
+
+
+@receiver([post_save, post_delete], sender=Lift)
+def bump_lift_versions(sender, instance, **kwargs):
+    # set changes are bumped by flush_weekly_volume
+    user_id = (Workout.objects.filter(pk=instance.workout_id)
+               .values_list('day__user_id', flat=True).first())
+    if user_id is not None:
+        fragments.bump(user_id, 'workouts')
+
+
+@receiver([post_save, post_delete], sender=WorkoutType)
+@receiver([post_save, post_delete], sender=Movement)
+def bump_workout_versions(sender, instance, **kwargs):
+    fragments.bump(instance.user_id, 'workouts')
+
+
+@receiver(post_save, sender=Profile)
+def bump_profile_versions(sender, instance, **kwargs):
+    # nutrient goals (RDA group) shape the pantry and meal fingerprints
+    fragments.bump(instance.user_id, 'profile')
+    fragments.remember_timezone(instance.user_id, instance.timezone)
+
+
+# === Composite foods (calcounter.composites) ===
+
+@receiver(pre_save, sender=Ingredient)
+def reject_ingredient_cycle(sender, instance, **kwargs):
+    composites.check_edge(instance.complex_food_id, instance.ingredient_id)
+
+
+@receiver(pre_save, sender=Food)
+def snapshot_food_nutrients(sender, instance, **kwargs):
+    # read by refresh_composite_foods : Food.save() resets the snapshot afterwards
+    instance._nutrients_changed = instance.nutrients_changed
+
+
+@receiver(post_save, sender=Food)
+def refresh_composite_foods(sender, instance, created, **kwargs):
+    # composites store per-100g nutrients computed from their ingredients;
+    # they are written with bulk_update : bump their owners' fragments here
+    if created or not instance._nutrients_changed:
+        return
+    updated = composites.refresh([instance.pk])
+    if updated:
+        for owner_id in set(Food.objects.filter(pk__in=updated).values_list('owner_id', flat=True)):
+            bump_food_fragments(owner_id)
+    mark_consuming_days(food_id__in=[instance.pk, *updated])
+
+
+# === Day totals of edited foods ===
+
+def mark_consuming_days(**lookup):
+    ''' every day with an item matching `lookup` gets its totals re-summed (one query) '''
+    days = (MealConsumption.objects.filter(**lookup)
+            .values_list('meal__day_id', 'meal__day__user_id').distinct())
+    with recompute.batch():     # all of them in one flush, even outside a request
+        for day_id, user_id in days:
+            if day_id is not None:
+                recompute.mark('day_totals', (day_id, user_id))
+
+
+@recompute.handler('day_totals')
+def flush_day_totals(days):
+    # after day_nutrients : a full re-sum supersedes any pending delta
+    DailyNutrientTotals.objects.rebuild_days(day_id for day_id, _ in days)
+    for day_id, _ in days:
+        sync_day_macros(day_id)
+    for user_id in {user_id for _, user_id in days}:
+        timeseries.invalidate(user_id)
+        fragments.bump(user_id, 'meals')
+
+
+@receiver(post_save, sender=FoodUnit)
+def rebuild_days_after_unit_change(sender, instance, created, **kwargs):
+    if not created and instance.gram_weight_changed:
+        mark_consuming_days(unit_id=instance.pk)
+    instance._loaded_gram_weight = instance.gram_weight
@@ -0,0 +1,85 @@
+'''
+ Consecutive-day streaks.
+
+ runs() / summarize() run-length encode sorted dates with numpy; they also
+ give graphs.stats its workout streaks. The logging streak (days with a
+ bodyweight, water, sleep or calories entered) is stored per user in
+ core.Streak and kept up by core.signals when a day gains or loses data:
+   - a logged day inside the latest run         nothing
+   - a logged day right after / after the run   one UPDATE (extend / restart)
+   - anything else (gap filled, data removed)   rebuild() : one ordered date
+                                                query + run-length encoding
+ so the dashboard's curr_streak is a single row read.
+'''
+from datetime import date, timedelta
+
+import numpy as np
+from django.db.models import Q
+
+from .models import Day, Streak
+
+ONE_DAY = timedelta(days=1)
+
+# a Day row counts once any of Day.LOGGED_FIELDS is entered
+LOGGED = (Q(bodyweight__isnull=False) | ~Q(water_consumed=0)
+          | ~Q(sleep=0) | ~Q(calories_consumed=0))
+
+_EPOCH = date(1970, 1, 1)
+
+
+# --- Run-length encoding ---
+
+def runs(days):
+    ''' (first day, length) arrays of each run of consecutive day numbers '''
+    days = np.unique(np.asarray(days, dtype=np.int64))
+    if not len(days):
+        return days, days
+    firsts = np.flatnonzero(np.diff(days, prepend=days[0] - 2) != 1)
+    lengths = np.diff(np.append(firsts, len(days)))
+    return days[firsts], lengths
+
+
+def summarize(dates):
+    ''' (start, end, longest) : the latest run of consecutive dates and the longest run length '''
+    days = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+    firsts, lengths = runs(days)
+    if not len(lengths):
+        return None, None, 0
+    start = _EPOCH + timedelta(days=int(firsts[-1]))
+    return start, start + timedelta(days=int(lengths[-1]) - 1), int(lengths.max())
+
+
+# --- Stored logging streak ---
+
+def rebuild(user_id):
+    ''' recompute a user's Streak from their logged dates (one query) '''
+    dates = (Day.objects.filter(LOGGED, user_id=user_id)
+             .order_by('date').values_list('date', flat=True))
+    start, end, longest = summarize(list(dates))
+    streak, _ = Streak.objects.update_or_create(
+        user_id=user_id, defaults={'start': start, 'end': end, 'longest': longest}
+    )
+    return streak
+
+
+def day_changed(user_id, day, logged):
+    ''' `day` was entered (logged=True) or emptied : extend the latest run or rebuild '''
+    streak = Streak.objects.filter(user_id=user_id).first()
+    if streak is None or not logged:
+        return rebuild(user_id)
+    if streak.end is not None and streak.start <= day <= streak.end:
+        return streak
+    if streak.end is None or day > streak.end + ONE_DAY:
+        streak.start = day                  # nothing logged between end and day
+    elif day != streak.end + ONE_DAY:
+        return rebuild(user_id)             # an older day : runs may merge
+    streak.end = day
+    streak.longest = max(streak.longest, streak.length)
+    streak.save(update_fields=['start', 'end', 'longest'])
+    return streak
+
+
+def current(user, today):
+    ''' the user's current logging streak (one row read) '''
+    streak = Streak.objects.filter(user=user).first()
+    return streak.current(today) if streak else 0
@@ -0,0 +1,152 @@
+'''
+ Synthetic heavy users for benchmarks (manage.py bench_views).
+
+ make_heavy_user() writes years of realistic history with bulk_create, then
+ fills the tables the signals would normally maintain (DailyNutrientTotals,
+ Day macros / did_workout, Lift summaries, MovementStats, WeeklyVolume,
+ Streak) in one pass each, so a 3-year user takes seconds instead of tens of
+ thousands of signal round trips.
+'''
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from calcounter import nutrients
+from calcounter.models import Food, FoodUnit, PantryItem, Meal, MealConsumption, DailyNutrientTotals
+from core import streaks
+from core.models import Day
+from graphs import timeseries
+from workouts.models import Movement, MovementStats, WorkoutType, Workout, Lift, Set, WeeklyVolume
+
+MEAL_NAMES = ['Breakfast', 'Snack', 'Lunch', 'Pre-workout', 'Dinner', 'Dessert']
+FOOD_WORDS = ['Chicken', 'Rice', 'Oats', 'Eggs', 'Salmon', 'Yogurt', 'Beef', 'Beans',
+              'Bread', 'Apple', 'Banana', 'Milk', 'Cheese', 'Potato', 'Tofu', 'Pasta']
+MOVEMENTS = [
+    # (name, bodypart, category)
+    ('Bench Press', 'CH', 'B'), ('Incline Dumbbell Press', 'CH', 'D'),
+    ('Overhead Press', 'FS', 'B'), ('Lateral Raise', 'LS', 'D'),
+    ('Tricep Pushdown', 'TI', 'C'), ('Pull Up', 'LT', 'H'),
+    ('Barbell Row', 'LT', 'B'), ('Face Pull', 'RS', 'C'),
+    ('Barbell Curl', 'BI', 'B'), ('Shrug', 'TR', 'D'),
+    ('Squat', 'QD', 'B'), ('Romanian Deadlift', 'HM', 'B'),
+    ('Leg Press', 'QD', 'M'), ('Calf Raise', 'CV', 'M'), ('Hip Thrust', 'GL', 'B'),
+]
+BATCH = 2000
+
+
+def make_heavy_user(username='bench', days=3 * 365 + 30, meals_per_day=5, items_per_meal=3,
+                    pantry_size=400, workouts_per_week=4, lifts_per_workout=5,
+                    sets_per_lift=5, end=None, seed=0):
+    ''' create a user with `days` of history ending at `end` (default today); returns the user '''
+    rng = random.Random(seed)
+    end = end or date.today()
+    with transaction.atomic():
+        user = get_user_model().objects.create_user(username, password='bench-password')
+        profile = user.profile
+        profile.gender, profile.age, profile.height = 'M', 30, 180.0
+        profile.save()
+
+        # --- Days ---
+        bodyweight = 185.0
+        day_rows = []
+        for i in range(days):
+            bodyweight += rng.uniform(-0.6, 0.55)
+            day_rows.append(Day(
+                user=user,
+                date=end - timedelta(days=days - 1 - i),
+                bodyweight=round(bodyweight, 1) if rng.random() < 0.85 else None,
+                entered_bodyweight=True,
+                water_consumed=rng.randint(20, 90),
+                sleep=round(rng.uniform(5, 9.5), 1),
+                calorie_goal=2600,
+                protein_goal=150,
+            ))
+        day_list = Day.objects.bulk_create(day_rows, batch_size=BATCH)
+
+        # --- Pantry ---
+        foods = Food.objects.bulk_create([
+            Food(
+                name=f"{rng.choice(FOOD_WORDS)} {rng.choice(FOOD_WORDS).lower()} #{i}",
+                owner=user,
+                calories=rng.randint(50, 400), protein=rng.randint(0, 35),
+                fat=rng.randint(0, 25), carb=rng.randint(0, 60),
+                sugar=rng.randint(0, 20), fiber=rng.randint(0, 10),
+                calcium=rng.uniform(0, 200), iron=rng.uniform(0, 5),
+                sodium=rng.uniform(0, 800), potassium=rng.uniform(0, 600),
+                vitamin_c=rng.uniform(0, 40), vitamin_d=rng.uniform(0, 5),
+            ) for i in range(pantry_size)
+        ], batch_size=BATCH)
+        units = FoodUnit.objects.bulk_create([
+            FoodUnit(food=food, name='serving', gram_weight=rng.choice([30, 50, 100, 150, 200]))
+            for food in foods
+        ], batch_size=BATCH)
+        PantryItem.objects.bulk_create([
+            PantryItem(user=user, food=food, unit=unit, amount=rng.randint(0, 5))
+            for food, unit in zip(foods, units)
+        ], batch_size=BATCH)
+
+        # --- Meals ---
+        meals = Meal.objects.bulk_create([
+            Meal(day=day, name=MEAL_NAMES[m % len(MEAL_NAMES)])
+            for day in day_list for m in range(meals_per_day)
+        ], batch_size=BATCH)
+        consumptions = []
+        for meal in meals:
+            for _ in range(items_per_meal):
+                k = rng.randrange(pantry_size)
+                consumptions.append(MealConsumption(
+                    meal=meal, food=foods[k], unit=units[k], amount=rng.choice([0.5, 1, 1.5, 2])
+                ))
+        MealConsumption.objects.bulk_create(consumptions, batch_size=BATCH)
+
+        # --- Workouts ---
+        wtypes = list(WorkoutType.objects.filter(user=user))
+        movements = Movement.objects.bulk_create([
+            Movement(user=user, name=name, bodypart=bodypart, category=category)
+            for name, bodypart, category in MOVEMENTS
+        ])
+
+        workout_days = [day for day in day_list
+                        if rng.random() < workouts_per_week / 7]
+        workouts = Workout.objects.bulk_create([
+            Workout(day=day, workout_type=wtypes[i % len(wtypes)] if wtypes else None)
+            for i, day in enumerate(workout_days)
+        ], batch_size=BATCH)
+        lifts = Lift.objects.bulk_create([
+            Lift(workout=workout, movement=rng.choice(movements))
+            for workout in workouts for _ in range(lifts_per_workout)
+        ], batch_size=BATCH)
+        Set.objects.bulk_create([
+            Set(lift=lift, order=n, reps=rng.randint(5, 12),
+                weight=round(rng.uniform(45, 315) / 5) * 5)
+            for lift in lifts for n in range(sets_per_lift)
+        ], batch_size=BATCH)
+
+        # --- Derived tables the signals maintain ---
+        totals = nutrients.grouped_totals(
+            MealConsumption.objects.filter(meal__day__user=user), 'meal__day_id'
+        )
+        DailyNutrientTotals.objects.bulk_create([
+            DailyNutrientTotals(day_id=day_id, **nutrients.to_dict(vec))
+            for day_id, vec in totals.items()
+        ], batch_size=BATCH)
+        trained = {workout.day_id for workout in workouts}
+        for day in day_list:
+            if day.id in totals:
+                consumed = nutrients.to_dict(totals[day.id])
+                day.calories_consumed = round(consumed['calories'])
+                day.protein_consumed = round(consumed['protein'])
+                day.entered_meal = True
+            day.did_workout = day.id in trained
+        Day.objects.bulk_update(
+            day_list, ['calories_consumed', 'protein_consumed', 'entered_meal', 'did_workout'],
+            batch_size=BATCH,
+        )
+        Lift.objects.rebuild_summaries(Lift.objects.filter(workout__day__user=user))
+        MovementStats.objects.rebuild_all(Movement.objects.filter(user=user))
+        WeeklyVolume.objects.rebuild(users=[user])
+        streaks.rebuild(user.id)
+    timeseries.invalidate(user.id)
+    return user
@@ -1,7 +1,28 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
-from core.models import Day, Profile
-from datetime import date
+from core import fragments, goals, recompute, streaks
+from core.models import Day, Profile, Streak
+from core.utils import DayRange, get_or_create_day
+from core.middleware import (
+    QueryBudgetMiddleware, QueryBudgetExceeded, fingerprint, query_budget,
+    UNRESOLVED, query_reports, reset_query_reports,
+)
+from calcounter.models import Food, FoodUnit, Meal, MealConsumption, PantryItem, DailyNutrientTotals
+from workouts.models import Movement, MovementStats, WorkoutType, Workout, Lift, Set, WeeklyVolume, week_start
+from core.synthetic import make_heavy_user
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Sum
+from io import StringIO
+from pathlib import Path
+import json
+import tempfile
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from unittest import mock
 
 
 # ==============================================================================
@@ -88,7 +109,7 @@ class MacroGoalCalculationTest(TestCase):
         cals_at_150 = light_day.calorie_goal
 
         # Update day 1 to heavier weight, re-trigger signal by saving day 2
-        Day.objects.filter(user=self.user, date=date(2025, 2, 1)).update(bodyweight=200)
+        self._day(date(2025, 2, 1), bodyweight=200)
         light_day.notes = "re-trigger"
         light_day.save()
         light_day.refresh_from_db()
@@ -102,7 +123,7 @@ class MacroGoalCalculationTest(TestCase):
         heavy_day.refresh_from_db()
         cals_at_200 = heavy_day.calorie_goal
 
-        Day.objects.filter(user=self.user, date=date(2025, 2, 1)).update(bodyweight=150)
+        self._day(date(2025, 2, 1), bodyweight=150)
         heavy_day.notes = "re-trigger"
         heavy_day.save()
         heavy_day.refresh_from_db()
@@ -116,7 +137,7 @@ class MacroGoalCalculationTest(TestCase):
         today.refresh_from_db()
         self.assertAlmostEqual(today.protein_goal, 170 * 0.8, places=0)
 
-        Day.objects.filter(user=self.user, date=date(2025, 2, 1)).update(bodyweight=210)
+        self._day(date(2025, 2, 1), bodyweight=210)
         today.notes = "re-trigger"
         today.save()
         today.refresh_from_db()
@@ -164,3 +185,566 @@ class MacroGoalCalculationTest(TestCase):
         today.refresh_from_db()
         self.assertGreater(today.calorie_goal, 0)
         self.assertGreater(today.protein_goal, 0)
+
+
+class GoalResolverTest(TestCase):
+    """core.goals : goals move only with bodyweight / profile changes, forward to the next weigh-in."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('goals', password='testpass')
+        self.profile = Profile.objects.get(user=self.user)
+        self.profile.gender, self.profile.age, self.profile.height = 'M', 30, 180.0
+        self.profile.save()
+        self.profile = Profile.objects.get(user=self.user)
+
+    def _weigh_in(self, day, bodyweight):
+        day = Day.objects.get_or_create(user=self.user, date=day)[0]
+        day.bodyweight = bodyweight
+        day.save()
+        return day
+
+    def _goals(self, day):
+        return Day.objects.filter(user=self.user, date=day).values_list('calorie_goal', 'protein_goal').get()
+
+    def _expected(self, bodyweight):
+        return goals.harris_benedict(bodyweight, ('M', 180.0, 30))
+
+    def test_formula_matches_harris_benedict(self):
+        cals, pro = goals.harris_benedict(170, ('M', 180.0, 25))
+        bmr = 66.5 + 13.75 * 170 * 0.45359237 + 5.003 * 180 - 6.75 * 25
+        self.assertEqual((cals, pro), (round(bmr * 1.725), 136))
+        self.assertLess(goals.harris_benedict(170, ('F', 180.0, 25))[0], cals)
+
+    def test_bodyweight_change_propagates_to_next_weigh_in(self):
+        for n in range(1, 8):
+            Day.objects.create(user=self.user, date=date(2025, 1, n))
+        self._weigh_in(date(2025, 1, 2), 180)
+        self._weigh_in(date(2025, 1, 5), 190)
+        self.assertEqual(self._goals(date(2025, 1, 1)), goals.default_goals())
+        self.assertEqual(self._goals(date(2025, 1, 4)), self._expected(180))
+        self.assertEqual(self._goals(date(2025, 1, 7)), self._expected(190))
+
+        self._weigh_in(date(2025, 1, 2), 170)
+        self.assertEqual(self._goals(date(2025, 1, 3)), self._expected(170))
+        self.assertEqual(self._goals(date(2025, 1, 6)), self._expected(190))
+
+        Day.objects.get(user=self.user, date=date(2025, 1, 5)).delete()
+        self.assertEqual(self._goals(date(2025, 1, 7)), self._expected(170))
+
+    def test_new_day_uses_cached_inputs(self):
+        self._weigh_in(date(2025, 1, 2), 180)
+        Day.objects.create(user=self.user, date=date(2025, 1, 3))
+        with self.assertNumQueries(1):
+            Day.objects.create(user=self.user, date=date(2025, 1, 4))
+        self.assertEqual(self._goals(date(2025, 1, 4)), self._expected(180))
+        # back-dated before the first weigh-in : field defaults
+        Day.objects.create(user=self.user, date=date(2025, 1, 1))
+        self.assertEqual(self._goals(date(2025, 1, 1)), goals.default_goals())
+
+    def test_water_and_sleep_saves_do_not_touch_goals(self):
+        day = self._weigh_in(date(2025, 1, 2), 180)
+        day = Day.objects.get(pk=day.pk)
+        day.water_consumed += 2
+        day.sleep = 8
+        with self.assertNumQueries(1):
+            day.save()
+        self.assertEqual(self._goals(date(2025, 1, 2)), self._expected(180))
+
+    def test_stale_day_keeps_goals_unless_they_were_edited(self):
+        Day.objects.create(user=self.user, date=date(2025, 1, 3))
+        stale = Day.objects.get(user=self.user, date=date(2025, 1, 3))
+        self._weigh_in(date(2025, 1, 2), 180)
+        stale.note = 'rest day'
+        stale.save()
+        self.assertEqual(self._goals(date(2025, 1, 3)), self._expected(180))
+
+        stale.calorie_goal = 2500
+        stale.save()
+        self.assertEqual(self._goals(date(2025, 1, 3)), (2500, self._expected(180)[1]))
+
+    def test_profile_change_rewrites_weighed_in_days(self):
+        Day.objects.create(user=self.user, date=date(2025, 1, 1))
+        self._weigh_in(date(2025, 1, 2), 180)
+        Day.objects.create(user=self.user, date=date(2025, 1, 3))
+        self._weigh_in(date(2025, 1, 4), 200)
+
+        self.profile.age = 60
+        with self.assertNumQueries(4):
+            self.profile.save()
+        older = ('M', 180.0, 60)
+        self.assertEqual(self._goals(date(2025, 1, 1)), goals.default_goals())
+        self.assertEqual(self._goals(date(2025, 1, 3)), goals.harris_benedict(180, older))
+        self.assertEqual(self._goals(date(2025, 1, 4)), goals.harris_benedict(200, older))
+
+        # saving the same profile again changes nothing
+        with self.assertNumQueries(1):
+            self.profile.save()
+
+
+# ==============================================================================
+# DayRange — one query for existing days, one bulk_create for the missing ones
+# ==============================================================================
+
+class DayRangeTest(TestCase):
+    """DayRange fetches a user's days by date and bulk-creates the gaps with their goals."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ranger', password='testpass')
+        self.other = User.objects.create_user('other', password='testpass')
+        Day.objects.create(user=self.other, date=date(2025, 1, 3))
+
+    def test_existing_range_is_one_query(self):
+        for n in range(1, 8):
+            Day.objects.create(user=self.user, date=date(2025, 1, n), water_consumed=n)
+        with self.assertNumQueries(1):
+            days = DayRange(self.user, date(2025, 1, 1), date(2025, 1, 7))
+        self.assertEqual(list(days), [date(2025, 1, n) for n in range(1, 8)])
+        self.assertEqual(days['2025-01-03'].water_consumed, 3)
+
+    def test_missing_days_are_bulk_created_with_goals(self):
+        Day.objects.create(user=self.user, date=date(2025, 1, 2))
+        weigh_in = Day.objects.get(user=self.user, date=date(2025, 1, 2))
+        weigh_in.bodyweight = 180
+        weigh_in.save()
+        days = DayRange(self.user, '2025-01-01', '2025-01-14')
+        self.assertEqual(len(days), 14)
+        self.assertEqual(Day.objects.filter(user=self.user).count(), 14)
+        self.assertEqual(Day.objects.filter(user=self.other).count(), 1)
+        profile = (self.user.profile.gender, self.user.profile.height, self.user.profile.age)
+        expected = goals.harris_benedict(180, profile)
+        self.assertEqual((days[date(2025, 1, 9)].calorie_goal, days[date(2025, 1, 9)].protein_goal), expected)
+        self.assertEqual(days[date(2025, 1, 1)].calorie_goal, goals.default_goals()[0])
+        self.assertIsNotNone(days[date(2025, 1, 14)].pk)
+
+    def test_create_false_only_reads(self):
+        DayRange(self.user, date(2025, 1, 1), date(2025, 1, 3), create=False)
+        self.assertFalse(Day.objects.filter(user=self.user).exists())
+
+    def test_of_dates_covers_only_the_dates_given(self):
+        Day.objects.create(user=self.user, date=date(2025, 1, 5))
+        days = DayRange.of_dates(self.user, ['2025-03-01', date(2025, 1, 5), date(2020, 6, 1)])
+        self.assertEqual(list(days), [date(2020, 6, 1), date(2025, 1, 5), date(2025, 3, 1)])
+        self.assertEqual(Day.objects.filter(user=self.user).count(), 3)
+
+    def test_get_or_create_day_uses_the_range(self):
+        day = get_or_create_day(self.user, '2025-02-01')
+        self.assertEqual(day.date, date(2025, 2, 1))
+        self.assertEqual(get_or_create_day(self.user, date(2025, 2, 1)).pk, day.pk)
+
+
+# ==============================================================================
+# Streaks — stored logging streak, kept as days gain or lose data
+# ==============================================================================
+
+class StreakTest(TestCase):
+    """core.streaks extends the stored run in place and rebuilds only on gaps / removals."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('streaker', password='testpass')
+        self.today = date.today()
+
+    def _log(self, days_ago, **fields):
+        day = get_or_create_day(self.user, self.today - timedelta(days=days_ago))
+        for name, value in (fields or {'water_consumed': 10}).items():
+            setattr(day, name, value)
+        day.save()
+        return day
+
+    def _streak(self):
+        return Streak.objects.get(user=self.user)
+
+    def test_summarize(self):
+        dates = [date(2025, 1, d) for d in (1, 2, 3, 5, 6, 9)]
+        self.assertEqual(streaks.summarize(dates), (date(2025, 1, 9), date(2025, 1, 9), 3))
+        self.assertEqual(streaks.summarize(dates[:5]), (date(2025, 1, 5), date(2025, 1, 6), 3))
+        self.assertEqual(streaks.summarize([]), (None, None, 0))
+
+    def test_consecutive_days_extend_without_rebuilding(self):
+        self._log(4)
+        with mock.patch.object(streaks, 'rebuild', wraps=streaks.rebuild) as rebuild:
+            for days_ago in (3, 2, 1, 0):
+                self._log(days_ago)
+            self._log(0, sleep=8)  # already logged : no change
+        rebuild.assert_not_called()
+        streak = self._streak()
+        self.assertEqual((streak.start, streak.end, streak.longest),
+                         (self.today - timedelta(days=4), self.today, 5))
+        self.assertEqual(streak.current(self.today), 5)
+
+    def test_filling_a_gap_merges_runs(self):
+        for days_ago in (5, 4, 2, 1, 0):
+            self._log(days_ago)
+        self.assertEqual(self._streak().current(self.today), 3)
+        self._log(3, bodyweight=180)
+        self.assertEqual(self._streak().current(self.today), 6)
+        self.assertEqual(self._streak().longest, 6)
+
+    def test_clearing_a_day_breaks_the_streak(self):
+        for days_ago in (2, 1, 0):
+            self._log(days_ago)
+        self._log(1, water_consumed=0)
+        self.assertEqual(self._streak().current(self.today), 1)
+        self.assertEqual(self._streak().longest, 1)
+
+    def test_unlogged_today_is_zero(self):
+        self._log(1)
+        self.assertEqual(self._streak().current(self.today), 0)
+        self._log(0, note='nothing logged')
+        self.assertEqual(self._streak().current(self.today), 0)
+
+    def test_meal_calories_count(self):
+        self._log(1)
+        day = get_or_create_day(self.user, self.today)
+        food = Food.objects.create(name='Oats', calories=300, protein=10)
+        unit = FoodUnit.objects.create(food=food, name='serving', gram_weight=100)
+        meal = Meal.objects.create(day=day, name='Breakfast')
+        consumption = MealConsumption.objects.create(meal=meal, food=food, amount=1, unit=unit)
+        self.assertEqual(self._streak().current(self.today), 2)
+        consumption.delete()
+        self.assertEqual(self._streak().current(self.today), 0)
+
+    def test_view_reads_the_stored_streak(self):
+        for days_ago in (1, 0):
+            self._log(days_ago)
+        self.client.login(username='streaker', password='testpass')
+        with mock.patch.object(streaks, 'rebuild') as rebuild:
+            response = self.client.get(reverse('core:curr_streak'))
+        rebuild.assert_not_called()
+        self.assertEqual(response.context['streak'], 2)
+
+
+# ==============================================================================
+# Fragment cache — HTMX partials keyed by per-user data versions
+# ==============================================================================
+
+class FragmentCacheTest(TestCase):
+    """Unchanged partials answer 304 or cached HTML; any write behind them re-renders."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('fragments', password='testpass')
+        self.day = Day.objects.create(user=self.user, date=date(2025, 1, 6))
+        self.food = Food.objects.create(name='Granola', calories=400, protein=10, owner=self.user)
+        self.unit = FoodUnit.objects.create(food=self.food, name='serving', gram_weight=50)
+        self.client.login(username='fragments', password='testpass')
+        self.meals = (reverse('calcounter:list_m'), {'selected_date': '2025-01-06'})
+
+    def _get(self, url, params=None, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, params or {}, **headers)
+
+    def test_unchanged_partial_is_not_modified(self):
+        first = self._get(*self.meals)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(2):  # session + user : the view never runs
+            response = self._get(*self.meals, etag=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_html_without_etag(self):
+        first = self._get(*self.meals)
+        with self.assertNumQueries(2):
+            second = self._get(*self.meals)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_meal_change_re_renders(self):
+        first = self._get(*self.meals)
+        meal = Meal.objects.create(day=self.day, name='Breakfast')
+        self.assertNotEqual(self._get(*self.meals)['ETag'], first['ETag'])
+        before = self._get(*self.meals)
+        MealConsumption.objects.create(meal=meal, food=self.food, amount=1, unit=self.unit)
+        response = self._get(*self.meals, etag=before['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '200 kcal · 1 items')
+
+    def test_today_is_the_users_local_date(self):
+        profile = Profile.objects.get(user=self.user)
+        for name in ('Pacific/Kiritimati', 'Pacific/Pago_Pago'):    # UTC+14 / UTC-11
+            profile.timezone = name
+            profile.save()
+            with self.assertNumQueries(0):
+                self.assertEqual(fragments.local_today(self.user),
+                                 datetime.now(ZoneInfo(name)).date())
+
+    def test_pantry_versions(self):
+        url = reverse('calcounter:list_f', args=['all'])
+        first = self._get(url)
+        PantryItem.objects.create(user=self.user, food=self.food, unit=self.unit, amount=1)
+        second = self._get(url, etag=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        Food.objects.create(name='Catalog oats', calories=380)  # global catalog
+        self.assertEqual(self._get(url, etag=second['ETag']).status_code, 200)
+        other = User.objects.create_user('other', password='testpass')
+        PantryItem.objects.create(user=other, food=self.food, unit=self.unit, amount=1)
+        third = self._get(url)
+        self.assertEqual(self._get(url, etag=third['ETag']).status_code, 304)
+
+    def test_workout_versions(self):
+        url = reverse('workouts:workouts')
+        first = self._get(url)
+        wtype = WorkoutType.objects.filter(user=self.user).first()
+        workout = Workout.objects.create(day=self.day, workout_type=wtype)
+        second = self._get(url, etag=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        movement = Movement.objects.create(user=self.user, name='Row', bodypart='LT', category='B')
+        lift = Lift.objects.create(workout=workout, movement=movement)
+        third = self._get(url)
+        Set.objects.create(lift=lift, reps=5, weight=135)
+        self.assertEqual(self._get(url, etag=third['ETag']).status_code, 200)
+
+    def test_profile_change_re_renders(self):
+        first = self._get(*self.meals)
+        profile = Profile.objects.get(user=self.user)
+        profile.age = 40
+        profile.save()
+        self.assertEqual(self._get(*self.meals, etag=first['ETag']).status_code, 200)
+
+
+# ==============================================================================
+# Recompute batches — dirty keys flushed once per batch / state-changing request
+# ==============================================================================
+
+class RecomputeBatchTest(TestCase):
+    """Signal receivers mark keys dirty; a batch flushes each key once."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('gwen', password='testpass')
+        self.day = Day.objects.create(user=self.user, date=date(2025, 3, 5))
+        self.meal = Meal.objects.create(day=self.day, name="Lunch")
+        self.rice = Food.objects.create(name="Rice", calories=130, protein=3)
+        self.grams = FoodUnit.objects.create(food=self.rice, name="grams", gram_weight=1.0)
+        self.movement = Movement.objects.create(user=self.user, name='Bench', bodypart='CH',
+                                                secondary_bodypart='TI', category='B')
+
+    def _eat(self, n):
+        for _ in range(n):
+            MealConsumption.objects.create(meal=self.meal, food=self.rice, amount=100, unit=self.grams)
+
+    def test_meal_items_apply_one_delta_per_day(self):
+        self._eat(1)   # totals row exists : later items are deltas
+        with mock.patch.object(DailyNutrientTotals.objects, 'apply_delta',
+                               wraps=DailyNutrientTotals.objects.apply_delta) as apply_delta:
+            with self.captureOnCommitCallbacks(execute=True):
+                with recompute.batch():
+                    self._eat(8)
+                self.assertEqual(apply_delta.call_count, 0)     # flushed on commit
+        self.assertEqual(apply_delta.call_count, 1)
+        self.assertAlmostEqual(DailyNutrientTotals.objects.get(day=self.day).calories, 9 * 130)
+        self.assertEqual(Day.objects.get(pk=self.day.pk).calories_consumed, 9 * 130)
+
+    def test_lone_saves_flush_at_once(self):
+        with mock.patch.object(DailyNutrientTotals.objects, 'apply_delta',
+                               wraps=DailyNutrientTotals.objects.apply_delta) as apply_delta:
+            self._eat(3)
+        self.assertEqual(apply_delta.call_count, 3)
+        self.assertAlmostEqual(DailyNutrientTotals.objects.get(day=self.day).calories, 3 * 130)
+
+    def test_sets_refresh_each_lift_and_week_once(self):
+        workout = Workout.objects.create(day=self.day)
+        lift = Lift.objects.create(workout=workout, movement=self.movement)
+        with mock.patch.object(Lift.objects, 'refresh_summary',
+                               wraps=Lift.objects.refresh_summary) as refresh, \
+             mock.patch.object(WeeklyVolume.objects, 'apply_delta',
+                               wraps=WeeklyVolume.objects.apply_delta) as apply_delta:
+            with self.captureOnCommitCallbacks(execute=True), recompute.batch():
+                for n in range(5):
+                    Set.objects.create(lift=lift, order=n, reps=5, weight=100 + n)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(apply_delta.call_count, 1)
+        volume = dict(WeeklyVolume.objects.filter(user=self.user, start_date=week_start(self.day.date))
+                      .values_list('muscle_group', 'set_count'))
+        self.assertEqual(volume, {'CH': 5, 'TI': 5})
+        lift.refresh_from_db()
+        self.assertEqual(lift.volume, sum(5 * (100 + n) for n in range(5)))
+        self.assertEqual(MovementStats.objects.get(movement=self.movement).last_lift_id, lift.pk)
+
+    def test_workout_flags_day_without_saving_it(self):
+        with mock.patch.object(Day, 'save') as save:
+            workout = Workout.objects.create(day=self.day)
+            self.assertTrue(Day.objects.get(pk=self.day.pk).did_workout)
+            workout.delete()
+        save.assert_not_called()
+        self.assertFalse(Day.objects.get(pk=self.day.pk).did_workout)
+
+    def test_nested_batches_flush_at_the_outermost(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with recompute.batch():
+                with recompute.batch():
+                    self._eat(2)
+                self.assertEqual(callbacks, [])
+        self.assertEqual(len(callbacks), 1)
+        self.assertAlmostEqual(DailyNutrientTotals.objects.get(day=self.day).calories, 2 * 130)
+
+    def test_failed_transaction_rolls_back_without_flushing(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                with recompute.batch():
+                    self._eat(2)
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertFalse(MealConsumption.objects.exists())
+        self.assertFalse(DailyNutrientTotals.objects.filter(day=self.day).exists())
+
+    def test_post_requests_run_in_a_batch(self):
+        self._eat(1)
+        self.client.login(username='gwen', password='testpass')
+        data = {
+            'name': 'Dinner', 'selected_date': '2025-03-05',
+            'items-TOTAL_FORMS': 3, 'items-INITIAL_FORMS': 0,
+        }
+        for i in range(3):
+            data.update({f'items-{i}-food': self.rice.pk, f'items-{i}-amount': 50,
+                         f'items-{i}-unit': self.grams.pk})
+        with mock.patch.object(DailyNutrientTotals.objects, 'apply_delta',
+                               wraps=DailyNutrientTotals.objects.apply_delta) as apply_delta:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('calcounter:add'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(apply_delta.call_count, 1)
+        self.assertEqual(Day.objects.get(pk=self.day.pk).calories_consumed, 130 + 3 * 65)
+
+
+# ==============================================================================
+# Query budgets — per-view query counts and N+1 fingerprints
+# ==============================================================================
+
+class QueryBudgetTest(TestCase):
+    """QueryBudgetMiddleware counts queries per view and enforces @query_budget."""
+
+    def setUp(self):
+        reset_query_reports()
+        self.user = User.objects.create_user('counter', password='testpass')
+        self.client.login(username='counter', password='testpass')
+        self.day, _ = Day.objects.get_or_create(user=self.user, date=date(2025, 1, 6))
+
+    def _run(self, budget, queries):
+        @query_budget(budget)
+        def view(request):
+            for i in range(queries):
+                User.objects.filter(pk=i).exists()
+            return HttpResponse('ok')
+
+        return QueryBudgetMiddleware(view)(RequestFactory().get('/'))
+
+    def test_fingerprint_collapses_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'a''b' AND x IN (%s, %s, %s)"),
+            fingerprint("SELECT *  FROM t WHERE id = 7 AND name = 'c' AND x IN (%s, %s)"),
+        )
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_over_budget_raises_in_strict_mode(self):
+        self.assertEqual(self._run(budget=3, queries=3).status_code, 200)
+        with self.assertRaises(QueryBudgetExceeded):
+            self._run(budget=3, queries=4)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_budget_holds_when_called_from_another_view(self):
+        @query_budget(2)
+        def helper(request):
+            for i in range(3):
+                User.objects.filter(pk=i).exists()
+            return HttpResponse('ok')
+
+        def post_view(request):     # no budget of its own, renders the helper directly
+            return helper(request)
+
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'ran 3 queries (budget 2)'):
+            QueryBudgetMiddleware(post_view)(RequestFactory().post('/'))
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_over_budget_logs_and_reports_repeats(self):
+        with self.assertLogs('selfstats.queries', level='WARNING') as logs:
+            self._run(budget=3, queries=4)
+        self.assertTrue(any('budget 3' in line for line in logs.output))
+        self.assertFalse(any('same query' in line for line in logs.output))    # not DEBUG
+        report = query_reports()[UNRESOLVED]
+        self.assertEqual(report['max_queries'], 4)
+        self.assertEqual(list(report['repeated'].values()), [4])
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_unresolved_paths_share_one_report(self):
+        with self.assertLogs('selfstats.queries', level='WARNING') as logs:
+            for path in ('/wp-login.php', '/.env', '/nope/'):
+                self.client.get(path)
+            self._run(budget=10, queries=4)
+        self.assertTrue(any('same query 4 times' in line for line in logs.output))
+        self.assertEqual([name for name in query_reports() if name.startswith('/')], [])
+        self.assertEqual(query_reports()[UNRESOLVED]['requests'], 4)
+
+    def _log_data(self, n):
+        movement = Movement.objects.create(user=self.user, name=f'Press {n}', bodypart='CH', category='B')
+        wtype = WorkoutType.objects.filter(user=self.user).first()
+        for i in range(n):
+            food = Food.objects.create(name=f'Food {n}-{i}', calories=100, protein=10)
+            unit = FoodUnit.objects.create(food=food, name='serving', gram_weight=100)
+            meal = Meal.objects.create(day=self.day, name=f'Meal {i}')
+            MealConsumption.objects.create(meal=meal, food=food, amount=1, unit=unit)
+            PantryItem.objects.create(user=self.user, food=food, unit=unit)
+            workout = Workout.objects.create(day=self.day, workout_type=wtype)
+            lift = Lift.objects.create(workout=workout, movement=movement)
+            Set.objects.create(lift=lift, reps=5, weight=100)
+
+    def test_views_stay_within_budget_as_data_grows(self):
+        views = [
+            ('calcounter:list_m', '/food/list/meal/', {'selected_date': '2025-01-06'}),
+            ('workouts:weekly_sets', '/workouts/weekly/set/', {'selected_date': '2025-01-06'}),
+            ('workouts:workouts', '/workouts/workouts/', {}),
+            ('calcounter:list_f', reverse('calcounter:list_f', args=['all']), {}),
+            ('workouts:movements', reverse('workouts:movements'), {}),
+            ('graphs:bw-summary', reverse('graphs:bw-summary'), {}),
+            ('graphs:dashboard-analytics', reverse('graphs:dashboard-analytics'), {}),
+        ]
+        counts = {}
+        for n in (1, 8):
+            self._log_data(n)
+            reset_query_reports()
+            for name, url, params in views:
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+            counts[n] = {name: query_reports()[name]['max_queries'] for name, _, _ in views}
+        self.assertEqual(counts[1], counts[8])  # no per-row queries
+
+
+# ==============================================================================
+# Benchmarks — synthetic heavy user and the bench_views command
+# ==============================================================================
+
+class BenchViewsTest(TestCase):
+    """make_heavy_user() builds consistent history; bench_views reports and compares runs."""
+
+    def test_heavy_user_derived_tables_match_signals(self):
+        user = make_heavy_user('heavy', days=21, pantry_size=20, end=date(2025, 3, 2))
+        self.assertEqual(user.days.count(), 21)
+        day = user.days.get(date=date(2025, 3, 1))
+        stored = DailyNutrientTotals.objects.get(day=day)
+        rebuilt = DailyNutrientTotals.objects.rebuild(day.id)
+        self.assertAlmostEqual(stored.calories, rebuilt.calories, places=3)
+        self.assertEqual(day.calories_consumed, round(rebuilt.calories))
+        sets = Set.objects.filter(lift__workout__day__user=user).count()
+        self.assertEqual(
+            WeeklyVolume.objects.filter(user=user).aggregate(n=Sum('set_count'))['n'], sets)
+        self.assertEqual(sets, Workout.objects.filter(day__user=user).count() * 25)
+
+    def test_bench_views_writes_and_compares_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'bench.json'
+            call_command('bench_views', days=14, repeat=1, only=['graphs:', 'core:day'],
+                         output=str(output), stdout=StringIO())
+            report = json.loads(output.read_text())
+            self.assertIn('graphs:dashboard-analytics', report['results'])
+            result = report['results']['core:day']
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertNotIn('workouts:workouts', report['results'])
+
+            call_command('bench_views', days=14, repeat=1, only=['workouts:d', 'calcounter:clear'],
+                         output=str(output), stdout=StringIO())
+            report = json.loads(output.read_text())
+            self.assertEqual(report['results'], {})
+            self.assertEqual(report['skipped']['workouts:del_type'], 'mutates data')
+            self.assertIn('calcounter:clear', report['skipped'])
+
+            out = StringIO()
+            call_command('bench_views', days=14, repeat=1, only=['core:day'],
+                         compare=str(output), stdout=out)
+            self.assertIn('vs ', out.getvalue())
+        self.assertFalse(User.objects.filter(username='bench-heavy-user').exists())
@@ -0,0 +1,246 @@
+'''
+ In-process prefix index for typeahead : answers "every word is a prefix of a
+ word in the name" queries from memory, no DB round-trip per keystroke.
+
+ PrefixIndex   : immutable, built from (entry, name) pairs
+     entries are ranked once at build time by (name length, name) and stored
+     in that order, so a doc number *is* its rank. Word -> docs postings are a
+     CSR layout (sorted vocabulary + one int32 array), so a prefix is two
+     bisects and a contiguous slice; a second CSR over each name's first word
+     gives the "name starts with the first query word" tier. substring=True
+     adds, last, names containing the query anywhere (an icontains scan).
+
+ LazyIndex     : per-process holder that builds a PrefixIndex on first use.
+     update() / remove() apply one saved or deleted entry to this process at
+     once (an overlay merged into the results) and move the shared version in
+     the Django cache; other workers, and this one after `ttl` seconds (writes
+     that skip signals), rebuild in a background thread and keep serving the
+     index they have until it is ready. invalidate() drops this process's copy
+     for bulk writes.
+'''
+import heapq
+import re
+import time
+import threading
+import unicodedata
+from bisect import bisect_left
+from itertools import islice
+from operator import attrgetter
+
+import numpy as np
+from django.core.cache import cache
+from django.db import connections
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_MAX_CHAR = '\U0010ffff'
+
+
+def tokenize(text):
+    ''' lowercase, accent-stripped words (matches the FTS unicode61 tokenizer) '''
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return TOKEN_RE.findall(text.lower())
+
+
+def _rank(name):
+    return len(name), name.lower()
+
+
+def _csr(pairs):
+    ''' [(word, doc)] -> (sorted vocabulary, offsets, docs sorted per word) '''
+    pairs.sort()
+    vocab, offsets = [], []
+    for i, (word, _) in enumerate(pairs):
+        if not vocab or vocab[-1] != word:
+            vocab.append(word)
+            offsets.append(i)
+    offsets.append(len(pairs))
+    docs = np.fromiter((doc for _, doc in pairs), dtype=np.int32, count=len(pairs))
+    return vocab, np.array(offsets, dtype=np.int64), docs
+
+
+class PrefixIndex:
+    def __init__(self, rows):
+        rows = sorted(((entry, name or '') for entry, name in rows), key=lambda row: _rank(row[1]))
+        self.entries = [entry for entry, _ in rows]
+        self.names = [name for _, name in rows]
+        self._folded = None
+        words, firsts = [], []
+        for doc, name in enumerate(self.names):
+            tokens = tokenize(name)
+            words.extend((token, doc) for token in set(tokens))
+            if tokens:
+                firsts.append((tokens[0], doc))
+        self.words = _csr(words)
+        self.firsts = _csr(firsts)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _docs(self, csr, prefix):
+        ''' sorted unique doc numbers having a word that starts with `prefix` '''
+        vocab, offsets, docs = csr
+        lo = bisect_left(vocab, prefix)
+        hi = bisect_left(vocab, prefix + _MAX_CHAR, lo)
+        hits = docs[offsets[lo]:offsets[hi]]
+        if hi - lo <= 1:
+            return hits  # one word : already sorted and unique
+        if len(hits) * 16 < len(self.entries):
+            return np.unique(hits)
+        mask = np.zeros(len(self.entries), dtype=bool)
+        mask[hits] = True
+        return np.flatnonzero(mask)
+
+    def _prefix_docs(self, words):
+        matches = None
+        for word in sorted(set(words), key=len, reverse=True):  # longest = rarest first
+            docs = self._docs(self.words, word)
+            matches = docs if matches is None else np.intersect1d(matches, docs, assume_unique=True)
+            if not len(matches):
+                break
+        return matches
+
+    def _substring_docs(self, words, exclude):
+        if self._folded is None:
+            self._folded = [' '.join(tokenize(name)) for name in self.names]
+        needle = ' '.join(words)
+        skip = set(exclude.tolist())
+        return [doc for doc, folded in enumerate(self._folded) if needle in folded and doc not in skip]
+
+    def matches(self, query, keep=None, substring=False):
+        '''
+        (tier, entry, name) of every match, in rank order, lazily
+        tier 0 : the name starts with the first query word, 1 : other prefix
+        matches, 2 : (substring=True) the name only contains the query
+        '''
+        words = tokenize(query)
+        if not words or not self.entries:
+            return
+        matches = self._prefix_docs(words)
+        lead = np.intersect1d(matches, self._docs(self.firsts, words[0]), assume_unique=True)
+        tiers = [lead, np.setdiff1d(matches, lead, assume_unique=True)]
+        if substring:
+            tiers.append(self._substring_docs(words, matches))
+        for tier, docs in enumerate(tiers):
+            for doc in list(docs):
+                entry = self.entries[doc]
+                if keep is None or keep(entry):
+                    yield tier, entry, self.names[doc]
+
+    def search(self, query, limit=20, keep=None, substring=False):
+        '''
+        ranked entries matching every word of `query` as a prefix
+        keep : optional callable(entry) -> bool applied in rank order
+        '''
+        found = self.matches(query, keep, substring)
+        return [entry for _, entry, _ in islice(found, limit or None)]
+
+
+def _in_background(fn):
+    def run():
+        try:
+            fn()
+        finally:
+            connections.close_all()     # the thread's own DB connection
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _merge_key(match):
+    tier, _, name = match
+    return (tier, *_rank(name))
+
+
+class LazyIndex:
+    def __init__(self, name, loader, ttl=60 * 60, key=attrgetter('id')):
+        self.name = name
+        self.loader = loader  # () -> iterable of (entry, name)
+        self.ttl = ttl
+        self.key = key        # entry -> the id update() / remove() refer to
+        self._index = None
+        self._built_at = 0.0
+        self._version = None
+        self._overlay = {}    # key -> (seq, entry, name), entry None once removed
+        self._seq = 0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    @property
+    def version_key(self):
+        return f'typeahead:{self.name}:version'
+
+    def _shared_version(self):
+        return cache.get_or_set(self.version_key, 1, None)
+
+    def _build(self, version):
+        seq = self._seq
+        index = PrefixIndex(self.loader())
+        with self._lock:
+            self._index, self._version, self._built_at = index, version, time.monotonic()
+            # changes made while loading may be missing from it : keep those
+            self._overlay = {k: change for k, change in self._overlay.items() if change[0] > seq}
+
+    def _rebuild_in_background(self, version):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def rebuild():
+            try:
+                self._build(version)
+            finally:
+                self._rebuilding = False
+
+        _in_background(rebuild)
+
+    def get(self):
+        version = self._shared_version()
+        if self._index is None:
+            with self._lock:
+                build = self._index is None
+            if build:
+                self._build(version)    # first use : nothing to serve meanwhile
+        elif version != self._version or time.monotonic() - self._built_at > self.ttl:
+            self._rebuild_in_background(version)
+        return self._index
+
+    def _bump(self):
+        try:
+            return cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, None)
+            return None
+
+    def invalidate(self):
+        ''' drop this process's copy and tell other workers (shared cache) '''
+        self._index = None
+        self._bump()
+
+    def _change(self, key, entry, name):
+        with self._lock:
+            self._seq += 1
+            self._overlay[key] = (self._seq, entry, name or '')
+        version = self._bump()
+        if version is not None and self._version is not None and version == self._version + 1:
+            self._version = version     # only our own change : the overlay has it
+
+    def update(self, entry, name):
+        ''' insert or replace one entry : here at once, other workers rebuild '''
+        self._change(self.key(entry), entry, name)
+
+    def remove(self, key):
+        self._change(key, None, None)
+
+    def search(self, query, limit=20, keep=None, substring=False):
+        index = self.get()
+        overlay = dict(self._overlay)
+        if not overlay:
+            return index.search(query, limit=limit, keep=keep, substring=substring)
+        changed = lambda entry: self.key(entry) in overlay
+        live = PrefixIndex((entry, name) for _, entry, name in overlay.values() if entry is not None)
+        found = heapq.merge(
+            index.matches(query, lambda e: not changed(e) and (keep is None or keep(e)), substring),
+            live.matches(query, keep, substring),
+            key=_merge_key,
+        )
+        return [entry for _, entry, _ in islice(found, limit or None)]
@@ -1,16 +1,85 @@
-from datetime import datetime
+from collections.abc import Mapping
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
+
+from django.utils.dateparse import parse_date
+
 from core.models import Day
+from core import goals
+from graphs import timeseries
+
+
+def _as_date(value):
+    return parse_date(value) if isinstance(value, str) else value
+
+
+class DayRange(Mapping):
+    '''
+        A user's Day rows for start..end (inclusive), keyed by date.
+        Existing rows come from one query; with create=True the missing dates
+        are inserted with one bulk_create, goals precomputed by core.goals.
+        DayRange.of_dates() covers only the dates given (an import's scattered
+        dates), not every day between them.
+
+            days = DayRange(request.user, monday, sunday)
+            days[date(2025, 1, 6)].calories_consumed
+    '''
+
+    def __init__(self, user, start, end=None, create=True, dates=None):
+        self.user = user
+        self.start = _as_date(start)
+        self.end = _as_date(end) if end is not None else self.start
+        self._dates = dates
+        days = Day.objects.filter(user=user)
+        days = (days.filter(date__in=dates) if dates is not None
+                else days.filter(date__range=(self.start, self.end)))
+        self._days = {day.date: day for day in days}
+        if create:
+            self._create_missing()
+
+    @classmethod
+    def of_dates(cls, user, dates, create=True):
+        dates = sorted({_as_date(d) for d in dates})
+        return cls(user, dates[0], dates[-1], create=create, dates=dates)
+
+    @property
+    def dates(self):
+        if self._dates is not None:
+            return self._dates
+        return [self.start + timedelta(days=i) for i in range((self.end - self.start).days + 1)]
+
+    def _create_missing(self):
+        missing = [d for d in self.dates if d not in self._days]
+        if not missing:
+            return
+        resolved = goals.goals_for_dates(self.user.id, missing)
+        # bulk_create skips the Day signals : goals are set here, graphs invalidated below
+        Day.objects.bulk_create([
+            Day(user=self.user, date=d, calorie_goal=resolved[d][0], protein_goal=resolved[d][1])
+            for d in missing
+        ], ignore_conflicts=True)
+        # re-read : ignore_conflicts gives no pks, and a concurrent request may have won
+        self._days.update(
+            (day.date, day) for day in Day.objects.filter(user=self.user, date__in=missing)
+        )
+        timeseries.invalidate(self.user.id)
+
+    def __getitem__(self, day):
+        return self._days[_as_date(day)]
+
+    def __iter__(self):
+        return iter(sorted(self._days))
+
+    def __len__(self):
+        return len(self._days)
 
 
 def get_or_create_today(user):
     """Returns today's Day object for the given user, creating it if needed."""
     tz = ZoneInfo(user.profile.timezone)
     local_today = datetime.now(tz).date()
-    day, _ = Day.objects.get_or_create(user=user, date=local_today)
-    return day
+    return get_or_create_day(user, local_today)
 
 
 def get_or_create_day(user, selected_date):
-    day, _ = Day.objects.get_or_create(user=user, date=selected_date)
-    return day
+    return DayRange(user, selected_date)[selected_date]
@@ -1,4 +1,4 @@
-from datetime import date, timedelta
+from datetime import date
 from random import randint
 from django.shortcuts import render, redirect, HttpResponse, get_object_or_404
 from django.contrib.auth.decorators import login_required
@@ -14,6 +14,7 @@ from workouts.forms import WTypeForm
 from workouts.models import WorkoutType
 from .utils import get_or_create_day, get_or_create_today
 from .forms import ProfileForm
+from . import streaks
 from calcounter.models import Food
 from workouts.models import Workout
 
@@ -235,22 +236,8 @@ def signup_view(request):
 
 @login_required
 def get_current_streak(request):
-    today = date.today()
-    streak = 0
-    curr = today
-    while request.user.days.filter(date=curr).exists():
-        # check to see if the day has no data
-        day = request.user.days.filter(
-            date=curr,
-            bodyweight__isnull=True,
-            water_consumed=0,
-            sleep=0,
-            calories_consumed=0,
-        ).first()
-        if day is not None:
-            break
-        streak += 1
-        curr -= timedelta(days=1)
+    # kept up to date by core.streaks as days are logged
+    streak = streaks.current(request.user, date.today())
     return render(request, "core/streak_highlight.html", {"streak": streak})
 
 
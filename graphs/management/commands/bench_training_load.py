@@ -0,0 +1,62 @@
+"""
+Django management command to time graphs.training_load.summary() on
+synthetic workout columns of growing length (no database), to check that
+the cost stays linear in the days spanned:
+
+    python manage.py bench_training_load
+    python manage.py bench_training_load --years 1 5 10 20 --fail-nonlinear
+
+Each size reports the median of --repeat runs and the time per day; the run
+fails (with --fail-nonlinear) when the largest size costs more than
+--tolerance times the smallest one per day.
+"""
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from graphs import training_load
+
+
+def workout_columns(days, workouts_per_week=4, types=3, seed=0):
+    ''' (dates, volume, workout_type_id) like timeseries.UserSeries.workouts '''
+    rng = np.random.default_rng(seed)
+    offsets = np.flatnonzero(rng.random(days) < workouts_per_week / 7)
+    dates = np.datetime64('2015-01-01', 'D') + offsets
+    volume = rng.uniform(2000, 25000, len(offsets)).round()
+    return dates, volume, rng.integers(0, types, len(offsets))
+
+
+class Command(BaseCommand):
+    help = 'Time graphs.training_load over 1..10 years of synthetic workouts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, nargs='+', default=[1, 2, 5, 10])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--types', type=int, default=3, help='workout types')
+        parser.add_argument('--tolerance', type=float, default=3.0,
+                            help='largest / smallest time per day that still counts as linear')
+        parser.add_argument('--fail-nonlinear', action='store_true')
+
+    def handle(self, *args, **options):
+        per_day = {}
+        for years in sorted(options['years']):
+            days = years * 365
+            columns = workout_columns(days, types=options['types'])
+            training_load.summary(*columns)  # warm up
+            times = []
+            for _ in range(options['repeat']):
+                t0 = time.perf_counter()
+                training_load.summary(*columns)
+                times.append((time.perf_counter() - t0) * 1000)
+            ms = statistics.median(times)
+            per_day[years] = ms / days
+            self.stdout.write(f'{years:>3} years {days:>6} days {len(columns[1]):>6} workouts '
+                              f'{ms:>8.2f} ms {per_day[years] * 1000:>7.2f} us/day')
+
+        smallest, largest = per_day[min(per_day)], per_day[max(per_day)]
+        ratio = largest / smallest if smallest else 1.0
+        self.stdout.write(f'time per day, {max(per_day)} vs {min(per_day)} years: x{ratio:.2f}')
+        if ratio > options['tolerance'] and options['fail_nonlinear']:
+            raise CommandError(f'training_load grows faster than linear (x{ratio:.2f} per day)')
@@ -0,0 +1,165 @@
+'''
+ Vectorized dashboard statistics over timeseries columns (pure numpy).
+
+ dates are datetime64[D] arrays in ascending order, values are float arrays
+ with NaN for missing. Weeks follow pandas' resample("W"): Monday..Sunday,
+ and every week between the first and last date exists (empty weeks count).
+'''
+import numpy as np
+
+from core import streaks
+from . import training_load
+
+_EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday (Monday = 0)
+
+
+# --- helpers ---
+
+def _days(dates):
+    return np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def week_index(dates):
+    ''' Monday-based week number of each date, relative to the first week '''
+    weeks = (_days(dates) + _EPOCH_WEEKDAY) // 7
+    return weeks - weeks[0] if len(weeks) else weeks
+
+
+def _weekly(dates, values, how):
+    ''' resample("W") -> per-week 'mean' (NaN if empty), 'sum' or 'size' '''
+    weeks = week_index(dates)
+    n_weeks = int(weeks[-1]) + 1 if len(weeks) else 0
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    size = np.bincount(weeks, minlength=n_weeks)
+    if how == 'size':
+        return size.astype(float)
+    total = np.bincount(weeks[valid], weights=values[valid], minlength=n_weeks)
+    if how == 'sum':
+        return total
+    count = np.bincount(weeks[valid], minlength=n_weeks)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _nanmean(values):
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    return float(values.mean()) if len(values) else float('nan')
+
+
+def _nanstd(values):
+    ''' sample standard deviation (ddof=1) ignoring NaN, like pandas .std() '''
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    return float(values.std(ddof=1)) if len(values) > 1 else float('nan')
+
+
+def rolling_mean(values, window=7):
+    ''' rolling(window, min_periods=1).mean() over rows, NaN skipped '''
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - window, 0)
+    n = counts[end] - counts[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, (sums[end] - sums[start]) / n, np.nan)
+
+
+def runs(presence):
+    ''' (current, longest) run of True values ending at / anywhere in `presence` '''
+    presence = np.asarray(presence, dtype=bool)
+    _, lengths = streaks.runs(np.flatnonzero(presence))
+    if not len(lengths):
+        return 0, 0
+    current = int(lengths[-1]) if presence[-1] else 0
+    return current, int(lengths.max())
+
+
+def _round(value, digits=2):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+# --- summaries ---
+
+def macro_grams(calories, protein):
+    ''' vectorized Day.macro_breakdown -> (carbs, protein, fat) rounded grams '''
+    calories = np.asarray(calories, dtype=float)
+    protein = np.asarray(protein, dtype=float)
+    protein_cals = protein * 4
+    fat_cals = (calories - protein_cals) * 0.3  # assume 30% from fat
+    carb_cals = calories - (protein_cals + fat_cals)
+    return (np.round(carb_cals / 4).astype(int),
+            np.round(protein).astype(int),
+            np.round(fat_cals / 9).astype(int))
+
+
+def bodyweight_stats(dates, bodyweight):
+    ''' stats under the bodyweight graph (bw-summary.html) '''
+    bodyweight = np.asarray(bodyweight, dtype=float)
+    if not len(bodyweight):
+        return {}
+    days = _days(dates)
+    last = days[-1]
+    this_week = last - (last + _EPOCH_WEEKDAY) % 7  # Monday of the latest week
+    if not np.isnan(bodyweight[0]) and not np.isnan(bodyweight).all():
+        total_change = bodyweight[0] - bodyweight[-1]
+    else:
+        total_change = 0
+    return {
+        "avg_weight": _nanmean(bodyweight),
+        "7d_avg": _nanmean(bodyweight[days <= this_week]),
+        "stddev": _nanstd(np.diff(bodyweight)),
+        "total_change": float(total_change),
+        "pm_per_week": _nanmean(np.diff(_weekly(dates, bodyweight, 'mean'))),
+    }
+
+
+def nutrition_stats(dates, calories, calorie_goal, protein, water, carbs, fat):
+    ''' averages over days with food logged (nutrition-summary.html) '''
+    calories = np.asarray(calories, dtype=float)
+    logged = calories != 0
+    if not logged.any():
+        return {}
+    dates = np.asarray(dates)[logged]
+    cals = calories[logged]
+    pro = np.asarray(protein, dtype=float)[logged]
+    return {
+        "mean_c": float(cals.mean()),
+        "mean_p": float(pro.mean()),
+        "mean_carb": float(np.asarray(carbs, dtype=float)[logged].mean()),
+        "mean_f": float(np.asarray(fat, dtype=float)[logged].mean()),
+        "mean_water": float(np.asarray(water, dtype=float)[logged].mean()),
+        "7d_avg_c": _nanmean(_weekly(dates, cals, 'mean')),
+        "7d_avg_p": _nanmean(_weekly(dates, pro, 'mean')),
+        "stddev_c": float(np.asarray(calorie_goal, dtype=float)[logged].mean() - cals.mean()),
+    }
+
+
+def bw_cal_rows(dates, bodyweight, calories):
+    ''' rows for the bodyweight (line + MA7) / calories (bar) graph '''
+    bodyweight = np.asarray(bodyweight, dtype=float)
+    ma7 = rolling_mean(bodyweight)
+    stamps = np.datetime_as_string(np.asarray(dates, dtype='datetime64[s]'))
+    none = lambda v: None if np.isnan(v) else v
+    return [
+        {"day": d, "bodyweight": none(bw), "ma7": none(ma), "calories": c}
+        for d, bw, ma, c in zip(stamps.tolist(), bodyweight.tolist(),
+                                ma7.tolist(), np.asarray(calories).tolist())
+    ]
+
+
+def summarize(series):
+    ''' every dashboard statistic from one UserSeries in one pass '''
+    days, workouts = series.days, series.workouts
+    carbs, _, fat = macro_grams(days['calories'], days['protein'])
+    return {
+        "series": bw_cal_rows(days['date'], days['bodyweight'], days['calories']),
+        "bodyweight": bodyweight_stats(days['date'], days['bodyweight']),
+        "nutrition": nutrition_stats(days['date'], days['calories'], days['calorie_goal'],
+                                     days['protein'], days['water'], carbs, fat),
+        "volume": training_load.summary(workouts['date'], workouts['volume'],
+                                        workouts['workout_type_id']),
+    }
@@ -1,3 +1,301 @@
 from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from core.models import Day
+from calcounter.models import Meal, MealConsumption
+from workouts.models import WorkoutType, Workout, Movement, Lift, Set
+from graphs import timeseries, stats, training_load
+from datetime import date, timedelta
+import base64
+from io import StringIO
+from django.core.management import call_command
+import json
+import numpy as np
+import pandas as pd
 
-# Create your tests here.
+
+# ==============================================================================
+# Time series store — typed columns, cached per user, invalidated by signals
+# ==============================================================================
+
+class UserSeriesTest(TestCase):
+    """timeseries.load() returns numpy columns and is invalidated by data changes."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('grapher', password='testpass')
+        self.d1 = Day.objects.create(user=self.user, date=date(2025, 3, 1), bodyweight=180.0, water_consumed=40)
+        self.d2 = Day.objects.create(user=self.user, date=date(2025, 3, 3))
+        Day.objects.create(user=self.user, date=date(1, 1, 1))  # placeholder day
+        push = WorkoutType.objects.get(user=self.user, name='Push')
+        workout = Workout.objects.create(day=self.d2, workout_type=push)
+        bench = Movement.objects.create(user=self.user, name='Bench', bodypart='CH', category='B')
+        self.lift = Lift.objects.create(movement=bench, workout=workout)
+        self.set = Set.objects.create(lift=self.lift, reps=10, weight=100)
+
+    def test_columns_are_typed_and_ordered(self):
+        series = timeseries.load(self.user.id)
+        self.assertEqual(len(series), 2)
+        self.assertEqual(series.days['date'].dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(series.days['date'][0], np.datetime64('2025-03-01'))
+        self.assertEqual(series.days['bodyweight'][0], 180.0)
+        self.assertTrue(np.isnan(series.days['bodyweight'][1]))
+        self.assertEqual(series.days['volume'].tolist(), [0.0, 1000.0])
+        self.assertEqual(series.workouts['volume'].tolist(), [1000.0])
+
+    def test_second_load_is_cached(self):
+        timeseries.load(self.user.id)
+        with self.assertNumQueries(0):
+            timeseries.load(self.user.id)
+
+    def test_day_save_invalidates(self):
+        timeseries.load(self.user.id)
+        self.d2.bodyweight = 182.5
+        self.d2.save()
+        self.assertEqual(timeseries.load(self.user.id).days['bodyweight'][1], 182.5)
+
+    def test_set_edit_invalidates_volume(self):
+        timeseries.load(self.user.id)
+        self.set.weight = 150
+        self.set.save()
+        self.assertEqual(timeseries.load(self.user.id).days['volume'][1], 1500.0)
+
+    def test_meal_change_invalidates_calories(self):
+        timeseries.load(self.user.id)
+        meal = Meal.objects.create(day=self.d1, name="Lunch")
+        MealConsumption.objects.create(meal=meal, description="Burrito", calories=900, protein=40)
+        self.assertEqual(timeseries.load(self.user.id).days['calories'][0], 900)
+
+    def test_macro_grams_matches_day_property(self):
+        day = Day(calories_consumed=2300, protein_consumed=165)
+        carbs, protein, fat = stats.macro_grams([2300], [165])
+        self.assertEqual((carbs[0], protein[0], fat[0]), day.macro_breakdown)
+
+
+class AnalyticsViewsTest(TestCase):
+    """Dashboard analytics render from the shared series."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('viewer', password='testpass')
+        for i, (bw, cals) in enumerate([(180.0, 2200), (181.0, 2400), (179.5, 2100)]):
+            day = Day.objects.create(user=self.user, date=date(2025, 3, 1 + i), bodyweight=bw)
+            Day.objects.filter(pk=day.pk).update(calories_consumed=cals, protein_consumed=150)
+        self.client.login(username='viewer', password='testpass')
+
+    def test_bw_cal_time(self):
+        response = self.client.get(reverse('graphs:main-graph'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '2025-03-01')
+
+    def test_summaries(self):
+        self.assertEqual(self.client.get(reverse('graphs:bw-summary')).status_code, 200)
+        response = self.client.get(reverse('graphs:nutrition-summary'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats']['mean_c'], 2233.3333333333335)
+
+    def test_breakdowns_read_the_selected_day_only(self):
+        for name in ('graphs:macros', 'graphs:minerals', 'graphs:vitamins', 'graphs:nutrient-overview'):
+            url = reverse(name)
+            self.assertEqual(self.client.get(url, {'selected_date': '2025-03-02'}).status_code, 200)
+            self.assertEqual(self.client.get(url, {'selected_date': '2025-04-01'}).status_code, 404)
+            self.assertEqual(self.client.get(url, {'selected_date': '2025-13-40'}).status_code, 400)
+            self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(Day.objects.filter(user=self.user).count(), 3)
+
+
+# ==============================================================================
+# Vectorized stats — match the pandas computations they replaced
+# ==============================================================================
+
+class VectorizedStatsTest(TestCase):
+    """numpy summaries agree with the original resample/rolling pandas code."""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        start = date(2025, 1, 2)
+        offsets = np.sort(rng.choice(90, size=60, replace=False))
+        self.dates = np.array([start + timedelta(days=int(o)) for o in offsets], dtype='datetime64[D]')
+        self.bw = 180 + rng.normal(0, 1.5, size=60)
+        self.bw[rng.choice(60, size=12, replace=False)] = np.nan
+        self.bw[0] = 181.0
+        self.df = pd.DataFrame({"bodyweight": self.bw}, index=pd.DatetimeIndex(self.dates))
+
+    def test_rolling_mean(self):
+        expected = self.df["bodyweight"].rolling(7, min_periods=1).mean().to_numpy()
+        np.testing.assert_allclose(stats.rolling_mean(self.bw), expected)
+
+    def test_bodyweight_stats(self):
+        df = self.df
+        this_week = df.index.max() - timedelta(days=df.index.max().weekday())
+        result = stats.bodyweight_stats(self.dates, self.bw)
+        self.assertAlmostEqual(result["avg_weight"], df["bodyweight"].mean())
+        self.assertAlmostEqual(result["7d_avg"], df.loc[:this_week].mean()["bodyweight"])
+        self.assertAlmostEqual(result["stddev"], df["bodyweight"].diff().std())
+        self.assertAlmostEqual(result["pm_per_week"], df["bodyweight"].resample("W").mean().diff().mean())
+
+    def test_runs(self):
+        self.assertEqual(stats.runs([True, True, False, True, True, True, False, True]), (1, 3))
+        self.assertEqual(stats.runs([False, False]), (0, 0))
+
+
+# ==============================================================================
+# Training load — streaks, ACWR, monotony/strain and CV per workout type
+# ==============================================================================
+
+class TrainingLoadTest(TestCase):
+    """graphs.training_load matches the pandas definitions for all rows of the grouped pass."""
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        start = date(2025, 1, 2)
+        offsets = np.sort(rng.choice(120, size=70, replace=False))
+        self.dates = np.array([start + timedelta(days=int(o)) for o in offsets], dtype='datetime64[D]')
+        self.volume = rng.uniform(1000, 5000, size=70).round()
+        self.types = rng.integers(0, 3, size=70)
+        self.types[:5] = -1
+
+    def _expected(self, dates, volume):
+        df = pd.DataFrame({"total_volume": volume}, index=pd.DatetimeIndex(dates))
+        last = df.index.max()
+        acute = df.loc[df.index > last - timedelta(days=7), "total_volume"].sum()
+        weekly = df["total_volume"].resample("W").sum()
+        daily = df["total_volume"].resample("D").sum()
+        ewm = lambda span: daily.ewm(span=span, adjust=False).mean().iloc[-1]
+        last7 = daily.iloc[-7:].reindex(pd.date_range(last - timedelta(days=6), last), fill_value=0)
+        return {
+            "acute": round(acute, 2),
+            "chronic": round(df.loc[df.index > last - timedelta(days=28), "total_volume"].mean() * 4, 2),
+            "stddev": round(weekly.std() / weekly.mean(), 2),
+            "workout_4wk": df.loc[df.index >= last - timedelta(weeks=4)].resample("W").size().mean(),
+            "acwr": round(ewm(7) / ewm(28), 2),
+            "monotony": round(last7.mean() / last7.std(), 2),
+            "mean": round(volume.mean(), 2),
+        }
+
+    def _check(self, result, dates, volume):
+        for key, value in self._expected(dates, volume).items():
+            self.assertAlmostEqual(result[key], value, places=2, msg=key)
+
+    def test_all_workouts(self):
+        result = training_load.summary(self.dates, self.volume)
+        self._check(result, self.dates, self.volume)
+        self.assertAlmostEqual(result["strain"], result["acute"] * result["monotony"],
+                               delta=result["acute"] * 0.005)
+        self.assertEqual(set(result["by_type"]), {training_load.NO_TYPE})
+
+    def test_each_type_matches_its_own_summary(self):
+        result = training_load.summary(self.dates, self.volume, self.types)
+        self._check(result, self.dates, self.volume)
+        self.assertEqual(set(result["by_type"]), {-1, 0, 1, 2})
+        for type_id, by_type in result["by_type"].items():
+            mask = self.types == type_id
+            alone = training_load.summary(self.dates[mask], self.volume[mask])
+            del alone["by_type"]
+            self.assertEqual(by_type, alone)
+
+    def test_ewma_matches_pandas_over_long_series(self):
+        load = np.random.default_rng(3).uniform(0, 20000, size=(2, 3650))
+        for span in (7, 28):
+            expected = pd.DataFrame(load.T).ewm(span=span, adjust=False).mean().to_numpy().T
+            np.testing.assert_allclose(training_load.ewma(load, span), expected)
+
+    def test_streaks(self):
+        dates = np.array(['2025-01-01', '2025-01-02', '2025-01-03', '2025-01-05',
+                          '2025-01-06', '2025-01-06'], dtype='datetime64[D]')
+        result = training_load.summary(dates, np.ones(6) * 100, [0, 0, 1, 1, 0, 1])
+        self.assertEqual((result["cur_streak"], result["long_streak"]), (2, 3))
+        self.assertEqual((result["by_type"][0]["cur_streak"], result["by_type"][0]["long_streak"]), (1, 2))
+        self.assertEqual((result["by_type"][1]["cur_streak"], result["by_type"][1]["long_streak"]), (2, 2))
+
+    def test_empty(self):
+        self.assertEqual(training_load.summary([], []), {})
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_training_load', years=[1, 2], repeat=2, stdout=out)
+        self.assertIn('us/day', out.getvalue())
+        self.assertIn('2 vs 1 years', out.getvalue())
+
+
+class CombinedAnalyticsTest(TestCase):
+    """One request returns every dashboard statistic."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('combined', password='testpass')
+        for i in range(10):
+            Day.objects.create(user=self.user, date=date(2025, 3, 1) + timedelta(days=i), bodyweight=180.0 + i)
+        self.client.login(username='combined', password='testpass')
+
+    def test_json_payload(self):
+        data = self.client.get(reverse('graphs:analytics')).json()
+        self.assertEqual(set(data), {"series", "bodyweight", "nutrition", "volume"})
+        self.assertEqual(len(data["series"]), 10)
+        self.assertEqual(data["series"][0]["day"], "2025-03-01T00:00:00")
+        self.assertEqual(data["bodyweight"]["total_change"], -9.0)
+        self.assertEqual(data["nutrition"], {})
+
+    def test_dashboard_fragment_swaps_summaries_out_of_band(self):
+        response = self.client.get(reverse('graphs:dashboard-analytics'))
+        self.assertContains(response, 'id="bw-summary" hx-swap-oob="innerHTML"')
+        self.assertContains(response, 'id="cal-summary" hx-swap-oob="innerHTML"')
+
+    def test_summary_is_cached_until_data_changes(self):
+        self.client.get(reverse('graphs:analytics'))
+        with self.assertNumQueries(2):  # session + user
+            self.client.get(reverse('graphs:analytics'))
+        Day.objects.create(user=self.user, date=date(2025, 3, 20), bodyweight=200.0)
+        data = self.client.get(reverse('graphs:analytics')).json()
+        self.assertEqual(len(data["series"]), 11)
+
+
+# ==============================================================================
+# Calendar heatmap — dense uint8 windows sliced from the cached series
+# ==============================================================================
+
+class CalendarWindowTest(TestCase):
+    """The calendar endpoints send one fixed-size window, whatever the history length."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('calendar', password='testpass')
+        Day.objects.bulk_create([
+            Day(user=self.user, date=date(2024, 1, 1) + timedelta(days=i),
+                calories_consumed=1000, calorie_goal=2000)
+            for i in range(400)
+        ])
+        Day.objects.filter(user=self.user, date=date(2025, 1, 7)).update(
+            calories_consumed=3000, did_workout=True, bodyweight=180)
+        Day.objects.filter(user=self.user, date=date(2025, 1, 8)).delete()
+        self.client.login(username='calendar', password='testpass')
+
+    def _decode(self, payload):
+        ratio = np.frombuffer(base64.b64decode(payload['ratio']), dtype=np.uint8)
+        flags = np.frombuffer(base64.b64decode(payload['flags']), dtype=np.uint8)
+        return ratio, flags
+
+    def test_window_is_dense_and_flagged(self):
+        payload = self.client.get(reverse('graphs:calendar-data'),
+                                  {'start': '2025-01-05', 'days': 14}).json()
+        self.assertEqual((payload['start'], payload['days']), ('2025-01-05', 14))
+        ratio, flags = self._decode(payload)
+        self.assertEqual(len(ratio), 14)
+        self.assertEqual(ratio[0], 50)
+        self.assertEqual((ratio[2], flags[2]), (150, timeseries.CAL_DAY | timeseries.CAL_WORKOUT | timeseries.CAL_BODYWEIGHT))
+        self.assertEqual((ratio[3], flags[3]), (0, 0))              # deleted day
+        self.assertEqual(flags[1], timeseries.CAL_DAY)
+
+    def test_payload_size_does_not_grow_with_history(self):
+        year = self.client.get(reverse('graphs:calendar-data'), {'year': 2024}).json()
+        self.assertEqual(year['days'], 366)
+        self.assertEqual(len(self._decode(year)[0]), 366)
+        window = self.client.get(reverse('graphs:calendar')).context['day_data']
+        self.assertEqual(json.loads(window)['days'], 14)
+        with self.assertNumQueries(3):  # session + user + profile : the series is cached
+            self.client.get(reverse('graphs:calendar'))
+
+    def test_invalid_window_is_rejected(self):
+        response = self.client.get(reverse('graphs:calendar-data'), {'start': 'soon'})
+        self.assertEqual(response.status_code, 400)
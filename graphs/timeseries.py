@@ -0,0 +1,193 @@
+'''
+ Per-user columnar time series : every graph/summary reads the same typed
+ numpy arrays instead of iterating Day model instances.
+
+ days     : one row per Day (ascending date), placeholder 0001-01-01 excluded
+            id, date, bodyweight (NaN if unset), calories, calorie_goal,
+            protein, water, sleep, volume (sum of reps * weight)
+ workouts : one row per Workout (ascending date)
+            id, date, workout_type_id (-1 if unset), volume (sum of Lift.volume)
+ calendar : the days as compact heatmap columns (calendar_window() slices them)
+            offset (days since 1970-01-01, int32), ratio (calories / goal in %,
+            uint8, capped at RATIO_MAX), flags (CAL_* bits, uint8)
+
+ Loaded with three values_list queries, cached per user in the default cache
+ (together with its stats.summarize() result) and invalidated by core.signals
+ whenever a Day / Workout / Set / meal changes.
+'''
+from datetime import date
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.db.models import Sum
+from core.middleware import query_budget
+from . import stats
+
+CACHE_KEY = 'graphs:timeseries:{}'
+SUMMARY_KEY = 'graphs:analytics:{}'
+CACHE_TIMEOUT = 60 * 60 * 24
+PLACEHOLDER_DATE = date(1, 1, 1)
+
+DAY_COLUMNS = (
+    # (array name, Day field, dtype)
+    ('id',           'id',                int),
+    ('date',         'date',              'datetime64[D]'),
+    ('bodyweight',   'bodyweight',        float),
+    ('calories',     'calories_consumed', int),
+    ('calorie_goal', 'calorie_goal',      int),
+    ('protein',      'protein_consumed',  int),
+    ('water',        'water_consumed',    float),
+    ('sleep',        'sleep',             float),
+    ('did_workout',  'did_workout',       bool),
+)
+
+# calendar flag bits
+CAL_DAY = 1             # a Day row exists
+CAL_WORKOUT = 2
+CAL_BODYWEIGHT = 4
+RATIO_MAX = 255         # 255% and above share the top bucket
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+class UserSeries:
+    ''' column arrays for one user; `days` and `workouts` are {name: ndarray} '''
+
+    def __init__(self, days, workouts):
+        self.days = days
+        self.workouts = workouts
+        self.calendar = _calendar(days)
+
+    def __len__(self):
+        return len(self.days['date'])
+
+    def frame(self, *columns):
+        ''' pandas DataFrame of day columns indexed by date '''
+        return pd.DataFrame(
+            {name: self.days[name] for name in columns},
+            index=pd.DatetimeIndex(self.days['date'], name='date'),
+        )
+
+    def workout_frame(self):
+        ''' pandas DataFrame of workouts (workout_type, total_volume) indexed by date '''
+        return pd.DataFrame(
+            {'workout_type': self.workouts['workout_type_id'],
+             'total_volume': self.workouts['volume']},
+            index=pd.DatetimeIndex(self.workouts['date'], name='date'),
+        )
+
+
+def _calendar(days):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = np.where(days['calorie_goal'] > 0, days['calories'] / days['calorie_goal'], 0)
+    flags = (CAL_DAY
+             | np.where(days['did_workout'], CAL_WORKOUT, 0)
+             | np.where(np.isnan(days['bodyweight']), 0, CAL_BODYWEIGHT))
+    return {
+        'offset': (days['date'] - EPOCH).astype(np.int32),
+        'ratio': np.clip(np.rint(ratio * 100), 0, RATIO_MAX).astype(np.uint8),
+        'flags': np.asarray(flags, dtype=np.uint8),
+    }
+
+
+def calendar_window(series, start, length):
+    ''' dense (ratio, flags) uint8 arrays for `length` days from `start` : O(log n + length) '''
+    first = int((np.datetime64(start, 'D') - EPOCH).astype(int))
+    calendar = series.calendar
+    lo, hi = np.searchsorted(calendar['offset'], [first, first + length])
+    index = calendar['offset'][lo:hi] - first
+    ratio = np.zeros(length, dtype=np.uint8)
+    flags = np.zeros(length, dtype=np.uint8)
+    ratio[index] = calendar['ratio'][lo:hi]
+    flags[index] = calendar['flags'][lo:hi]
+    return ratio, flags
+
+
+# --- Loading ---
+
+def _columns(rows, spec):
+    columns = list(zip(*rows)) or [()] * len(spec)
+    out = {}
+    for (name, _, dtype), values in zip(spec, columns):
+        if dtype is float:
+            values = [np.nan if v is None else v for v in values]
+        out[name] = np.array(values, dtype=dtype)
+    return out
+
+
+def build(user_id):
+    ''' query the database for a user's columns (uncached) '''
+    from core.models import Day
+    from workouts.models import Workout, Lift
+
+    day_rows = (Day.objects
+                .filter(user_id=user_id)
+                .exclude(date=PLACEHOLDER_DATE)
+                .order_by('date')
+                .values_list(*(field for _, field, _ in DAY_COLUMNS)))
+    days = _columns(day_rows, DAY_COLUMNS)
+
+    workout_rows = list(Workout.objects
+                        .filter(day__user_id=user_id)
+                        .exclude(day__date=PLACEHOLDER_DATE)
+                        .order_by('day__date', 'id')
+                        .values_list('id', 'day_id', 'day__date', 'workout_type_id'))
+    set_volume = dict(Lift.objects
+                      .filter(workout__day__user_id=user_id)
+                      .values_list('workout_id')
+                      .annotate(total=Sum('volume'))
+                      .order_by())
+
+    workouts = {
+        'id': np.array([w[0] for w in workout_rows], dtype=int),
+        'date': np.array([w[2] for w in workout_rows], dtype='datetime64[D]'),
+        'workout_type_id': np.array(
+            [-1 if w[3] is None else w[3] for w in workout_rows], dtype=int),
+        'volume': np.array(
+            [set_volume.get(w[0]) or 0 for w in workout_rows], dtype=float),
+    }
+
+    # per-day volume : scatter-add each workout's volume onto its day row
+    days['volume'] = np.zeros(len(days['id']))
+    day_index = {day_id: i for i, day_id in enumerate(days['id'].tolist())}
+    rows = [day_index.get(w[1], -1) for w in workout_rows]
+    mask = np.array(rows, dtype=int) >= 0
+    np.add.at(days['volume'], np.array(rows, dtype=int)[mask], workouts['volume'][mask])
+
+    return UserSeries(days, workouts)
+
+
+def load(user_id):
+    ''' cached UserSeries for a user '''
+    key = CACHE_KEY.format(user_id)
+    series = cache.get(key)
+    if series is None:
+        series = build(user_id)
+        cache.set(key, series, CACHE_TIMEOUT)
+    return series
+
+
+def for_request(request):
+    ''' one load per request, shared by every analytics function it calls '''
+    series = getattr(request, '_user_series', None)
+    if series is None:
+        series = request._user_series = load(request.user.id)
+    return series
+
+
+@query_budget(3)
+def summary(request):
+    ''' stats.summarize() of the request user's series, cached alongside it '''
+    result = getattr(request, '_user_summary', None)
+    if result is None:
+        key = SUMMARY_KEY.format(request.user.id)
+        result = cache.get(key)
+        if result is None:
+            result = stats.summarize(for_request(request))
+            cache.set(key, result, CACHE_TIMEOUT)
+        request._user_summary = result
+    return result
+
+
+def invalidate(user_id):
+    if user_id is not None:
+        cache.delete_many([CACHE_KEY.format(user_id), SUMMARY_KEY.format(user_id)])
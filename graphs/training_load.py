@@ -0,0 +1,166 @@
+'''
+ Training load over the workouts columns (pure numpy), for all workouts and
+ every workout type in one grouped pass.
+
+ Workouts are scattered onto a dense daily matrix (row 0 = every workout,
+ row k = workout type k) with one bincount, and each statistic is computed
+ along the day axis for all rows at once, read at each row's latest workout:
+   - streaks     runs of consecutive training days (core.streaks.runs)
+   - acute /     7-day load and 4 x the mean workout of the last 28 days;
+     chronic     acwr is their exponentially weighted version
+                 (EWMA of daily load, 7 / 28 day spans, Williams et al. 2017)
+   - monotony    mean / sd of the last 7 daily loads, strain = 7-day load x
+                 monotony (Foster 1998)
+   - stddev      weekly coefficient of variation (Monday..Sunday totals)
+ Cost is linear in the days spanned : manage.py bench_training_load.
+'''
+import numpy as np
+
+from core import streaks
+
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+RECENT_DAYS = 28        # "last 4 weeks" counts
+NO_TYPE = -1            # workout_type_id of untyped workouts
+
+_EPOCH_WEEKDAY = 3      # 1970-01-01 was a Thursday (Monday = 0)
+_BLOCK = 64             # ewma block : decay ** -_BLOCK stays well inside float range
+
+
+def _round(value, digits=2):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+# --- Daily matrix ---
+
+def ewma(load, span):
+    ''' exponentially weighted mean along the last axis, like pandas .ewm(span, adjust=False) '''
+    load = np.asarray(load, dtype=float)
+    out = np.empty_like(load)
+    if not load.shape[-1]:
+        return out
+    alpha = 2 / (span + 1)
+    decay = 1 - alpha
+    powers = decay ** np.arange(_BLOCK)
+    state = load[..., 0]
+    # y[t] = decay ** t * (decay * state + alpha * sum(x[i] / decay ** i for i <= t)), per block
+    for lo in range(0, load.shape[-1], _BLOCK):
+        block = load[..., lo:lo + _BLOCK]
+        p = powers[:block.shape[-1]]
+        out[..., lo:lo + _BLOCK] = p * (decay * state[..., None]
+                                        + alpha * np.cumsum(block / p, axis=-1))
+        state = out[..., lo + block.shape[-1] - 1]
+    return out
+
+
+def _window(cumulative, end, days):
+    ''' per-row sum of the `days` columns ending at column end[row] '''
+    rows = np.arange(len(end))
+    return cumulative[rows, end + 1] - cumulative[rows, np.maximum(end + 1 - days, 0)]
+
+
+# --- Summary ---
+
+def _row_stats(days, volume, rows, n_rows):
+    first = days.min()
+    length = int(days.max() - first) + 1
+    col = days - first
+    flat = rows * length + col
+    load = np.bincount(flat, weights=volume, minlength=n_rows * length).reshape(n_rows, length)
+    count = np.bincount(flat, minlength=n_rows * length).reshape(n_rows, length)
+
+    zero = np.zeros((n_rows, 1))
+    load_sum = np.concatenate((zero, np.cumsum(load, axis=1)), axis=1)
+    square_sum = np.concatenate((zero, np.cumsum(load ** 2, axis=1)), axis=1)
+    count_sum = np.concatenate((zero, np.cumsum(count, axis=1)), axis=1)
+
+    # each row is read at its own latest workout
+    end = np.full(n_rows, -1)
+    np.maximum.at(end, rows, col)
+    start = np.full(n_rows, length)
+    np.minimum.at(start, rows, col)
+    workouts = np.bincount(rows, minlength=n_rows)
+    peak = np.full(n_rows, -np.inf)
+    np.maximum.at(peak, rows, volume)
+
+    acute = _window(load_sum, end, ACUTE_DAYS)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        chronic = _window(load_sum, end, CHRONIC_DAYS) / _window(count_sum, end, CHRONIC_DAYS) * 4
+        # every row's EWMA starts at its own first workout : the days before
+        # repeat that load, which keeps the average at exactly that value
+        index = np.arange(n_rows)
+        seeded = np.where(np.arange(length) < start[:, None], load[index, start][:, None], load)
+        acwr = ewma(seeded, ACUTE_DAYS)[index, end] / ewma(seeded, CHRONIC_DAYS)[index, end]
+
+        # Foster : the last 7 daily loads (rest days count as 0)
+        mean7 = acute / ACUTE_DAYS
+        var7 = (_window(square_sum, end, ACUTE_DAYS) - ACUTE_DAYS * mean7 ** 2) / (ACUTE_DAYS - 1)
+        sd7 = np.sqrt(np.maximum(var7, 0))
+        monotony = np.where(sd7 > 1e-9, mean7 / sd7, np.nan)
+
+    # "last 4 weeks" : workouts from end - 28 on, averaged over the weeks they span
+    recent = col >= end[rows] - RECENT_DAYS
+    recent_count = np.bincount(rows[recent], minlength=n_rows)
+    recent_first = np.full(n_rows, length)
+    np.minimum.at(recent_first, rows[recent], col[recent])
+    week_of = lambda c: (c + first + _EPOCH_WEEKDAY) // 7
+    recent_weeks = week_of(end) - week_of(recent_first) + 1
+
+    # weekly coefficient of variation over each row's own weeks (empty weeks count)
+    weeks = week_of(col) - week_of(0)
+    n_weeks = int(weeks.max()) + 1
+    weekly = np.bincount(rows * n_weeks + weeks, weights=volume,
+                         minlength=n_rows * n_weeks).reshape(n_rows, n_weeks)
+    span = np.arange(n_weeks)
+    first_week, last_week = week_of(start) - week_of(0), week_of(end) - week_of(0)
+    inside = (span >= first_week[:, None]) & (span <= last_week[:, None])
+    n = inside.sum(axis=1)
+    weekly_mean = np.where(inside, weekly, 0).sum(axis=1) / n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weekly_sd = np.sqrt(np.where(inside, (weekly - weekly_mean[:, None]) ** 2, 0).sum(axis=1)
+                            / (n - 1))
+        cv = np.where(weekly_mean > 0, weekly_sd / weekly_mean, np.nan)
+
+    # streaks : one run-length pass, rows kept apart by a gap column
+    firsts, lengths = streaks.runs(rows * (length + 1) + col)
+    run_row = firsts // (length + 1)
+    longest = np.zeros(n_rows, dtype=int)
+    np.maximum.at(longest, run_row, lengths)
+    current = np.zeros(n_rows, dtype=int)
+    last_run = np.flatnonzero(np.diff(run_row, append=-1) != 0)
+    current[run_row[last_run]] = lengths[last_run]
+
+    return [{
+        "mean": _round(load_sum[r, -1] / workouts[r]),
+        "stddev": _round(cv[r]),
+        "max": _round(peak[r]),
+        "workout_last_4wk": int(recent_count[r]),
+        "workout_4wk": float(recent_count[r] / recent_weeks[r]),
+        "acute": _round(acute[r]),
+        "chronic": _round(chronic[r]),
+        "acwr": _round(acwr[r]) if np.isfinite(acwr[r]) else None,
+        "monotony": _round(monotony[r]),
+        "strain": _round(acute[r] * monotony[r]),
+        "cur_streak": int(current[r]),
+        "long_streak": int(longest[r]),
+    } for r in range(n_rows)]
+
+
+def summary(dates, volume, workout_types=None):
+    '''
+    training load of one row per workout (ascending dates); with workout_types
+    the same statistics per type id under "by_type"
+    '''
+    volume = np.asarray(volume, dtype=float)
+    if not len(volume):
+        return {}
+    days = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+    if workout_types is None:
+        workout_types = np.full(len(volume), NO_TYPE)
+    types, group = np.unique(np.asarray(workout_types, dtype=int), return_inverse=True)
+    # row 0 : every workout, row k + 1 : workouts of types[k]
+    rows = np.concatenate((np.zeros(len(volume), dtype=int), group.ravel() + 1))
+    per_row = _row_stats(np.tile(days, 2), np.tile(volume, 2), rows, len(types) + 1)
+    result = per_row[0]
+    result["by_type"] = dict(zip(types.tolist(), per_row[1:]))
+    return result
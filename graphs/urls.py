@@ -7,7 +7,10 @@ urlpatterns = [
     path("graph/analytics/", views.get_bw_cal_time, name="main-graph"),
     path("graph/analytics/bw-sum/", views.get_bw_summary, name="bw-summary"),
     path("graph/analytics/nutrition-sum/", views.get_nutrition_summary, name="nutrition-summary"),
+    path("graph/analytics/dashboard/", views.get_dashboard_analytics, name="dashboard-analytics"),
+    path("graph/analytics/all.json", views.get_analytics, name="analytics"),
     path("calendar/", views.calendar_heatmap, name="calendar"),
+    path("calendar/data", views.calendar_data, name="calendar-data"),
     path("graph/lift/<str:lift_name>/orm", views.get_lift_graph_orm, name="lift_orm"),
     path("nutrient/macros", views.get_macro_breakdown, name="macros"),
     path("nutrient/minerals", views.get_mineral_breakdown, name="minerals"),
@@ -3,15 +3,20 @@
     - Calendar  : shows high level overview and averages of metrics
     - Graphs    : displays simple d3 line graphs of x over time
 """
+import base64
 from datetime import timedelta
-import pandas as pd
 import numpy as np
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.template.loader import render_to_string
 from core.models import Day, RDA_LOOKUP, get_goal_type
 from calcounter.models import Food
-from workouts.models import Lift, Workout
+from workouts.models import Lift, week_start
+from django.core.exceptions import BadRequest
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils.dateparse import parse_date
+from core.middleware import query_budget
+from . import timeseries, stats
 import json
 from datetime import date, datetime
 from calendar import monthrange
@@ -20,50 +25,84 @@ from calendar import monthrange
 
 # === Calendars ===
 
+CALENDAR_MAX_DAYS = 366
+
+
+def calendar_window(request, default_days):
+    '''
+    (start, days) from ?year=YYYY or ?start=YYYY-MM-DD&days=N,
+    default : `default_days` from this week's Sunday; ValueError when malformed
+    '''
+    year = request.GET.get("year")
+    if year:
+        start = date(int(year), 1, 1)
+        return start, (date(start.year + 1, 1, 1) - start).days
+    start = request.GET.get("start")
+    start = date.fromisoformat(start) if start else week_start(date.today())
+    days = int(request.GET.get("days", default_days))
+    return start, min(max(days, 1), CALENDAR_MAX_DAYS)
+
+
+def calendar_payload(request, start, days):
+    ''' dense window of the user's compact calendar columns, uint8 arrays as base64 '''
+    ratio, flags = timeseries.calendar_window(timeseries.for_request(request), start, days)
+    return {
+        "start": start.isoformat(),
+        "days": days,
+        "ratio": base64.b64encode(ratio.tobytes()).decode(),
+        "flags": base64.b64encode(flags.tobytes()).decode(),
+    }
+
+
 @login_required
 def calendar_heatmap(request):
     """Display calendar heatmap. Template (1-week vs 2-week window)
-    is chosen based on the user's profile setting.
+    is chosen based on the user's profile setting; only that window is sent,
+    further windows come from calendar_data as the user navigates.
     """
-    data = request.user.days.all().exclude(date=date(1, 1, 1))
-    days = [
-        {"id": d.id, "date": d.date.isoformat(), "ratio": round(d.calorie_ratio, 2)}
-        for d in data
-    ]
-    template_name = "graphs/calendar.html"
+    template_name, default_days = "graphs/calendar.html", 14
     profile = getattr(request.user, "profile", None)
     if profile and getattr(profile, "calendar_view", "2w") == "1w":
-        template_name = "graphs/one-week-calendar.html"
-    return render(request, template_name, {"day_data": json.dumps(days)})
+        template_name, default_days = "graphs/one-week-calendar.html", 7
+    try:
+        start, days = calendar_window(request, default_days)
+    except ValueError:
+        return HttpResponseBadRequest("invalid calendar window")
+    payload = calendar_payload(request, start, days)
+    return render(request, template_name, {"day_data": json.dumps(payload)})
+
+
+@login_required
+def calendar_data(request):
+    """ one calendar window (?start=&days= or ?year=) as JSON """
+    try:
+        start, days = calendar_window(request, 14)
+    except ValueError:
+        return HttpResponseBadRequest("invalid calendar window")
+    return JsonResponse(calendar_payload(request, start, days))
 
 
 
 # === Line Graphs ===
     
 def get_lift_history(user, exercise_name):
+    ''' (date, e1rm) of every logged lift of a movement, oldest first '''
     return Lift.objects.filter(
         workout__day__user=user,
         movement__name__iexact=exercise_name # Use iexact to be case-insensitive
-    ).select_related(
-        'workout__day' # Join these tables to avoid N+1 queries in the template
-    ).prefetch_related(
-        'sets' # Load the reps/weight data in one go
     ).order_by(
-        'workout__day__date'
-    )
+        'workout__day__date', 'id'
+    ).values_list('workout__day__date', 'e1rm')
 
 
 @login_required
 def get_lift_graph_orm(request, lift_name):
-    history = get_lift_history(request.user, lift_name)
-    data = []
-    for lift in history:
-        orm = lift.estimated_1rm()
-        if orm:
-            data.append({
-                "date": lift.workout.day.date.isoformat(),
-                "one_rm": round(orm, 2),
-            })
+    # e1rm is precomputed on Lift by the Set signals : one query for any history length
+    data = [
+        {"date": day.isoformat(), "one_rm": round(orm, 2)}
+        for day, orm in get_lift_history(request.user, lift_name)
+        if orm
+    ]
     return render(request, "graphs/lift_graph_orm.html", {'data': json.dumps(data)})
 
 
@@ -74,36 +113,7 @@ def get_bw_cal_time(request):
         : bodyweight is line chart with 7 day moving average
         : calories is bar chart
     '''
-    data = request.user.days.all().exclude(date=date(1, 1, 1)).order_by('date')
-    df = pd.DataFrame([
-        {
-            "date": d.date, 
-            "bodyweight": d.bodyweight,
-            "calories": d.calories_consumed
-        }
-        for d in data
-    ])
-    
-    out_data = []
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.set_index('date')
-        
-        # moving average for bodyweight
-        df["weight_ma7"] = df["bodyweight"].rolling(7, min_periods=1).mean()
-        
-        # replace NaN with None for json serialization
-        df_clean = df.replace({np.nan: None})
-        
-        for row in df_clean.itertuples():
-            out_data.append({
-                "day": row.Index.isoformat(),
-                "bodyweight": row.bodyweight,
-                "ma7": row.weight_ma7,
-                "calories": row.calories
-            })
-            
-    context = {"day_data": json.dumps(out_data)}
+    context = {"day_data": json.dumps(timeseries.summary(request)["series"])}
     return render(request, 'graphs/bw-cal-time.html', context)
 
 # Unused
@@ -126,17 +136,20 @@ def get_bw_graph(request):
 @login_required
 def get_cal_graph(request):
     '''Time series of Calories / Day'''
-    days = request.user.days.all().exclude(date=date(1, 1, 1))
+    series = timeseries.for_request(request)
+    carbs, protein, fat = stats.macro_grams(series.days['calories'], series.days['protein'])
     data = [
         {
-         "date": d.date.isoformat(),
-         "calories": d.calories_consumed,
-         "carbs": (w := d.macro_breakdown)[0],
-         "protein": w[1],
-         "fat": w[2]
+         "date": d,
+         "calories": c,
+         "carbs": cb,
+         "protein": p,
+         "fat": f
         }
-        for d in days
-    ]
+        for d, c, cb, p, f in zip(
+            series.days['date'].astype(str).tolist(), series.days['calories'].tolist(),
+            carbs.tolist(), protein.tolist(), fat.tolist())
+    ][::-1]  # newest first, like Day.Meta.ordering
     context = {"day_data": json.dumps(data)}
     return render(request, 'graphs/cal-time.html', context)
 
@@ -144,19 +157,16 @@ def get_cal_graph(request):
 @login_required
 def get_volume_graph(request):
     '''Time series of Volume / Day'''
-    days = Day.objects.filter(user=request.user).exclude(date=date(1, 1, 1))
+    series = timeseries.for_request(request)
     stats = get_volume_summary(request)
     summary = render_to_string('graphs/volume_summary.html',
                                context=stats, request=request)
-    tmp = []
-    for d in days:
-        total = sum(w.total_volume() for w in d.workouts.all())
-        if total == 0:
-            continue
-        tmp.append({
-            "day": d.date.isoformat(),
-            "value": total
-        })
+    trained = series.days['volume'] != 0
+    tmp = [
+        {"day": d, "value": v}
+        for d, v in zip(series.days['date'][trained].astype(str).tolist()[::-1],
+                        series.days['volume'][trained].tolist()[::-1])
+    ]
     workout_types = request.user.workout_types.all()
     context = {
         "day_data": json.dumps(tmp),
@@ -169,10 +179,20 @@ def get_volume_graph(request):
 
 # === Macro breakdown Pie Charts ===
 
+def selected_day(request):
+    ''' the logged Day of ?selected_date= : a read, never creates it (400 bad date, 404 no day) '''
+    try:
+        selected = parse_date(request.GET.get("selected_date") or "")
+    except ValueError:
+        selected = None
+    if selected is None:
+        raise BadRequest("invalid selected_date")
+    return get_object_or_404(Day, user=request.user, date=selected)
+
 @login_required
 def get_macro_breakdown(request):
     ''' return macro breakdown for a specific date '''
-    day = get_object_or_404(Day, user=request.user, date=request.GET.get("selected_date"))
+    day = selected_day(request)
     carbs, protein, fat = day.macro_breakdown
     total = day.calories_consumed
     goals = {}
@@ -200,7 +220,7 @@ def get_macro_breakdown(request):
 
 @login_required
 def get_mineral_breakdown(request):
-    day = get_object_or_404(Day, user=request.user, date=request.GET.get("selected_date"))
+    day = selected_day(request)
     goal_type = get_goal_type(request.user)
     goals = {}
     for mineral, values in RDA_LOOKUP['Minerals'].items():
@@ -214,7 +234,7 @@ def get_mineral_breakdown(request):
 
 @login_required
 def get_vitamin_breakdown(request):
-    day = get_object_or_404(Day, user=request.user, date=request.GET.get("selected_date"))
+    day = selected_day(request)
     goal_type = get_goal_type(request.user)
     goals = {}
     for vitamin, values in RDA_LOOKUP['Vitamins'].items():
@@ -228,7 +248,7 @@ def get_vitamin_breakdown(request):
 
 @login_required
 def get_nutrient_overview(request):
-    day = get_object_or_404(Day, user=request.user, date=request.GET.get("selected_date"))
+    day = selected_day(request)
     carbs, protein, fat = day.macro_breakdown
     total = day.calories_consumed
     goal_type = get_goal_type(request.user)
@@ -273,213 +293,57 @@ def get_nutrient_overview(request):
 # === Statistics Computations ===
 
 
+@login_required
+@query_budget(4)
 def get_bw_summary(request):
     ''' fill summary statistics under bodyweight '''
-    # -- create dataframe
-    data = request.user.days.all().exclude(date=date(1, 1, 1))
-    df = pd.DataFrame([
-        {"date": d.date, "bodyweight": d.bodyweight}
-        for d in data
-    ])
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.set_index('date')
-    # -- average weight (mean)
-#    data = [d.bodyweight for d in data if d.bodyweight is not None]
-    avg_weight = df['bodyweight'].mean()
-    # this weeks 7d average
-    this_week = df.index.max() - timedelta(days=df.index.max().weekday())
-    this_week_avg = df.loc[:this_week].mean()['bodyweight']
-    # -- daily weight fluctation (stddev of diff)
-    df['diff'] = df['bodyweight'].diff()
-    fluctation = df['diff'].std()
-    # -- lbs +/- per week
-    weekly_weights = df["bodyweight"].resample("W").mean()
-    weekly_diff = weekly_weights.diff()
-    pm_per_week = weekly_diff.mean()
-    # -- simple stats
-    if pd.notna(df['bodyweight'].iloc[0]) and pd.notna(df['bodyweight'].min()):
-        total_change = df['bodyweight'].iloc[0] - df['bodyweight'].iloc[-1]
-    else:
-        total_change = 0
-    
-    stats = {
-        "avg_weight": float(avg_weight),
-        "7d_avg": float(this_week_avg),
-        "stddev": float(fluctation),
-        "total_change": float(total_change),
-        "pm_per_week": float(pm_per_week),
-    }
-    return render(request, 'graphs/bw-summary.html', {'stats': stats})
+    return render(request, 'graphs/bw-summary.html',
+                  {'stats': timeseries.summary(request)["bodyweight"]})
 
 
+@login_required
+@query_budget(4)
 def get_nutrition_summary(request, time=7):
-    # -- create dataframe
-    data = request.user.days.all().exclude(date=date(1, 1, 1))
-    df = pd.DataFrame([
-        {"date": d.date,
-         "cals": d.calories_consumed,
-         "goal": d.calorie_goal,
-         "pro": d.protein_consumed,
-         "water": d.water_consumed,
-         "carb": d.macro_breakdown[0],
-         "fat": d.macro_breakdown[2],
-         }
-        for d in data
-        if d.calories_consumed != 0
-    ])
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.set_index('date')
-    # -- simple averages
-    avg_cals = df['cals'].mean()
-    avg_pro = df['pro'].mean()
-    avg_water = df['water'].mean()
-    avg_carb = df['carb'].mean()
-    avg_fat = df['fat'].mean()
-    avg_goal_diff = df['goal'].mean() - df['cals'].mean()
-    # -- 7d averages
-    weekly_cals = df['cals'].resample("W").mean()
-    weekly_pro = df['pro'].resample("W").mean()
-    _7d_avg_cals = weekly_cals.dropna().mean()
-    _7d_avg_pro = weekly_pro.dropna().mean()
-    # -- simple stats
-    stats = {
-        "mean_c": float(avg_cals),
-        "mean_p": float(avg_pro),
-        "mean_carb": float(avg_carb),
-        "mean_f": float(avg_fat),
-        "mean_water": float(avg_water),
-        "7d_avg_c": float(_7d_avg_cals),
-        "7d_avg_p": float(_7d_avg_pro),
-        "stddev_c": float(avg_goal_diff),
-    }
-    return render(request, 'graphs/nutrition-summary.html', {'stats': stats})
+    return render(request, 'graphs/nutrition-summary.html',
+                  {'stats': timeseries.summary(request)["nutrition"]})
 
 
 def get_volume_summary(request):
-    workouts = (
-        Workout.objects.filter(day__user=request.user)
-        .exclude(day__date=date(1, 1, 1))
-        .select_related("day", "workout_type")
-        .prefetch_related("lifts__sets")
-        .order_by("-day__date", "-id")
-    )
-    df = pd.DataFrame([
-        {"date": d.day.date, "workout_type": d.workout_type,
-            "total_volume": d.total_volume()}
-        for d in workouts
-    ])
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.set_index('date')
-
-    # --- 1) Workouts per week (last 4 weeks + lifetime avg) ---
-    today = df.index.max()
-    four_weeks_ago = today - timedelta(weeks=4)
-
-    workouts_last_4_weeks = df.loc[df.index >= four_weeks_ago]
-    workouts_per_week_4wk = workouts_last_4_weeks.resample("W").size().mean()
-    workouts_per_week_lifetime = df.resample("W").size().mean()
-    # --- 3) ACWR (acute–chronic workload ratio) ---
-    acute_load = df["total_volume"].last("7D").sum()
-    chronic_load = df["total_volume"].last("28D").mean() * 4
-    acwr = acute_load / chronic_load if chronic_load > 0 else None
-
-    # -- mean
-    avg_volume = df['total_volume'].mean()
-    # -- stddev
-    weekly_volume = df["total_volume"].resample("W").sum()
-    if weekly_volume.mean() > 0:
-        weekly_volume_cv = weekly_volume.std() / weekly_volume.mean()
-    else:
-        weekly_volume_cv = None
-    # -- max
-    heaviest = df['total_volume'].max()
-    # -- streaks
-    daily_presence = df["total_volume"].resample("D").size() > 0
-    # Current streak: count backward from last workout day
-    current_streak = 0
-    for v in reversed(daily_presence):
-        if v:
-            current_streak += 1
-        else:
-            break
-    # Longest streak: scan runs of True values
-    longest_streak = 0
-    temp = 0
-    for v in daily_presence:
-        if v:
-            temp += 1
-            longest_streak = max(longest_streak, temp)
-        else:
-            temp = 0
-    stats = {
-        "mean": round(float(avg_volume), 2),
-        "stddev": round(float(weekly_volume_cv), 2),
-        "max": round(float(heaviest), 2),
-        "workout_last_4wk": len(workouts_last_4_weeks),
-        "workout_4wk": workouts_per_week_4wk,
-        "acute": round(float(acute_load), 2),
-        "chronic": round(float(chronic_load), 2),
-        "acwr": round(float(acwr), 2),
-        "cur_streak": current_streak,
-        "long_streak": longest_streak,
-    }
+    ''' training load of all workouts, per workout type id under "by_type" (graphs.training_load) '''
+    return timeseries.summary(request)["volume"]
 
-    return stats
-
-
-def get_workout_type_summary(df):
-    ''' returns summary for a type of workout, i.e. "push" '''
-    # --- 1) Workouts per week (last 4 weeks + lifetime avg) ---
-    today = df.index.max()
-    four_weeks_ago = today - timedelta(weeks=4)
-
-    workouts_last_4_weeks = df.loc[df.index >= four_weeks_ago]
-    workouts_per_week_4wk = workouts_last_4_weeks.resample("W").size().mean()
-    workouts_per_week_lifetime = df.resample("W").size().mean()
-    # --- 3) ACWR (acute–chronic workload ratio) ---
-    acute_load = df["total_volume"].last("7D").sum()
-    chronic_load = df["total_volume"].last("28D").mean() * 4
-    acwr = acute_load / chronic_load if chronic_load > 0 else None
-
-    # -- mean
-    avg_volume = df['total_volume'].mean()
-    # -- stddev
-    weekly_volume = df["total_volume"].resample("W").sum()
-    if weekly_volume.mean() > 0:
-        weekly_volume_cv = weekly_volume.std() / weekly_volume.mean()
-    else:
-        weekly_volume_cv = None
-    # -- max
-    heaviest = df['total_volume'].max()
-    # -- streaks
-    daily_presence = df["total_volume"].resample("D").size() > 0
-    # Current streak: count backward from last workout day
-    current_streak = 0
-    for v in reversed(daily_presence):
-        if v:
-            current_streak += 1
-        else:
-            break
-    # Longest streak: scan runs of True values
-    longest_streak = 0
-    temp = 0
-    for v in daily_presence:
-        if v:
-            temp += 1
-            longest_streak = max(longest_streak, temp)
-        else:
-            temp = 0
-    stats = {
-        "mean": round(float(avg_volume), 2),
-        "stddev": round(float(weekly_volume_cv), 2),
-        "max": round(float(heaviest), 2),
-        "workout_last_4wk": len(workouts_last_4_weeks),
-        "workout_4wk": round(int(workouts_per_week_4wk)),
-        "acute": round(float(acute_load), 2),
-        "chronic": round(float(chronic_load), 2),
-        "acwr": round(float(acwr), 2),
-        "cur_streak": current_streak,
-        "long_streak": longest_streak,
-    }
 
-    return stats
+# === Combined ===
+
+def _json_safe(value):
+    ''' NaN -> null so the payload is valid JSON '''
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+@login_required
+def get_analytics(request):
+    '''
+    Every dashboard statistic in one payload:
+        series (bw / ma7 / calories), bodyweight, nutrition, volume
+    (the calendar has its own windowed endpoint : calendar_data)
+    '''
+    return JsonResponse(_json_safe(timeseries.summary(request)))
+
+
+@login_required
+@query_budget(4)
+def get_dashboard_analytics(request):
+    ''' graph + both summaries in one response (summaries swap out-of-band) '''
+    summary = timeseries.summary(request)
+    context = {
+        "day_data": json.dumps(summary["series"]),
+        "bw_stats": summary["bodyweight"],
+        "nutrition_stats": summary["nutrition"],
+    }
+    return render(request, 'graphs/dashboard-analytics.html', context)
@@ -17,6 +17,41 @@ LOGIN_REDIRECT_URL = 'core:home'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# `default` holds cross-process state as well as cached data : fragment
+# versions (core.fragments), the graphs series (graphs.timeseries), goal inputs
+# (core.goals) and typeahead index versions (core.typeahead). manage.py
+# commands (import_nutrition, import_fdc) invalidate through it, so outside a
+# single dev process it must be shared by every worker and command : prod puts
+# it on disk. With locmem, restart the web workers after a CLI import.
+#
+# `usda` caches USDA FoodData Central responses (calcounter.usda). Any Django
+# backend works; prod keeps it on disk so it survives restarts and is shared
+# by every worker. A database table also works:
+#   {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'usda_cache'}
+#   (then `python manage.py createcachetable`)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'usda': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'usda',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+USDA_CACHE = {
+    'TTL': 60 * 60 * 24,
+    'STALE_TTL': 60 * 60 * 24 * 30,
+    'NEGATIVE_TTL': 60 * 60,
+}
+# calcounter.usda_client; KEY defaults to the USDA_API_KEY environment variable
+USDA_API = {
+    'TIMEOUT': (3.05, 10),
+    'RETRIES': 2,
+    'BACKOFF': 0.5,
+    'POOL_SIZE': 10,
+}
+
 INSTALLED_APPS = [
     'fontawesomefree',
     'graphs.apps.GraphsConfig',
@@ -33,6 +68,7 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -41,6 +77,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.recompute.RecomputeMiddleware',
 ]
 
 
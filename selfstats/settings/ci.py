@@ -10,3 +10,6 @@ DATABASES = {
         'NAME': ':memory:',
     }
 }
+
+# fail the test run when a view goes over its @query_budget
+QUERY_BUDGET_STRICT = True
@@ -32,4 +32,17 @@ DATABASES = {
     }
 }
 
+# shared by the gunicorn workers and `docker compose exec web python manage.py ...`
+CACHES['default'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.getenv('CACHE_DIR', '/tmp/selfstats-cache'),
+    'OPTIONS': {'MAX_ENTRIES': 20000},
+}
+
+CACHES['usda'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.getenv('USDA_CACHE_DIR', '/tmp/selfstats-usda-cache'),
+    'OPTIONS': {'MAX_ENTRIES': 50000},
+}
+
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""
+Django management command to recompute WeeklyVolume from every logged Set.
+Use after bulk imports / edits that bypass the Set signals.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from workouts.models import WeeklyVolume
+
+
+class Command(BaseCommand):
+    help = 'Recompute weekly set counts per muscle group (all users, or --user)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='only rebuild this username')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['user']:
+            users = get_user_model().objects.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"No user named {options['user']}")
+
+        rows = WeeklyVolume.objects.rebuild(users=users)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} weekly volume rows'))
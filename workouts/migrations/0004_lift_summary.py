@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+def backfill_summaries(apps, schema_editor):
+    from workouts.models import summarize_sets
+    Lift = apps.get_model('workouts', 'Lift')
+    Set = apps.get_model('workouts', 'Set')
+    by_lift = {}
+    for lift_id, reps, weight in Set.objects.values_list('lift_id', 'reps', 'weight').order_by():
+        by_lift.setdefault(lift_id, []).append((reps, weight))
+    lifts = []
+    for lift in Lift.objects.filter(pk__in=by_lift).only('id'):
+        for field, value in summarize_sets(by_lift[lift.id]).items():
+            setattr(lift, field, value)
+        lifts.append(lift)
+    Lift.objects.bulk_update(
+        lifts, ['top_weight', 'top_reps', 'e1rm', 'volume', 'reps', 'set_count'], batch_size=2000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0003_movementlibrary_secondary_bodypart_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lift',
+            name='e1rm',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lift',
+            name='reps',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lift',
+            name='set_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lift',
+            name='top_reps',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lift',
+            name='top_weight',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lift',
+            name='volume',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
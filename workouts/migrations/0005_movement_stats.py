@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:39
+
+import django.db.models.deletion
+import workouts.models
+from django.db import migrations, models
+
+
+def backfill_stats(apps, schema_editor):
+    from workouts.models import replay_history
+    Lift = apps.get_model('workouts', 'Lift')
+    Set = apps.get_model('workouts', 'Set')
+    Workout = apps.get_model('workouts', 'Workout')
+    MovementStats = apps.get_model('workouts', 'MovementStats')
+    sets = {}
+    rows = Set.objects.order_by('lift_id', 'order', 'id').values_list('lift_id', 'reps', 'weight')
+    for lift_id, reps, weight in rows:
+        sets.setdefault(lift_id, []).append((reps, weight))
+    by_movement = {}
+    lifts = (Lift.objects.filter(set_count__gt=0).order_by('workout__day__date', 'id')
+             .values_list('movement_id', 'id', 'workout_id', 'workout__day__date'))
+    for movement_id, lift_id, workout_id, day in lifts:
+        by_movement.setdefault(movement_id, []).append((lift_id, workout_id, day))
+
+    per_workout = {}
+    for movement_id, history in by_movement.items():
+        fields, prs = replay_history((lift_id, day, sets[lift_id]) for lift_id, _, day in history)
+        MovementStats.objects.create(movement_id=movement_id, **fields)
+        for lift_id, workout_id, _ in history:
+            if prs[lift_id]:
+                Lift.objects.filter(pk=lift_id).update(personal_records=prs[lift_id])
+                per_workout[workout_id] = per_workout.get(workout_id, 0) + prs[lift_id]
+    for workout_id, n in per_workout.items():
+        Workout.objects.filter(pk=workout_id).update(personal_records=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0004_lift_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lift',
+            name='personal_records',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='MovementStats',
+            fields=[
+                ('movement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='workouts.movement')),
+                ('best_e1rm', models.FloatField(default=0)),
+                ('rep_maxes', models.JSONField(default=workouts.models.empty_rep_maxes)),
+                ('prior_e1rm', models.FloatField(default=0)),
+                ('prior_rep_maxes', models.JSONField(default=workouts.models.empty_rep_maxes)),
+                ('recent', models.JSONField(default=list)),
+                ('last_date', models.DateField(blank=True, null=True)),
+                ('last_sets', models.JSONField(default=list)),
+                ('lift_count', models.PositiveIntegerField(default=0)),
+                ('pr_count', models.PositiveIntegerField(default=0)),
+                ('last_lift', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='workouts.lift')),
+            ],
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
 from django.conf import settings
 from core.models import Day
-from django.db.models import F, Sum
+from django.db import transaction
+from django.db.models import F, Sum, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from datetime import date, timedelta
 
 # Can add bodyweight & banded (support calisentics & women)
 LIFT_TYPES = [
@@ -37,6 +40,11 @@ BODYPARTS = [
 bodypart_map = dict(BODYPARTS)
 
 
+def week_start(day_date):
+    ''' the Sunday on or before `day_date` (WeeklyVolume.start_date) '''
+    return day_date - timedelta(days=(day_date.weekday() + 1) % 7)
+
+
 class WorkoutType(models.Model):
     '''
         User's defined workout types:
@@ -99,16 +107,16 @@ class Workout(models.Model):
         """
         Computes total volume lifted in this workout:
         sum of (weight * reps) across all sets of all lifts.
+        Uses the `volume_total` annotation when the queryset has it (lists).
         """
-        return (
-            self.lifts
-            .values('sets__weight', 'sets__reps')
-            .aggregate(total=Sum(F('sets__weight') * F('sets__reps')))['total']
-            or 0
-        )
+        if hasattr(self, 'volume_total'):
+            return self.volume_total or 0
+        return self.lifts.aggregate(total=Sum('volume'))['total'] or 0
     
     @property
     def lift_count(self):
+        if hasattr(self, 'lift_total'):
+            return self.lift_total
         return self.lifts.count()
 
     def bodypart_list(self):
@@ -159,10 +167,60 @@ class Movement(models.Model):
         return f"{self.user} | {self.base_movement.name if self.base_movement else self.name}"
 
 
+def brzycki(weight, reps):
+    ''' estimated one-rep max: weight / (1.0278 - 0.0278 * reps) '''
+    if not weight:
+        return 0
+    denominator = 1.0278 - (0.0278 * reps)
+    if denominator <= 0:
+        return weight  # formula breaks down above ~37 reps
+    return weight / denominator
+
+
+def summarize_sets(sets):
+    ''' Lift summary columns from (reps, weight) pairs; best set = heaviest, then most reps '''
+    summary = dict(top_weight=0, top_reps=0, e1rm=0, volume=0, reps=0, set_count=0)
+    for reps, weight in sets:
+        if summary['set_count'] == 0 or (weight, reps) > (summary['top_weight'], summary['top_reps']):
+            summary['top_weight'], summary['top_reps'] = weight, reps
+        summary['volume'] += reps * weight
+        summary['reps'] += reps
+        summary['set_count'] += 1
+    summary['e1rm'] = brzycki(summary['top_weight'], summary['top_reps'])
+    return summary
+
+
+class LiftManager(models.Manager):
+    def refresh_summary(self, lift_id):
+        ''' recompute one lift's summary columns from its sets (one read, one UPDATE) '''
+        sets = Set.objects.filter(lift_id=lift_id).values_list('reps', 'weight')
+        self.filter(pk=lift_id).update(**summarize_sets(sets))
+
+    def rebuild_summaries(self, lifts=None, batch_size=2000):
+        ''' recompute every lift's summary columns (after bulk loads that skip signals) '''
+        lifts = self.all() if lifts is None else lifts
+        by_lift = {}
+        rows = (Set.objects.filter(lift__in=lifts)
+                .values_list('lift_id', 'reps', 'weight').order_by().iterator(chunk_size=batch_size))
+        for lift_id, reps, weight in rows:
+            by_lift.setdefault(lift_id, []).append((reps, weight))
+        fields = list(summarize_sets([]))
+        updated = []
+        for lift in lifts.only('id').iterator(chunk_size=batch_size):
+            for field, value in summarize_sets(by_lift.get(lift.id, [])).items():
+                setattr(lift, field, value)
+            updated.append(lift)
+        self.bulk_update(updated, fields, batch_size=batch_size)
+        return len(updated)
+
+
 class Lift(models.Model):
     '''
         Represents an instance of a movement performed
         - exercise_name
+        - summary of its sets (kept by the Set signals in core.signals):
+          top_weight/top_reps (best set), e1rm, volume, reps, set_count
+        - personal_records : sets that beat the movement's records (MovementStats)
     '''
     movement = models.ForeignKey(Movement, on_delete=models.CASCADE, related_name='instances')
     workout = models.ForeignKey(
@@ -170,32 +228,29 @@ class Lift(models.Model):
         on_delete=models.CASCADE,
         related_name='lifts')
 
-    @property
-    def set_count(self):
-        return self.sets.count()
+    top_weight = models.FloatField(default=0)
+    top_reps = models.PositiveIntegerField(default=0)
+    e1rm = models.FloatField(default=0)
+    volume = models.FloatField(default=0)
+    reps = models.PositiveIntegerField(default=0)
+    set_count = models.PositiveIntegerField(default=0)
+    personal_records = models.PositiveIntegerField(default=0)
+
+    objects = LiftManager()
 
     @property
     def total_reps(self):
-        return self.sets.aggregate(Sum('reps'))['reps__sum'] or 0
+        return self.reps
 
     @property
     def total_volume(self):
-        return self.sets.aggregate(
-            total=Sum(F('reps') * F('weight'))
-        )['total'] or 0
+        return self.volume
 
     def get_best_set(self):
-        return self.sets.order_by('-weight').first()
+        return self.sets.order_by('-weight', '-reps').first()
 
     def estimated_1rm(self):
-        best = self.get_best_set()
-        if best:
-            # Brzycki Formula: Weight / (1.0278 - (0.0278 * Reps))
-            denominator = 1.0278 - (0.0278 * best.reps)
-            if denominator <= 0:
-                return best.weight  # formula breaks down above ~37 reps
-            return best.weight / denominator
-        return 0
+        return self.e1rm
 
     def __str__(self):
         return f"{self.movement.name}: ({self.workout.workout_type} | {self.workout.day.date})"
@@ -226,6 +281,253 @@ class Set(models.Model):
         return f"{self.reps} reps @ {self.weight} ({self.lift.movement.name})"
 
 
+# === Movement strength history ===
+
+REP_MAX_RANGE = 12      # rep-max table covers 1RM .. 12RM
+ROLLING_DAYS = 90       # window of the "current" e1RM
+
+
+def empty_rep_maxes():
+    return [0] * REP_MAX_RANGE
+
+
+def empty_stats():
+    ''' MovementStats fields of a movement with no logged sets '''
+    return dict(best_e1rm=0, rep_maxes=empty_rep_maxes(), prior_e1rm=0,
+                prior_rep_maxes=empty_rep_maxes(), recent=[], last_lift_id=None,
+                last_date=None, last_sets=[], lift_count=0, pr_count=0)
+
+
+def apply_lift(stats, lift_id, day, sets, new=True):
+    '''
+    make (reps, weight) `sets` the movement's latest lift on top of the records
+    before it; `stats` is a dict of MovementStats fields, updated in place.
+    new=False re-applies the current latest lift after one of its sets changed.
+    A set is a PR when it beats the e1RM or the rep max for its reps held before
+    it (earlier lifts + earlier sets of this lift); the first lift sets no PRs.
+    Returns the lift's PR count.
+    '''
+    if new:
+        stats['prior_e1rm'], stats['prior_rep_maxes'] = stats['best_e1rm'], stats['rep_maxes']
+        stats['lift_count'] += 1
+    best = stats['prior_e1rm']
+    table = list(stats['prior_rep_maxes']) or empty_rep_maxes()
+    prs, top = 0, 0
+    for reps, weight in sets:
+        if not reps:
+            continue
+        e1rm = brzycki(weight, reps)
+        if stats['lift_count'] > 1 and (e1rm > best or weight > table[min(reps, REP_MAX_RANGE) - 1]):
+            prs += 1
+        best, top = max(best, e1rm), max(top, e1rm)
+        for r in range(min(reps, REP_MAX_RANGE)):
+            table[r] = max(table[r], weight)
+
+    cutoff = (day - timedelta(days=ROLLING_DAYS)).isoformat()
+    stats.update(
+        best_e1rm=best,
+        rep_maxes=table,
+        recent=[entry for entry in stats['recent'] if entry[0] != lift_id and entry[1] >= cutoff]
+        + [[lift_id, day.isoformat(), round(top, 2)]],
+        last_lift_id=lift_id,
+        last_date=day,
+        last_sets=[[reps, weight] for reps, weight in sets],
+    )
+    return prs
+
+
+def replay_history(lifts):
+    ''' (MovementStats fields, {lift id: PR count}) from [(lift id, date, sets)], oldest first '''
+    stats, prs = empty_stats(), {}
+    for lift_id, day, sets in lifts:
+        prs[lift_id] = apply_lift(stats, lift_id, day, sets)
+        stats['pr_count'] += prs[lift_id]
+    return stats, prs
+
+
+class MovementStatsManager(models.Manager):
+    def refresh_for_lift(self, lift_id):
+        '''
+        after a set of `lift_id` changed : O(sets of that lift) when it is, or
+        becomes, the movement's latest lift, a full replay otherwise
+        '''
+        lift = (Lift.objects.filter(pk=lift_id)
+                .values('movement_id', 'workout_id', 'workout__day__date', 'personal_records')
+                .first())
+        if lift is None:
+            return
+        sets = list(Set.objects.filter(lift_id=lift_id).order_by('order', 'id')
+                    .values_list('reps', 'weight'))
+        stats, _ = self.get_or_create(movement_id=lift['movement_id'])
+        day = lift['workout__day__date']
+        is_last = stats.last_lift_id == lift_id
+        is_newer = stats.last_date is None or (day, lift_id) > (stats.last_date, stats.last_lift_id or 0)
+        if not sets or not (is_last or is_newer):
+            return self.rebuild(lift['movement_id'])
+
+        fields = stats.as_dict()
+        prs = apply_lift(fields, lift_id, day, sets, new=not is_last)
+        previous = lift['personal_records'] if is_last else 0
+        fields['pr_count'] += prs - previous
+        for field, value in fields.items():
+            setattr(stats, field, value)
+        stats.save()
+        if prs != lift['personal_records']:
+            Lift.objects.filter(pk=lift_id).update(personal_records=prs)
+            self.refresh_workouts([lift['workout_id']])
+
+    def rebuild(self, movement_id, workout_ids=()):
+        ''' replay a movement's whole history (older lift edited, set moved or lift deleted) '''
+        lifts = list(Lift.objects.filter(movement_id=movement_id, set_count__gt=0)
+                     .order_by('workout__day__date', 'id')
+                     .values_list('id', 'workout_id', 'workout__day__date', 'personal_records'))
+        prs = {}
+        if not lifts:
+            self.filter(movement_id=movement_id).delete()
+        else:
+            sets = {}
+            rows = (Set.objects.filter(lift__movement_id=movement_id)
+                    .order_by('lift_id', 'order', 'id').values_list('lift_id', 'reps', 'weight'))
+            for lift_id, reps, weight in rows:
+                sets.setdefault(lift_id, []).append((reps, weight))
+            fields, prs = replay_history((lift_id, day, sets.get(lift_id, []))
+                                         for lift_id, _, day, _ in lifts)
+            self.update_or_create(movement_id=movement_id, defaults=fields)
+
+        changed = [(lift_id, workout_id, prs[lift_id])
+                   for lift_id, workout_id, _, old in lifts if prs[lift_id] != old]
+        emptied = (Lift.objects.filter(movement_id=movement_id, set_count=0, personal_records__gt=0)
+                   .values_list('id', 'workout_id'))
+        changed += [(lift_id, workout_id, 0) for lift_id, workout_id in emptied]
+        for lift_id, _, n in changed:
+            Lift.objects.filter(pk=lift_id).update(personal_records=n)
+        self.refresh_workouts({workout_id for _, workout_id, _ in changed} | set(workout_ids))
+
+    def rebuild_all(self, movements=None):
+        ''' replay every movement (after bulk loads that skip signals) '''
+        ids = list((movements if movements is not None else Movement.objects.all())
+                   .values_list('id', flat=True))
+        for movement_id in ids:
+            self.rebuild(movement_id)
+        return len(ids)
+
+    def refresh_workouts(self, workout_ids):
+        ''' Workout.personal_records = sum of its lifts' PRs, one UPDATE '''
+        if not workout_ids:
+            return
+        per_workout = (Lift.objects.filter(workout=OuterRef('pk')).order_by()
+                       .values('workout').annotate(n=Sum('personal_records')).values('n'))
+        Workout.objects.filter(pk__in=workout_ids).update(
+            personal_records=Coalesce(Subquery(per_workout), 0)
+        )
+
+
+class MovementStats(models.Model):
+    '''
+        Strength history of one Movement in a single row, kept by the Set
+        signals (core.signals) : a set on the latest lift is applied
+        incrementally, anything else replays the movement's lifts.
+        - best_e1rm, rep_maxes         all-time records (rep_maxes[r - 1] = rRM)
+        - prior_e1rm, prior_rep_maxes  records before the latest lift
+        - recent                       [lift id, date, e1rm] within ROLLING_DAYS of the latest lift
+        - last_lift, last_date, last_sets   latest lift with sets and its [reps, weight]
+        - lift_count, pr_count
+    '''
+    movement = models.OneToOneField(
+        Movement, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    best_e1rm = models.FloatField(default=0)
+    rep_maxes = models.JSONField(default=empty_rep_maxes)
+    prior_e1rm = models.FloatField(default=0)
+    prior_rep_maxes = models.JSONField(default=empty_rep_maxes)
+    recent = models.JSONField(default=list)
+    last_lift = models.ForeignKey(
+        Lift, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_date = models.DateField(null=True, blank=True)
+    last_sets = models.JSONField(default=list)
+    lift_count = models.PositiveIntegerField(default=0)
+    pr_count = models.PositiveIntegerField(default=0)
+
+    objects = MovementStatsManager()
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in empty_stats()}
+
+    @property
+    def rolling_e1rm(self):
+        ''' best e1RM of the last ROLLING_DAYS '''
+        cutoff = (date.today() - timedelta(days=ROLLING_DAYS)).isoformat()
+        return max((e1rm for _, day, e1rm in self.recent if day >= cutoff), default=0)
+
+    @property
+    def top_set(self):
+        ''' (weight, reps) of the latest lift's heaviest set '''
+        return max(((weight, reps) for reps, weight in self.last_sets), default=None)
+
+    @property
+    def rep_max_table(self):
+        return [(reps, weight) for reps, weight in enumerate(self.rep_maxes, 1) if weight]
+
+    def __str__(self):
+        return f"{self.movement} | e1RM {self.best_e1rm:.0f}"
+
+
+class WeeklyVolumeManager(models.Manager):
+    def apply_delta(self, user_id, start_date, muscles, delta):
+        '''
+        add `delta` sets to each muscle's row for that week in one UPDATE;
+        rows are created on increment and never drop below zero
+        '''
+        muscles = {m for m in muscles if m}
+        if not muscles or not delta:
+            return
+        rows = self.filter(user_id=user_id, start_date=start_date, muscle_group__in=muscles)
+        updated = rows.update(set_count=Greatest(F('set_count') + delta, 0))
+        if updated == len(muscles) or delta < 0:
+            return
+        existing = set(rows.values_list('muscle_group', flat=True))
+        for muscle in muscles - existing:
+            _, created = self.get_or_create(
+                user_id=user_id, start_date=start_date, muscle_group=muscle,
+                defaults={'set_count': delta},
+            )
+            if not created:  # lost a race with a concurrent insert
+                self.filter(user_id=user_id, start_date=start_date, muscle_group=muscle) \
+                    .update(set_count=F('set_count') + delta)
+
+    def rebuild(self, users=None):
+        '''
+        recompute every week from Sets with one grouped query
+        primary and secondary bodypart each get full credit for a set
+        '''
+        sets = Set.objects.all()
+        if users is not None:
+            sets = sets.filter(lift__workout__day__user__in=users)
+        grouped = (sets
+                   .values_list('lift__workout__day__user_id',
+                                'lift__workout__day__date',
+                                'lift__movement__bodypart',
+                                'lift__movement__secondary_bodypart')
+                   .annotate(n=Count('id'))
+                   .order_by())
+
+        counts = {}
+        for user_id, day_date, primary, secondary, n in grouped:
+            sunday = week_start(day_date)
+            for muscle in {primary, secondary} - {None, ''}:
+                key = (user_id, sunday, muscle)
+                counts[key] = counts.get(key, 0) + n
+
+        with transaction.atomic():
+            stale = self.all() if users is None else self.filter(user__in=users)
+            stale.delete()
+            self.bulk_create([
+                WeeklyVolume(user_id=user_id, start_date=sunday,
+                             muscle_group=muscle, set_count=n)
+                for (user_id, sunday, muscle), n in counts.items()
+            ], batch_size=500)
+        return len(counts)
+
+
 # Stored statistics of sets per muscle group per week
 class WeeklyVolume(models.Model):
     user = models.ForeignKey(
@@ -235,5 +537,7 @@ class WeeklyVolume(models.Model):
     muscle_group = models.CharField(max_length=2, choices=BODYPARTS)
     set_count = models.PositiveIntegerField(default=0)
 
+    objects = WeeklyVolumeManager()
+
     class Meta:
         unique_together = ['user', 'start_date', 'muscle_group']
\ No newline at end of file
@@ -0,0 +1,37 @@
+'''
+ Movement library typeahead : MovementLibrary names held in a per-process
+ core.typeahead index, kept up by core.signals on save/delete. Names that
+ only contain the query ("ench" in "Bench Dip") come back after the prefix
+ matches, as with the icontains filter this replaced.
+'''
+from collections import namedtuple
+from core import typeahead
+from .models import MovementLibrary
+
+LibraryEntry = namedtuple('LibraryEntry', ['id', 'name', 'bodypart', 'category', 'is_premium'])
+
+
+def library_entry(movement):
+    return LibraryEntry(movement.pk, movement.name, movement.bodypart,
+                        movement.category, movement.is_premium)
+
+
+def _library_rows():
+    rows = MovementLibrary.objects.values_list('id', 'name', 'bodypart', 'category', 'is_premium')
+    return [(LibraryEntry(*row), row[1]) for row in rows]
+
+
+library_index = typeahead.LazyIndex('movement_library', _library_rows)
+
+
+def search_library(query, exclude_ids=(), bodypart=None, category=None, limit=None):
+    ''' free library movements matching `query`, minus the ones in exclude_ids '''
+    exclude_ids = set(exclude_ids)
+
+    def keep(mv):
+        return (not mv.is_premium
+                and mv.id not in exclude_ids
+                and (not bodypart or mv.bodypart == bodypart)
+                and (not category or mv.category == category))
+
+    return library_index.search(query, limit=limit, keep=keep, substring=True)
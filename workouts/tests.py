@@ -2,10 +2,16 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from workouts.models import (
     WorkoutType, WorkoutTypeBodypart, Movement, MovementLibrary,
-    Lift, Set, Workout, WeeklyVolume,
+    Lift, Set, Workout, WeeklyVolume, week_start, brzycki, summarize_sets,
+    MovementStats, replay_history,
 )
 from core.models import Day
+from django.core.management import call_command
+from django.urls import reverse
 from datetime import date
+import json
+from io import StringIO
+from unittest import mock
 
 
 # ==============================================================================
@@ -193,3 +199,344 @@ class MovementDeletionTest(TestCase):
     def test_non_archived_movement_appears_in_active_list(self):
         active = Movement.objects.filter(user=self.user, is_archived=False)
         self.assertIn(self.movement, active)
+
+
+# ==============================================================================
+# Weekly volume — F() deltas per (user, Sunday, muscle) & rebuild command
+# ==============================================================================
+
+class WeeklyVolumeTest(TestCase):
+    """Set signals keep WeeklyVolume in step; rebuild_weekly_volume recomputes it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('volume', password='testpass')
+        self.push = WorkoutType.objects.get(user=self.user, name='Push')
+        # Wednesday -> week starts Sunday 2025-01-05
+        self.day = Day.objects.create(user=self.user, date=date(2025, 1, 8))
+        self.workout = Workout.objects.create(day=self.day, workout_type=self.push)
+        self.bench = Movement.objects.create(
+            user=self.user, name='Bench Press', bodypart='CH', secondary_bodypart='TI', category='B'
+        )
+        self.lift = Lift.objects.create(movement=self.bench, workout=self.workout)
+
+    def _count(self, muscle, sunday=date(2025, 1, 5)):
+        row = WeeklyVolume.objects.filter(user=self.user, start_date=sunday, muscle_group=muscle).first()
+        return row.set_count if row else 0
+
+    def test_week_start_is_sunday(self):
+        self.assertEqual(week_start(date(2025, 1, 5)), date(2025, 1, 5))
+        self.assertEqual(week_start(date(2025, 1, 11)), date(2025, 1, 5))
+
+    def test_new_sets_increment_primary_and_secondary(self):
+        for _ in range(3):
+            Set.objects.create(lift=self.lift, reps=8, weight=185)
+        self.assertEqual(self._count('CH'), 3)
+        self.assertEqual(self._count('TI'), 3)
+
+    def test_editing_a_set_does_not_recount(self):
+        s = Set.objects.create(lift=self.lift, reps=8, weight=185)
+        s.weight = 195
+        s.save()
+        self.assertEqual(self._count('CH'), 1)
+
+    def test_delete_decrements(self):
+        s = Set.objects.create(lift=self.lift, reps=8, weight=185)
+        Set.objects.create(lift=self.lift, reps=8, weight=185)
+        s.delete()
+        self.assertEqual(self._count('CH'), 1)
+        self.workout.delete()
+        self.assertEqual(self._count('CH'), 0)
+
+    def test_moving_a_set_between_lifts(self):
+        fly = Movement.objects.create(user=self.user, name='Lateral Raise', bodypart='LS', category='D')
+        other = Lift.objects.create(movement=fly, workout=self.workout)
+        s = Set.objects.create(lift=self.lift, reps=8, weight=185)
+        s.lift = other
+        s.save()
+        self.assertEqual(self._count('CH'), 0)
+        self.assertEqual(self._count('LS'), 1)
+
+    def _rows(self):
+        return set(WeeklyVolume.objects.filter(set_count__gt=0)
+                   .values_list('start_date', 'muscle_group', 'set_count'))
+
+    def _assert_matches_rebuild(self):
+        live = self._rows()
+        WeeklyVolume.objects.rebuild()
+        self.assertEqual(live, self._rows())
+
+    def test_repointing_a_lift_moves_its_sets(self):
+        Set.objects.create(lift=self.lift, reps=8, weight=185)
+        Set.objects.create(lift=self.lift, reps=8, weight=185)
+        raise_ = Movement.objects.create(user=self.user, name='Lateral Raise', bodypart='LS', category='D')
+        self.lift.movement = raise_
+        self.lift.save()
+        self.assertEqual((self._count('CH'), self._count('TI'), self._count('LS')), (0, 0, 2))
+        self._assert_matches_rebuild()
+
+    def test_moving_a_workout_to_another_week(self):
+        Set.objects.create(lift=self.lift, reps=8, weight=185)
+        self.workout.day = Day.objects.create(user=self.user, date=date(2025, 1, 13))
+        self.workout.save()
+        self.assertEqual(self._count('CH'), 0)
+        self.assertEqual(self._count('CH', date(2025, 1, 12)), 1)
+        self.assertFalse(Day.objects.get(pk=self.day.pk).did_workout)
+        self._assert_matches_rebuild()
+
+    def test_editing_movement_bodyparts_moves_its_history(self):
+        Set.objects.create(lift=self.lift, reps=8, weight=185)
+        self.bench.bodypart, self.bench.secondary_bodypart = 'FS', None
+        self.bench.save()
+        self.assertEqual((self._count('CH'), self._count('TI'), self._count('FS')), (0, 0, 1))
+        self._assert_matches_rebuild()
+
+    def test_rebuild_command_matches_signals(self):
+        Set.objects.create(lift=self.lift, reps=8, weight=185)
+        Set.objects.create(lift=self.lift, reps=6, weight=205)
+        next_week = Day.objects.create(user=self.user, date=date(2025, 1, 12))
+        workout = Workout.objects.create(day=next_week, workout_type=self.push)
+        Set.objects.create(lift=Lift.objects.create(movement=self.bench, workout=workout), reps=5, weight=225)
+        expected = set(WeeklyVolume.objects.values_list('start_date', 'muscle_group', 'set_count'))
+
+        WeeklyVolume.objects.all().update(set_count=99)
+        call_command('rebuild_weekly_volume', stdout=StringIO())
+        rebuilt = set(WeeklyVolume.objects.values_list('start_date', 'muscle_group', 'set_count'))
+        self.assertEqual(rebuilt, expected)
+        self.assertEqual(self._count('CH', date(2025, 1, 12)), 1)
+
+
+# ==============================================================================
+# Movement library search — in-process typeahead index
+# ==============================================================================
+
+class MovementLibrarySearchTest(TestCase):
+    """The movement manager's ?q= search is served from workouts.search.library_index."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('searcher', password='testpass')
+        MovementLibrary.objects.create(name='Incline Bench Press', bodypart='CH', category='B')
+        MovementLibrary.objects.create(name='Bench Dip', bodypart='TI', category='H')
+        MovementLibrary.objects.create(name='Bench Press Pack Special', bodypart='CH',
+                                       category='B', is_premium=True)
+        self.client.login(username='searcher', password='testpass')
+
+    def names(self, **params):
+        response = self.client.get('/workouts/movements/available/', {'partial': 'list', **params})
+        return [mv.name for mv in response.context['movements']]
+
+    def test_prefix_search_skips_premium(self):
+        names = self.names(q='ben')
+        self.assertIn('Bench Dip', names)
+        self.assertIn('Incline Bench Press', names)
+        self.assertNotIn('Bench Press Pack Special', names)
+        self.assertEqual(self.names(q='inc ben'), ['Incline Bench Press'])
+
+    def test_filters_and_owned_movements_apply(self):
+        self.assertEqual(self.names(q='bench', bodypart='TI'), ['Bench Dip'])
+        dip = MovementLibrary.objects.get(name='Bench Dip')
+        Movement.objects.create(user=self.user, name=dip.name, bodypart=dip.bodypart,
+                                category=dip.category, base_movement=dip)
+        self.assertNotIn('Bench Dip', self.names(q='bench'))
+
+    def test_substring_matches_follow_prefix_matches(self):
+        self.assertEqual(self.names(q='dip'), ['Bench Dip'])
+        self.assertEqual(self.names(q='ench'), ['Bench Dip', 'Incline Bench Press'])
+        self.assertEqual(self.names(q='cline ben'), ['Incline Bench Press'])
+
+    def test_new_library_movement_is_searchable(self):
+        self.names(q='row')
+        MovementLibrary.objects.create(name='Barbell Row', bodypart='LT', category='B')
+        self.assertEqual(self.names(q='row'), ['Barbell Row'])
+
+
+# ==============================================================================
+# Lift summary columns — best set, e1RM, volume, reps kept by the Set signals
+# ==============================================================================
+
+class LiftSummaryTest(TestCase):
+    """Set saves/deletes refresh the Lift's summary columns; graphs read them directly."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('summary', password='testpass')
+        self.push = WorkoutType.objects.get(user=self.user, name='Push')
+        self.day = Day.objects.create(user=self.user, date=date(2025, 1, 8))
+        self.workout = Workout.objects.create(day=self.day, workout_type=self.push)
+        self.bench = Movement.objects.create(user=self.user, name='Bench Press', bodypart='CH', category='B')
+        self.lift = Lift.objects.create(movement=self.bench, workout=self.workout)
+
+    def _summary(self, lift=None):
+        lift = Lift.objects.get(pk=(lift or self.lift).pk)
+        return (lift.top_weight, lift.top_reps, lift.volume, lift.reps, lift.set_count)
+
+    def test_brzycki(self):
+        self.assertAlmostEqual(brzycki(225, 5), 225 / (1.0278 - 0.0278 * 5))
+        self.assertEqual(brzycki(0, 5), 0)
+        self.assertEqual(brzycki(100, 40), 100)
+
+    def test_best_set_is_heaviest_then_most_reps(self):
+        summary = summarize_sets([(8, 185), (5, 205), (6, 205)])
+        self.assertEqual((summary['top_weight'], summary['top_reps']), (205, 6))
+        self.assertEqual(summary['volume'], 8 * 185 + 11 * 205)
+        self.assertEqual((summary['reps'], summary['set_count']), (19, 3))
+        self.assertEqual(summarize_sets([])['e1rm'], 0)
+
+    def test_signals_keep_summary_in_step(self):
+        first = Set.objects.create(lift=self.lift, reps=8, weight=185)
+        Set.objects.create(lift=self.lift, reps=5, weight=205)
+        self.assertEqual(self._summary(), (205, 5, 8 * 185 + 5 * 205, 13, 2))
+        self.assertAlmostEqual(Lift.objects.get(pk=self.lift.pk).e1rm, brzycki(205, 5))
+
+        first.weight = 225
+        first.save()
+        self.assertEqual(self._summary(), (225, 8, 8 * 225 + 5 * 205, 13, 2))
+
+        first.delete()
+        self.assertEqual(self._summary(), (205, 5, 5 * 205, 5, 1))
+
+    def test_moving_a_set_updates_both_lifts(self):
+        other = Lift.objects.create(movement=self.bench, workout=self.workout)
+        s = Set.objects.create(lift=self.lift, reps=8, weight=185)
+        s.lift = other
+        s.save()
+        self.assertEqual(self._summary(), (0, 0, 0, 0, 0))
+        self.assertEqual(self._summary(other), (185, 8, 8 * 185, 8, 1))
+
+    def test_rebuild_summaries_matches_signals(self):
+        Set.objects.create(lift=self.lift, reps=8, weight=185)
+        Set.objects.create(lift=self.lift, reps=6, weight=205)
+        expected = self._summary()
+        Lift.objects.update(top_weight=0, top_reps=0, e1rm=0, volume=0, reps=0, set_count=0)
+        self.assertEqual(Lift.objects.rebuild_summaries(), 1)
+        self.assertEqual(self._summary(), expected)
+
+    def test_lift_graph_query_count_is_constant(self):
+        self.client.login(username='summary', password='testpass')
+        for n in range(10):
+            day = Day.objects.create(user=self.user, date=date(2025, 2, 1 + n))
+            lift = Lift.objects.create(movement=self.bench,
+                                       workout=Workout.objects.create(day=day, workout_type=self.push))
+            Set.objects.create(lift=lift, reps=5, weight=200 + n)
+        # session + user + the history query
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('graphs:lift_orm', args=['bench press']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.context['data'])), 10)
+
+
+# ==============================================================================
+# Movement stats — records, rep maxes, PRs and prefill from one row
+# ==============================================================================
+
+class MovementStatsTest(TestCase):
+    """Set signals keep MovementStats incremental on the latest lift and replay otherwise."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('stats', password='testpass')
+        self.push = WorkoutType.objects.get(user=self.user, name='Push')
+        self.bench = Movement.objects.create(user=self.user, name='Bench Press', bodypart='CH', category='B')
+
+    def _lift(self, day, *sets):
+        day = Day.objects.get_or_create(user=self.user, date=day)[0]
+        workout = Workout.objects.get_or_create(day=day, defaults={'workout_type': self.push})[0]
+        lift = Lift.objects.create(movement=self.bench, workout=workout)
+        for n, (reps, weight) in enumerate(sets):
+            Set.objects.create(lift=lift, order=n, reps=reps, weight=weight)
+        return lift
+
+    def _stats(self):
+        return MovementStats.objects.get(movement=self.bench)
+
+    def _replayed(self):
+        history = [
+            (lift.id, lift.workout.day.date, list(lift.sets.order_by('order', 'id').values_list('reps', 'weight')))
+            for lift in Lift.objects.filter(movement=self.bench, set_count__gt=0)
+            .order_by('workout__day__date', 'id')
+        ]
+        return replay_history(history)[0]
+
+    def test_first_lift_sets_records_without_prs(self):
+        lift = self._lift(date(2025, 1, 6), (5, 185), (3, 205))
+        stats = self._stats()
+        self.assertEqual(stats.rep_maxes[:6], [205, 205, 205, 185, 185, 0])
+        self.assertAlmostEqual(stats.best_e1rm, max(brzycki(185, 5), brzycki(205, 3)))
+        self.assertEqual((stats.last_lift_id, stats.last_sets), (lift.id, [[5, 185], [3, 205]]))
+        self.assertEqual((stats.lift_count, stats.pr_count), (1, 0))
+
+    def test_prs_are_counted_on_lift_workout_and_movement(self):
+        self._lift(date(2025, 1, 6), (5, 185))
+        lift = self._lift(date(2025, 1, 13), (5, 175), (5, 190), (5, 195))
+        self.assertEqual(Lift.objects.get(pk=lift.pk).personal_records, 2)
+        self.assertEqual(Workout.objects.get(pk=lift.workout_id).personal_records, 2)
+        self.assertEqual(self._stats().pr_count, 2)
+        self.assertEqual(self._stats().rep_maxes[4], 195)
+
+    def test_editing_the_latest_lift_is_incremental(self):
+        self._lift(date(2025, 1, 6), (5, 185))
+        lift = self._lift(date(2025, 1, 13), (5, 195))
+        top = lift.sets.get()
+        top.weight = 180
+        with mock.patch.object(MovementStats.objects, 'rebuild') as rebuild:
+            top.save()
+        rebuild.assert_not_called()
+        stats = self._stats()
+        self.assertEqual((stats.pr_count, stats.rep_maxes[4]), (0, 185))
+        self.assertEqual(stats.last_sets, [[5, 180]])
+        self.assertEqual(Workout.objects.get(pk=lift.workout_id).personal_records, 0)
+
+    def test_edits_to_older_lifts_and_deletes_replay_history(self):
+        first = self._lift(date(2025, 1, 6), (5, 185))
+        second = self._lift(date(2025, 1, 13), (5, 195))
+        self._lift(date(2025, 1, 20), (5, 200))
+        old = first.sets.get()
+        old.weight = 225
+        old.save()
+        self.assertEqual(self._stats().as_dict(), self._replayed())
+        self.assertEqual(self._stats().pr_count, 0)
+
+        Lift.objects.get(pk=first.pk).delete()
+        self.assertEqual(self._stats().as_dict(), self._replayed())
+        self.assertEqual(Lift.objects.get(pk=second.pk).personal_records, 0)
+        self.assertEqual(self._stats().pr_count, 1)
+
+    def test_repointing_a_lift_replays_both_movements(self):
+        self._lift(date(2025, 1, 6), (5, 185))
+        lift = Lift.objects.get(pk=self._lift(date(2025, 1, 13), (5, 225)).pk)
+        dips = Movement.objects.create(user=self.user, name='Dips', bodypart='CH', category='W')
+        lift.movement = dips
+        lift.save()
+        self.assertEqual(self._stats().as_dict(), self._replayed())
+        self.assertEqual((self._stats().pr_count, self._stats().rep_maxes[4]), (0, 185))
+        moved = MovementStats.objects.get(movement=dips)
+        self.assertEqual((moved.lift_count, moved.last_lift_id), (1, lift.id))
+
+    def test_moving_a_workout_replays_history(self):
+        first = self._lift(date(2025, 1, 6), (5, 185))
+        self._lift(date(2025, 1, 13), (5, 195))
+        workout = Workout.objects.get(pk=first.workout_id)
+        workout.day = Day.objects.create(user=self.user, date=date(2025, 1, 20))
+        workout.save()
+        self.assertEqual(self._stats().as_dict(), self._replayed())
+        self.assertEqual(self._stats().last_lift_id, first.id)
+
+    def test_movement_delete_removes_stats(self):
+        self._lift(date(2025, 1, 6), (5, 185))
+        self.bench.delete()
+        self.assertFalse(MovementStats.objects.exists())
+
+    def test_rebuild_all_matches_signals(self):
+        self._lift(date(2025, 1, 6), (5, 185), (8, 155))
+        self._lift(date(2025, 1, 13), (5, 195))
+        expected = self._stats().as_dict()
+        MovementStats.objects.all().delete()
+        self.assertEqual(MovementStats.objects.rebuild_all(), 1)
+        self.assertEqual(self._stats().as_dict(), expected)
+
+    def test_add_lift_prefills_from_stats(self):
+        self._lift(date(2025, 1, 6), (5, 185), (8, 155))
+        day = Day.objects.create(user=self.user, date=date(2025, 1, 13))
+        Workout.objects.create(day=day, workout_type=self.push, is_active=True)
+        self.client.login(username='stats', password='testpass')
+        response = self.client.get(reverse('workouts:add_lift', args=[self.bench.id]))
+        self.assertEqual(response.status_code, 200)
+        forms = response.context['pre_fill_forms']
+        self.assertEqual([f.initial for f in forms], [{'reps': 5, 'weight': 185}, {'reps': 8, 'weight': 155}])
@@ -21,21 +21,28 @@ from .models import (
     WeeklyVolume,
     Movement,
     MovementLibrary,
+    MovementStats,
     BODYPARTS,
-    LIFT_TYPES
+    LIFT_TYPES,
+    week_start,
 )
 from core.utils import get_or_create_day
+from .search import search_library
 from .forms import SetForm, MovementForm, WTypeForm
 #from copy import copy
 from datetime import datetime, timezone, timedelta
 from random import randint
-from django.db.models import Q, F, Sum
+from django.db.models import Q, F, Sum, Count, OuterRef, Subquery
+from core.middleware import query_budget
+from core.fragments import fragment_cache
 
 bodypart_map = dict(BODYPARTS)
 
 # --- C_R_UD : get_X
 
 @login_required
+@query_budget(5)
+@fragment_cache('workouts')
 def get_workouts(request: HttpRequest,
                  mode: str = 'history') -> HttpResponse:
     ''' workouts for a user (workout history) '''
@@ -47,7 +54,8 @@ def get_workouts(request: HttpRequest,
 
     else:
         workouts = Workout.objects.filter(day__user=request.user).annotate(
-            total_vol=Sum(F('lifts__sets__weight') * F('lifts__sets__reps'))
+            volume_total=Sum('lifts__volume'),
+            lift_total=Count('lifts'),
         ).select_related("day", "workout_type").order_by("-day__date")
         return render(request, 'workouts/workout_list.html', {"workouts": workouts, "active_workout": False})
 
@@ -58,6 +66,7 @@ def get_workout(request: HttpRequest, workout_id: int) -> HttpResponse:
     return render(request, 'workouts/workout_details.html', {"workout": workout})
 
 @login_required
+@query_budget(4)
 def get_movements(request: HttpRequest) -> HttpResponse:
     '''
     Returns a list of movements available to a user
@@ -83,7 +92,11 @@ def get_movements(request: HttpRequest) -> HttpResponse:
     elif url_name == 'movements_global':
         queryset = MovementLibrary.objects.filter(is_premium=False)
     else:
-        queryset = Movement.objects.filter(user=request.user, is_archived=False)
+        # card colour : workout type of the movement's first lift, one subquery
+        first_type = (Lift.objects.filter(movement=OuterRef('pk')).order_by('id')
+                      .values('workout__workout_type__color')[:1])
+        queryset = (Movement.objects.filter(user=request.user, is_archived=False)
+                    .annotate(type_color=Subquery(first_type)))
 
     filters = Q()
     # Workout type filter applies both in the dashboard "all movements" view
@@ -98,8 +111,10 @@ def get_movements(request: HttpRequest) -> HttpResponse:
     if category:
         filters &= Q(category=category)
     if search_q and url_name == 'movements_available':
-        filters &= Q(name__icontains=search_q)
-    mvments = queryset.filter(filters).distinct()
+        # answered from the in-process library index
+        mvments = search_library(search_q, user_has_ids, bodypart, category)
+    else:
+        mvments = queryset.filter(filters).distinct()
 
     if url_name == 'movements_global':
         mode = "select"
@@ -127,7 +142,17 @@ def get_movements(request: HttpRequest) -> HttpResponse:
 def get_movement(request: HttpRequest, movement_id: int) -> HttpResponse:
     ''' specific movement overview'''
     mvment = get_object_or_404(Movement, pk=movement_id, user=request.user)
-    return render(request, 'workouts/movement_details.html', {"movement": mvment})
+    lifts = list(
+        mvment.instances
+        .select_related('workout__day')
+        .prefetch_related('sets')
+        .order_by('-workout__day__date', '-id')
+    )
+    return render(request, 'workouts/movement_details.html', {
+        "movement": mvment,
+        "lifts": lifts,
+        "stats": MovementStats.objects.filter(movement=mvment).first(),
+    })
 
 @login_required
 def get_wtypes(request: HttpRequest) -> HttpResponse:
@@ -140,6 +165,7 @@ def get_wtypes(request: HttpRequest) -> HttpResponse:
     return render(request, "workouts/workout_types.html", context) 
 
 @login_required
+@query_budget(5)
 def get_weekly_sets(request: HttpRequest) -> HttpResponse:
     ''' sets performed per muscle group this week '''
     date = request.GET.get('selected_date')
@@ -150,18 +176,19 @@ def get_weekly_sets(request: HttpRequest) -> HttpResponse:
     except ValueError:
         return HttpResponse(status=400)
     print(f"{today=}")
-    this_sunday = today - timedelta(days=(today.weekday() + 1) % 7)
+    this_sunday = week_start(today)
     # Get the user's goal
     goal = request.user.profile.weekly_set_goal
     # Get volumes from our WeeklyVolume model
-    volumes = WeeklyVolume.objects.filter(user=request.user, start_date=this_sunday)
+    volumes = dict(WeeklyVolume.objects.filter(
+        user=request.user, start_date=this_sunday
+    ).values_list('muscle_group', 'set_count'))
     stats = []
     # Loop through your BODYPARTS constant to ensure all muscles show up
     # aggregate shoulder
     for code, name in BODYPARTS:
         # Find the count for this specific muscle
-        volume_entry = volumes.filter(muscle_group=code).first()
-        count = volume_entry.set_count if volume_entry else 0
+        count = volumes.get(code, 0)
         
         # Calculate percentage (capped at 100% for the bar height)
         percent = min((count / goal) * 100, 100) if goal > 0 else 0
@@ -230,8 +257,9 @@ def _manager_available_list_response(request: HttpRequest) -> HttpResponse:
     if category:
         filters &= Q(category=category)
     if search_q:
-        filters &= Q(name__icontains=search_q)
-    mvments = queryset.filter(filters).distinct()
+        mvments = search_library(search_q, user_has_ids, bodypart, category)
+    else:
+        mvments = queryset.filter(filters).distinct()
     archived_mvments = Movement.objects.filter(
         user=request.user, base_movement__isnull=False, is_archived=True
     )
@@ -336,13 +364,14 @@ def add_lift(request: HttpRequest, movement_id: int | None = None) -> HttpRespon
     previous_lifts = list(
         movement.instances
         .exclude(pk=lift.pk)
-        .select_related('workout__day', 'workout__workout_type')
-        .prefetch_related('sets')
-        .order_by('-workout__day__date')[:5]
+        .select_related('workout__day')
+        .order_by('-workout__day__date', '-id')[:5]
     )
-    first_previous = previous_lifts[0] if previous_lifts else None
-    first_sets = list(first_previous.sets.all()) if first_previous else []
-    pre_fill_forms = [SetForm(initial={'reps': s.reps, 'weight': s.weight}) for s in first_sets] if first_sets else None
+    # the latest lift's sets are kept on the movement's stats row
+    stats = MovementStats.objects.filter(movement=movement).first()
+    pre_fill_forms = [
+        SetForm(initial={'reps': reps, 'weight': weight}) for reps, weight in stats.last_sets
+    ] if stats and stats.last_sets else None
     form = SetForm()
     return render(request, 'workouts/active_lift.html', {
         "lift": lift,